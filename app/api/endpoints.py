@@ -4,15 +4,33 @@ Handles disease prediction, recommendations, and combined analysis.
 """
 
 import io
-from flask import Blueprint, request, jsonify
+import json
+import threading
+import time
+import zipfile
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from flask import Blueprint, request, jsonify, Response, stream_with_context
+from werkzeug.datastructures import FileStorage
 from werkzeug.utils import secure_filename
 from datetime import datetime
 import os
 import traceback
+import numpy as np
 
-from app.services.prediction import load_mobilenet_model, predict_disease
-from app.services.recommendation import generate_recommendation
-from app.services.enhancer import load_real_esrgan_model, check_image_quality, enhance_image
+from app.services.prediction import (
+    load_mobilenet_model, predict_disease, predict_images, InferenceBatcher, MAX_BATCH_SIZE, DISEASE_CLASSES
+)
+from app.services import metrics
+from app.services.metrics import stage
+from app.services.recommendation import generate_recommendation, stream_recommendation, is_error_recommendation
+from app.services.cache import PredictionCache
+from app.services.enhancer import (
+    load_real_esrgan_model, check_image_quality, check_resized_image_quality, enhance_image
+)
+from app.services.gradcam import GradCamBatcher, load_gradcam_engine, render_overlay
+from app.services.imaging import DecodedImage, BatchPreprocessor, InvalidImageError, THUMBNAIL_MAX_SIDE
+from app.services.worker_pool import INFERENCE_WORKERS, InferenceWorkerPool
 
 # Create blueprint for API routes
 api_bp = Blueprint('api', __name__, url_prefix='/api')
@@ -21,22 +39,192 @@ api_bp = Blueprint('api', __name__, url_prefix='/api')
 # Cache models to avoid reloading on every request
 _model_cache = {
     'prediction_model': None,
+    'prediction_batcher': None,
+    'gradcam_batcher': None,
     'enhancer_model': None
 }
+# One lock per model: concurrent first requests (or a request racing the
+# startup warm-up) wait for a single load instead of loading twice, while
+# the two models can still load in parallel
+_model_locks = {name: threading.Lock() for name in _model_cache}
+
+
+def _get_or_load(name, loader):
+    """Double-checked, per-model locked lazy load"""
+    model = _model_cache[name]
+    if model is None:
+        with _model_locks[name]:
+            model = _model_cache[name]
+            if model is None:
+                model = _model_cache[name] = loader()
+    return model
 
 
 def get_prediction_model():
-    """Get or load the prediction model (cached)"""
-    if _model_cache['prediction_model'] is None:
-        _model_cache['prediction_model'] = load_mobilenet_model()
-    return _model_cache['prediction_model']
+    """
+    Get or load the prediction model (cached). With INFERENCE_WORKERS set
+    this is an InferenceWorkerPool: the weights live in the worker processes
+    and this process never imports torch.
+    """
+    if INFERENCE_WORKERS > 0:
+        return _get_or_load('prediction_model', InferenceWorkerPool)
+    return _get_or_load('prediction_model', load_mobilenet_model)
+
+
+def get_prediction_batcher():
+    """Get or start the micro-batching scheduler for the prediction model (cached)"""
+    model = get_prediction_model()
+    if model is None:
+        return None
+    if isinstance(model, InferenceWorkerPool):
+        return model  # the pool batches in front of each worker
+    return _get_or_load('prediction_batcher', lambda: InferenceBatcher(model))
+
+
+def get_gradcam_batcher():
+    """
+    Get or start the Grad-CAM batcher (cached). Shares the prediction model
+    when it is eager PyTorch; otherwise loads an eager copy of the weights
+    on the first Grad-CAM request.
+    """
+    return _get_or_load('gradcam_batcher', lambda: GradCamBatcher(load_gradcam_engine(get_prediction_model())))
 
 
 def get_enhancer_model():
     """Get or load the enhancer model (cached)"""
-    if _model_cache['enhancer_model'] is None:
-        _model_cache['enhancer_model'] = load_real_esrgan_model()
-    return _model_cache['enhancer_model']
+    return _get_or_load('enhancer_model', load_real_esrgan_model)
+
+
+# ============ WARM-UP & READINESS ============
+# Loads both models at startup and runs dummy inferences so the first real
+# request does not pay for weight loading or first-call kernel setup.
+
+WARMUP_PARALLEL = os.getenv('WARMUP_PARALLEL', 'true').lower() == 'true'
+# Typical phone photo sizes; each is decoded, blur-checked and classified once
+WARMUP_RESOLUTIONS = [
+    tuple(int(side) for side in size.split('x'))
+    for size in os.getenv('WARMUP_RESOLUTIONS', '1280x960,4000x3000').split(',') if size
+]
+WARMUP_ENHANCER_SIZE = 64
+
+_warmup_state = {
+    'started': False,
+    'ready': False,
+    'phases': {},
+    'errors': {}
+}
+_warmup_lock = threading.Lock()
+
+
+def _run_phase(name, fn):
+    """Run one warm-up phase and record its duration (or error)"""
+    start = time.perf_counter()
+    try:
+        return fn()
+    except Exception as e:
+        _warmup_state['errors'][name] = str(e)
+        print(f"Warm-up: {name} failed: {e}")
+        return None
+    finally:
+        elapsed = round(time.perf_counter() - start, 3)
+        _warmup_state['phases'][name] = elapsed
+        print(f"Warm-up: {name} took {elapsed:.2f}s")
+
+
+def _synthetic_photo(width, height):
+    """Smooth random JPEG; compresses and decodes like a real photo"""
+    rng = np.random.default_rng(0)
+    small = rng.integers(0, 256, (max(1, height // 16), max(1, width // 16), 3), dtype=np.uint8)
+    photo = DecodedImage.from_pil(DecodedImage(small).to_pil().resize((width, height)))
+    return DecodedImage.from_bytes(photo.to_bytes('JPEG'))
+
+
+def _warm_prediction():
+    model = _run_phase('prediction_model_load', get_prediction_model)
+    if model is None:
+        return False
+    batcher = _run_phase('prediction_batcher_start', get_prediction_batcher)
+
+    def dummy_inferences():
+        for width, height in WARMUP_RESOLUTIONS:
+            image = _synthetic_photo(width, height)
+            check_image_quality(image)
+            predict_disease(model, image, batcher=batcher)
+        # Largest batch shape the batcher will send
+        images = [_synthetic_photo(224, 224).rgb] * MAX_BATCH_SIZE
+        predict_images(model, images)
+
+    _run_phase('prediction_warmup', dummy_inferences)
+    return True
+
+
+def _warm_enhancer():
+    enhancer = _run_phase('enhancer_model_load', get_enhancer_model)
+    if enhancer is None:
+        return False
+    rgb = np.zeros((WARMUP_ENHANCER_SIZE, WARMUP_ENHANCER_SIZE, 3), dtype=np.uint8)
+    _run_phase('enhancer_warmup', lambda: enhance_image(DecodedImage(rgb), enhancer, force_run=True))
+    return True
+
+
+def warm_up_models(parallel=WARMUP_PARALLEL):
+    """
+    Load and warm up the prediction and enhancer models, in parallel by
+    default. The app is ready once the prediction model is warm; a missing
+    enhancer only disables enhancement.
+    """
+    start = time.perf_counter()
+    if parallel:
+        with ThreadPoolExecutor(max_workers=2, thread_name_prefix='warmup') as pool:
+            prediction_future = pool.submit(_warm_prediction)
+            enhancer_future = pool.submit(_warm_enhancer)
+            prediction_ok, enhancer_ok = prediction_future.result(), enhancer_future.result()
+    else:
+        prediction_ok, enhancer_ok = _warm_prediction(), _warm_enhancer()
+
+    _warmup_state['phases']['total'] = round(time.perf_counter() - start, 3)
+    _warmup_state['enhancer_available'] = enhancer_ok
+    _warmup_state['ready'] = prediction_ok
+    status = "ready" if prediction_ok else "NOT ready (prediction model unavailable)"
+    print(f"Warm-up finished in {_warmup_state['phases']['total']:.2f}s: {status}")
+    return prediction_ok
+
+
+def start_model_warmup():
+    """Start warm_up_models in a background thread (at most once per process)"""
+    with _warmup_lock:
+        if _warmup_state['started']:
+            return
+        _warmup_state['started'] = True
+    threading.Thread(target=warm_up_models, name='model-warmup', daemon=True).start()
+
+
+# ============ RESULT CACHING ============
+# Repeat uploads of the same photo (e.g. retries on a flaky network) skip
+# decode, blur check, enhancement and inference
+_prediction_cache = PredictionCache()
+
+
+PREDICTION_CACHE_LOOKUPS = metrics.counter('prediction_cache_lookups_total', 'Prediction cache lookups.', ('result',))
+ENHANCEMENTS = metrics.counter(
+    'enhancements_total', 'Blurry uploads sent to the enhancer, by outcome.', ('outcome',)
+)
+PREDICTIONS = metrics.counter('predictions_total', 'Predictions served, by image quality.', ('image_quality',))
+INFERENCE_QUEUE_DEPTH = metrics.gauge('inference_queue_depth', 'Images waiting for a prediction batch.')
+
+
+def _inference_queue_depth():
+    """Queued images in the in-process batcher or the worker pool, whichever is running"""
+    batchers = (_model_cache['prediction_batcher'], _model_cache['prediction_model'])
+    return sum(batcher._queue.qsize() for batcher in batchers if hasattr(batcher, '_queue'))
+
+
+INFERENCE_QUEUE_DEPTH.set_function(_inference_queue_depth)
+
+
+def get_cache_key(model, image):
+    """Cache key for an upload: content hash of its bytes + model weights version"""
+    return PredictionCache.make_key(image.data, getattr(model, 'weights_version', 'unknown'))
 
 
 # ============ VALIDATION UTILITIES ============
@@ -77,6 +265,537 @@ def validate_image_file(file):
     return True, None
 
 
+# ============ CLIENT-SIDE RESIZING ============
+# The upload page downscales photos in the browser before sending them (the
+# classifier only reads 224x224). The target keeps 2x headroom over the
+# blur-check thumbnail, so the thumbnail score matches the original's.
+
+CLIENT_RESIZE_ENABLED = os.getenv('CLIENT_RESIZE_ENABLED', 'true').lower() == 'true'
+CLIENT_RESIZE_MAX_SIDE = int(os.getenv('CLIENT_RESIZE_MAX_SIDE', str(2 * THUMBNAIL_MAX_SIDE)))
+CLIENT_RESIZE_JPEG_QUALITY = float(os.getenv('CLIENT_RESIZE_JPEG_QUALITY', '0.9'))
+# Headroom around the thumbnail blur bounds for resampling / re-encoding drift
+CLIENT_RESIZE_BLUR_MARGIN = float(os.getenv('CLIENT_RESIZE_BLUR_MARGIN', '0.15'))
+
+
+def read_client_resize(form, image):
+    """
+    Original dimensions the browser reported for a downscaled upload
+    (original_width / original_height / original_size form fields), or
+    None when the upload is the original file.
+    """
+    original_width = form.get('original_width', type=int)
+    original_height = form.get('original_height', type=int)
+    if not original_width or not original_height:
+        return None
+    if max(original_width, original_height) <= max(image.width, image.height):
+        return None  # not actually downscaled
+    return {
+        'original_width': original_width,
+        'original_height': original_height,
+        'original_size': form.get('original_size', type=int),
+        'width': image.width,
+        'height': image.height,
+        'size': len(image.data)
+    }
+
+
+def resized_upload_blur_check(image):
+    """
+    Blur decision for a browser-downscaled upload.
+    Returns: (is_blurry, None), or (None, 409 response) when only the
+    full-resolution check could decide and the client must send the
+    original. Original uploads return (None, None); the pipeline runs
+    check_image_quality on them as before.
+    """
+    if read_client_resize(request.form, image) is None:
+        return None, None
+    is_blurry = check_resized_image_quality(image, CLIENT_RESIZE_BLUR_MARGIN)
+    if is_blurry is None:
+        return None, (jsonify({
+            'success': False,
+            'code': 'full_resolution_required',
+            'error': 'This photo needs the original file for the blur check. Please upload it unresized.'
+        }), 409)
+    return is_blurry, None
+
+
+INVALID_IMAGE_ERROR = "File must be a valid JPG or PNG image"
+
+
+def decode_uploaded_image(file):
+    """
+    Decode an uploaded image once for the whole request. Only the header is
+    checked here; damaged pixel data raises InvalidImageError when a stage
+    first reads it, which the views turn into the same 400.
+    Returns: (image: DecodedImage or None, error_message: str or None)
+    """
+    try:
+        with stage('decode'):
+            return DecodedImage.from_bytes(file.read()), None
+    except Exception:
+        return None, INVALID_IMAGE_ERROR
+
+
+# ============ PREDICTION PIPELINE ============
+
+def run_prediction_pipeline(model, image, cache_key=None, is_blurry=None):
+    """
+    Blur-check the image, enhance it if blurry, and predict on the best
+    available version. The blur check runs first so it can use the cheap
+    thumbnail decode, and blurry uploads are only classified once.
+    With a cache_key, a cached result is returned without running any model.
+    `is_blurry` skips the blur check with a decision already made
+    (see resized_upload_blur_check).
+    Returns: (prediction_result: dict, image_quality: str)
+    """
+    if cache_key is not None:
+        cached = _prediction_cache.get(cache_key)
+        PREDICTION_CACHE_LOOKUPS.inc(result='miss' if cached is None else 'hit')
+        if cached is not None:
+            PREDICTIONS.inc(image_quality=cached['image_quality'])
+            return cached['prediction'], cached['image_quality']
+
+    image_quality = 'good'
+    prediction_image = image
+
+    # Check image quality (blur detection)
+    if is_blurry is None:
+        with stage('blur_check'):
+            is_blurry = check_image_quality(image)
+    if is_blurry:
+        image_quality = 'blurry'
+        # Try to enhance
+        enhancer = get_enhancer_model()
+        if enhancer is None:
+            ENHANCEMENTS.inc(outcome='unavailable')
+        else:
+            try:
+                with stage('enhance'):
+                    enhanced = enhance_image(image, enhancer, force_run=True)
+                if enhanced is not image:  # Successfully enhanced
+                    prediction_image = enhanced
+                    image_quality = 'enhanced'
+                ENHANCEMENTS.inc(outcome='enhanced' if enhanced is not image else 'unchanged')
+            except Exception as e:
+                ENHANCEMENTS.inc(outcome='failed')
+                print(f"Enhancement failed: {e}")
+                # Continue with the original image
+
+    result = predict_disease(model, prediction_image, batcher=get_prediction_batcher())
+    if cache_key is not None:
+        _prediction_cache.put(cache_key, result, image_quality)
+    PREDICTIONS.inc(image_quality=image_quality)
+    return result, image_quality
+
+
+def get_recommendation(cache_key, disease_name, severity_level, language_code):
+    """Recommendation for a cached upload, generated at most once per language"""
+    cached_text = _prediction_cache.get_recommendation(cache_key, language_code)
+    if cached_text is not None:
+        return cached_text
+
+    text = generate_recommendation(disease_name, severity_level, language_code)
+    if not is_error_recommendation(text):
+        _prediction_cache.add_recommendation(cache_key, language_code, text)
+    return text
+
+
+# ============ GRAD-CAM ============
+# Heatmaps cost a backward pass, so they are only computed when the client
+# asks for one, and cached with the prediction
+
+def wants_gradcam():
+    """Grad-CAM is requested with ?gradcam=1 or a gradcam form field"""
+    flag = request.args.get('gradcam') or request.form.get('gradcam') or ''
+    return flag.lower() in ('1', 'true', 'yes')
+
+
+def submit_gradcam(image, prediction_result):
+    """Queue the heatmap for the predicted class; returns a Future of the (7, 7) heatmap"""
+    class_index = DISEASE_CLASSES.index(prediction_result['disease_name'])
+    return get_gradcam_batcher().submit(image, class_index)
+
+
+def finish_gradcam(cache_key, image, heatmap_future):
+    """
+    Wait for a submitted heatmap and render it as a base64 JPEG overlay,
+    cached with the prediction. Returns None if it could not be generated.
+    """
+    try:
+        overlay = render_overlay(image, heatmap_future.result())
+    except Exception as e:
+        print(f"Grad-CAM failed: {e}")
+        return None
+    _prediction_cache.add_gradcam(cache_key, overlay)
+    return overlay
+
+
+def get_gradcam(cache_key, image, prediction_result):
+    """
+    Base64 JPEG Grad-CAM overlay for the predicted class, computed at most
+    once per cached upload. Returns None if it could not be generated; the
+    prediction itself is still returned.
+    """
+    overlay = _prediction_cache.get_gradcam(cache_key)
+    if overlay is not None:
+        return overlay
+
+    with stage('gradcam'):
+        try:
+            heatmap_future = submit_gradcam(image, prediction_result)
+        except Exception as e:
+            print(f"Grad-CAM failed: {e}")
+            return None
+        return finish_gradcam(cache_key, image, heatmap_future)
+
+
+# ============ STREAMING RESPONSES ============
+
+def wants_stream():
+    """Streaming is requested with ?stream=1, a stream form field, or Accept: application/x-ndjson"""
+    flag = request.args.get('stream') or request.form.get('stream') or ''
+    return flag.lower() in ('1', 'true', 'yes') or \
+        'application/x-ndjson' in request.headers.get('Accept', '')
+
+
+def ndjson_line(payload):
+    return json.dumps(payload, ensure_ascii=False) + '\n'
+
+
+def format_prediction_block(prediction_result, image_quality, gradcam_image=None):
+    """Prediction part of the combined response"""
+    return {
+        'disease_name': prediction_result['disease_name'],
+        'confidence': prediction_result['confidence'],
+        'severity_level': prediction_result['severity_level'],
+        'gradcam_image': gradcam_image,
+        'image_quality': image_quality,
+        'message': f"Disease detected. Severity level {prediction_result['severity_level']}/5."
+    }
+
+
+def stream_prediction_and_recommendation(cache_key, prediction_result, image_quality, language_code,
+                                         gradcam_source=None):
+    """
+    NDJSON event stream for /predict-and-recommend?stream=1:
+      {"type": "prediction", ...}            as soon as the diagnosis is ready
+      {"type": "recommendation_token", ...}  one per chunk from the LLM
+      {"type": "gradcam", ...}               heatmap, only when `gradcam_source`
+                                             (the uploaded DecodedImage) is given;
+                                             computed alongside the recommendation
+                                             and sent between tokens once ready
+      {"type": "recommendation", ...}        final, complete recommendation
+      {"type": "error", ...}                 if anything fails mid-stream
+    """
+    disease_name = prediction_result['disease_name']
+    severity_level = prediction_result['severity_level']
+    try:
+        yield ndjson_line({
+            'type': 'prediction',
+            'success': True,
+            'prediction': format_prediction_block(prediction_result, image_quality)
+        })
+
+        # The heatmap's backward pass runs on the Grad-CAM batcher while the
+        # LLM answers, so it never delays the first recommendation token
+        heatmap_future = None
+        if gradcam_source is not None:
+            overlay = _prediction_cache.get_gradcam(cache_key)
+            if overlay is None:
+                try:
+                    heatmap_future = submit_gradcam(gradcam_source, prediction_result)
+                except Exception as e:
+                    print(f"Grad-CAM failed: {e}")
+            if heatmap_future is None:
+                yield ndjson_line({'type': 'gradcam', 'gradcam_image': overlay})
+
+        def gradcam_event():
+            return ndjson_line({
+                'type': 'gradcam',
+                'gradcam_image': finish_gradcam(cache_key, gradcam_source, heatmap_future)
+            })
+
+        cached_text = _prediction_cache.get_recommendation(cache_key, language_code)
+        chunks = [cached_text] if cached_text is not None else \
+            stream_recommendation(disease_name, severity_level, language_code)
+
+        parts = []
+        for chunk in chunks:
+            parts.append(chunk)
+            yield ndjson_line({'type': 'recommendation_token', 'token': chunk})
+            if heatmap_future is not None and heatmap_future.done():
+                yield gradcam_event()
+                heatmap_future = None
+
+        if heatmap_future is not None:
+            yield gradcam_event()
+
+        recommendation_text = ''.join(parts).strip()
+        if cached_text is None and not any(is_error_recommendation(part) for part in parts):
+            _prediction_cache.add_recommendation(cache_key, language_code, recommendation_text)
+
+        yield ndjson_line({
+            'type': 'recommendation',
+            'success': True,
+            'recommendation': {
+                'disease_name': disease_name,
+                'severity_level': severity_level,
+                'language_code': language_code,
+                'recommendation': recommendation_text,
+                'timestamp': datetime.utcnow().isoformat() + 'Z'
+            }
+        })
+    except Exception as e:
+        print(f"Streaming recommendation error: {str(e)}")
+        print(traceback.format_exc())
+        yield ndjson_line({
+            'type': 'error',
+            'success': False,
+            'error': 'Recommendation generation failed'
+        })
+
+
+# ============ BATCH SCANNING ============
+# Field surveys upload hundreds of photos at once. Images are read one at a
+# time (multipart parts are spooled to disk by Werkzeug, zip members are
+# read lazily), only the 224x224 model input is kept per image, and
+# inference runs in fixed-size chunks, so pixel memory stays flat however
+# many files arrive.
+
+BATCH_MAX_UPLOAD_BYTES = int(os.getenv('BATCH_MAX_UPLOAD_BYTES', str(1024 * 1024 * 1024)))  # 1GB
+BATCH_MAX_FILES = int(os.getenv('BATCH_MAX_FILES', '2000'))
+BATCH_CHUNK_SIZE = int(os.getenv('BATCH_CHUNK_SIZE', '16'))
+ZIP_MIME_TYPES = {'application/zip', 'application/x-zip-compressed'}
+
+
+def is_zip_upload(file):
+    """Check if an uploaded file is a zip archive"""
+    return file.filename.lower().endswith('.zip') or file.content_type in ZIP_MIME_TYPES
+
+
+def iter_zip_images(file):
+    """
+    Yield (filename, image_bytes or None, error_message or None) for each
+    image in a zip archive, reading one member at a time
+    """
+    try:
+        archive = zipfile.ZipFile(file.stream)
+    except zipfile.BadZipFile:
+        yield file.filename, None, "Not a valid zip archive"
+        return
+
+    with archive:
+        for info in archive.infolist():
+            name = info.filename
+            # Skip folders and macOS/hidden metadata files
+            if info.is_dir() or name.startswith('__MACOSX/') or os.path.basename(name).startswith('.'):
+                continue
+            if not allowed_file(name):
+                yield name, None, "File must be JPG or PNG format"
+                continue
+            if info.file_size > MAX_FILE_SIZE:
+                yield name, None, "File size must be under 10MB"
+                continue
+            try:
+                with archive.open(info) as member:
+                    # The declared size can lie; never read past the limit
+                    data = member.read(MAX_FILE_SIZE + 1)
+            except (RuntimeError, zipfile.BadZipFile, OSError, EOFError):
+                yield name, None, "Could not extract file from archive"
+                continue
+            if len(data) > MAX_FILE_SIZE:
+                yield name, None, "File size must be under 10MB"
+            else:
+                yield name, data, None
+
+
+def iter_batch_uploads(files):
+    """
+    Yield (filename, image_bytes or None, error_message or None) for every
+    image in the request: plain multipart images and members of zip archives
+    """
+    for file in files:
+        if is_zip_upload(file):
+            yield from iter_zip_images(file)
+            continue
+        is_valid, error_msg = validate_image_file(file)
+        yield file.filename, (file.read() if is_valid else None), error_msg
+
+
+def prepare_batch_item(model, filename, data):
+    """
+    Decode one upload down to what batched inference needs. The full
+    resolution pixels are released when the DecodedImage goes out of scope;
+    only the (224, 224, 3) model input is kept.
+    """
+    try:
+        image = DecodedImage.from_bytes(data)
+    except Exception:
+        return {'filename': filename, 'success': False, 'error': INVALID_IMAGE_ERROR}
+
+    cache_key = get_cache_key(model, image)
+    cached = _prediction_cache.get(cache_key)
+    if cached is not None:
+        return {'filename': filename, 'cached': cached}
+
+    # Blurry photos are flagged, not enhanced: Real-ESRGAN takes seconds per
+    # image, which does not scale to a whole survey
+    try:
+        image_quality = 'blurry' if check_image_quality(image) else 'good'
+        resized = image.resized
+    except InvalidImageError:
+        return {'filename': filename, 'success': False, 'error': INVALID_IMAGE_ERROR}
+    return {
+        'filename': filename,
+        'cache_key': cache_key,
+        'image_quality': image_quality,
+        'resized': resized
+    }
+
+
+def format_batch_result(filename, prediction_result, image_quality, cached):
+    """Per-image entry of the batch response"""
+    return {
+        'filename': filename,
+        'success': True,
+        'disease_name': prediction_result['disease_name'],
+        'confidence': prediction_result['confidence'],
+        'severity_level': prediction_result['severity_level'],
+        'image_quality': image_quality,
+        'cached': cached
+    }
+
+
+def run_batch_pipeline(model, uploads, chunk_size=BATCH_CHUNK_SIZE):
+    """
+    Yield one result per upload, in upload order. Images are predicted
+    `chunk_size` at a time in a single forward pass each.
+    """
+    preprocessor = BatchPreprocessor(chunk_size)
+    pending = []
+
+    def flush():
+        to_predict = [item for item in pending if 'resized' in item]
+        if to_predict:
+            results = predict_images(model, [item['resized'] for item in to_predict], preprocessor)
+            for item, result in zip(to_predict, results):
+                item['prediction'] = result
+                # Blurry images would be enhanced by /predict, so only clean
+                # results are shared with the single-image cache
+                if item['image_quality'] == 'good':
+                    _prediction_cache.put(item['cache_key'], result, item['image_quality'])
+
+        for item in pending:
+            if 'error' in item:
+                yield item
+            elif 'cached' in item:
+                cached = item['cached']
+                yield format_batch_result(item['filename'], cached['prediction'], cached['image_quality'], True)
+            else:
+                yield format_batch_result(item['filename'], item['prediction'], item['image_quality'], False)
+        pending.clear()
+
+    for filename, data, error_msg in uploads:
+        if error_msg is not None:
+            pending.append({'filename': filename, 'success': False, 'error': error_msg})
+        else:
+            pending.append(prepare_batch_item(model, filename, data))
+        if len(pending) >= chunk_size:
+            yield from flush()
+    yield from flush()
+
+
+class BatchSummary:
+    """Running per-disease aggregate of batch results"""
+
+    def __init__(self):
+        self.total = 0
+        self.failed = 0
+        self.cached = 0
+        self.truncated = False
+        self.image_quality = Counter()
+        self.disease_counts = Counter()
+        self.confidence_sums = Counter()
+
+    def add(self, result):
+        self.total += 1
+        if not result['success']:
+            self.failed += 1
+            return
+        self.cached += result['cached']
+        self.image_quality[result['image_quality']] += 1
+        self.disease_counts[result['disease_name']] += 1
+        self.confidence_sums[result['disease_name']] += result['confidence']
+
+    def to_dict(self):
+        succeeded = self.total - self.failed
+        diseases = [
+            {
+                'disease_name': name,
+                'count': count,
+                'percentage': round(count / succeeded * 100, 2),
+                'mean_confidence': round(self.confidence_sums[name] / count, 2)
+            }
+            for name, count in self.disease_counts.most_common()
+        ]
+        return {
+            'total': self.total,
+            'succeeded': succeeded,
+            'failed': self.failed,
+            'cached': self.cached,
+            'truncated': self.truncated,
+            'healthy': sum(count for name, count in self.disease_counts.items() if 'healthy' in name.lower()),
+            'image_quality': dict(self.image_quality),
+            'diseases': diseases
+        }
+
+
+def iter_batch_results(model, files, summary):
+    """Batch pipeline over the request's files, capped at BATCH_MAX_FILES images"""
+    uploads = iter_batch_uploads(files)
+    for index, result in enumerate(run_batch_pipeline(model, uploads)):
+        if index >= BATCH_MAX_FILES:
+            summary.truncated = True
+            break
+        summary.add(result)
+        yield result
+
+
+def detach_uploads(files):
+    """
+    Take ownership of uploaded files for a streamed response. Flask closes
+    request.files when the view returns, before the body is sent, so each
+    upload moves to a new FileStorage and the request keeps only an empty
+    placeholder to close. The caller must close the returned files.
+    """
+    detached = []
+    for file in files:
+        detached.append(FileStorage(file.stream, file.filename, file.name, headers=file.headers))
+        file.stream = io.BytesIO()
+    return detached
+
+
+def stream_batch_results(model, files):
+    """
+    NDJSON event stream for /predict/batch?stream=1:
+      {"type": "result", ...}   one per image, as each chunk finishes
+      {"type": "summary", ...}  per-disease aggregate, last
+      {"type": "error", ...}    if the batch fails mid-stream
+    """
+    summary = BatchSummary()
+    try:
+        for result in iter_batch_results(model, files, summary):
+            yield ndjson_line({'type': 'result', **result})
+        yield ndjson_line({'type': 'summary', 'success': True, 'summary': summary.to_dict()})
+    except Exception as e:
+        print(f"Batch prediction error: {str(e)}")
+        print(traceback.format_exc())
+        yield ndjson_line({'type': 'error', 'success': False, 'error': 'Batch prediction failed'})
+    finally:
+        for file in files:
+            file.close()
+
+
 # ============ API ROUTES ============
 
 @api_bp.route('/predict', methods=['POST'])
@@ -84,10 +803,15 @@ def predict():
     """
     Disease Prediction Endpoint
 
-    Request: multipart/form-data with image file
+    Request: multipart/form-data with image file; gradcam=1 (query or form)
+             adds the Grad-CAM heatmap
     Response: disease_name, confidence, severity_level, gradcam_image, image_quality
     """
     try:
+        # Parsing the multipart body is the upload stage
+        with stage('upload'):
+            request.files
+
         # Validate request has file
         if 'image' not in request.files:
             return jsonify({
@@ -105,8 +829,13 @@ def predict():
                 'error': error_msg
             }), 400
 
-        # Read image bytes
-        image_bytes = file.read()
+        # Decode image once; every stage below reuses it
+        image, error_msg = decode_uploaded_image(file)
+        if image is None:
+            return jsonify({
+                'success': False,
+                'error': error_msg
+            }), 400
 
         # Load prediction model
         model = get_prediction_model()
@@ -116,36 +845,32 @@ def predict():
                 'error': 'Model loading failed. Please try again.'
             }), 500
 
-        # Get initial prediction
-        result = predict_disease(model, image_bytes)
+        # Browser-downscaled uploads are blur-checked on their thumbnail
+        is_blurry, error_response = resized_upload_blur_check(image)
+        if error_response is not None:
+            return error_response
 
-        # Check image quality (blur detection)
-        image_quality = 'good'
-        if check_image_quality(image_bytes):
-            image_quality = 'blurry'
-            # Try to enhance
-            enhancer = get_enhancer_model()
-            if enhancer is not None:
-                try:
-                    enhanced_bytes = enhance_image(image_bytes, enhancer)
-                    if enhanced_bytes != image_bytes:  # Successfully enhanced
-                        # Re-predict on enhanced image
-                        result = predict_disease(model, enhanced_bytes)
-                        image_quality = 'enhanced'
-                except Exception as e:
-                    print(f"Enhancement failed: {e}")
-                    # Continue with original prediction
+        # Blur check, optional enhancement, then prediction (cached by image hash)
+        cache_key = get_cache_key(model, image)
+        result, image_quality = run_prediction_pipeline(model, image, cache_key, is_blurry)
+        gradcam_image = get_gradcam(cache_key, image, result) if wants_gradcam() else None
 
         return jsonify({
             'success': True,
             'disease_name': result['disease_name'],
             'confidence': result['confidence'],
             'severity_level': result['severity_level'],
-            'gradcam_image': result['gradcam_image'],
+            'gradcam_image': gradcam_image,
             'image_quality': image_quality,
             'message': f"Disease detected. Severity level {result['severity_level']}/5."
         }), 200
 
+    except InvalidImageError:
+        return jsonify({
+            'success': False,
+            'error': INVALID_IMAGE_ERROR
+        }), 400
+
     except Exception as e:
         print(f"Prediction error: {str(e)}")
         print(traceback.format_exc())
@@ -225,10 +950,19 @@ def predict_and_recommend():
 
     Runs prediction on the image, then generates a recommendation based on results.
 
-    Request: multipart/form-data with image file and optional language_code
+    Request: multipart/form-data with image file and optional language_code;
+             gradcam=1 (query or form) adds the Grad-CAM heatmap
     Response: Combined prediction + recommendation results
+
+    With ?stream=1 (or Accept: application/x-ndjson) the response is an
+    NDJSON stream: the prediction is sent as soon as it is ready, followed
+    by the recommendation text as the LLM generates it.
     """
     try:
+        # Parsing the multipart body is the upload stage
+        with stage('upload'):
+            request.files
+
         # Validate request has file
         if 'image' not in request.files:
             return jsonify({
@@ -249,8 +983,13 @@ def predict_and_recommend():
         # Get language code from form
         language_code = request.form.get('language_code', 'en')
 
-        # Read image bytes
-        image_bytes = file.read()
+        # Decode image once; every stage below reuses it
+        image, error_msg = decode_uploaded_image(file)
+        if image is None:
+            return jsonify({
+                'success': False,
+                'error': error_msg
+            }), 400
 
         # Load prediction model
         model = get_prediction_model()
@@ -260,28 +999,28 @@ def predict_and_recommend():
                 'error': 'Model loading failed. Please try again.'
             }), 500
 
-        # Get initial prediction
-        prediction_result = predict_disease(model, image_bytes)
+        # Browser-downscaled uploads are blur-checked on their thumbnail
+        is_blurry, error_response = resized_upload_blur_check(image)
+        if error_response is not None:
+            return error_response
 
-        # Check image quality (blur detection)
-        image_quality = 'good'
-        if check_image_quality(image_bytes):
-            image_quality = 'blurry'
-            # Try to enhance
-            enhancer = get_enhancer_model()
-            if enhancer is not None:
-                try:
-                    enhanced_bytes = enhance_image(image_bytes, enhancer)
-                    if enhanced_bytes != image_bytes:  # Successfully enhanced
-                        # Re-predict on enhanced image
-                        prediction_result = predict_disease(model, enhanced_bytes)
-                        image_quality = 'enhanced'
-                except Exception as e:
-                    print(f"Enhancement failed: {e}")
-                    # Continue with original prediction
+        # Blur check, optional enhancement, then prediction (cached by image hash)
+        cache_key = get_cache_key(model, image)
+        prediction_result, image_quality = run_prediction_pipeline(model, image, cache_key, is_blurry)
+
+        if wants_stream():
+            return Response(
+                stream_with_context(stream_prediction_and_recommendation(
+                    cache_key, prediction_result, image_quality, language_code,
+                    gradcam_source=image if wants_gradcam() else None
+                )),
+                mimetype='application/x-ndjson',
+                headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+            )
 
         # Generate recommendation based on prediction
-        recommendation_text = generate_recommendation(
+        recommendation_text = get_recommendation(
+            cache_key,
             prediction_result['disease_name'],
             prediction_result['severity_level'],
             language_code
@@ -289,14 +1028,10 @@ def predict_and_recommend():
 
         return jsonify({
             'success': True,
-            'prediction': {
-                'disease_name': prediction_result['disease_name'],
-                'confidence': prediction_result['confidence'],
-                'severity_level': prediction_result['severity_level'],
-                'gradcam_image': prediction_result['gradcam_image'],
-                'image_quality': image_quality,
-                'message': f"Disease detected. Severity level {prediction_result['severity_level']}/5."
-            },
+            'prediction': format_prediction_block(
+                prediction_result, image_quality,
+                get_gradcam(cache_key, image, prediction_result) if wants_gradcam() else None
+            ),
             'recommendation': {
                 'disease_name': prediction_result['disease_name'],
                 'severity_level': prediction_result['severity_level'],
@@ -306,6 +1041,12 @@ def predict_and_recommend():
             }
         }), 200
 
+    except InvalidImageError:
+        return jsonify({
+            'success': False,
+            'error': INVALID_IMAGE_ERROR
+        }), 400
+
     except Exception as e:
         print(f"Combined prediction-recommendation error: {str(e)}")
         print(traceback.format_exc())
@@ -315,6 +1056,120 @@ def predict_and_recommend():
         }), 500
 
 
+@api_bp.route('/predict/batch', methods=['POST'])
+def batch_predict():
+    """
+    Bulk Disease Prediction Endpoint
+
+    Request: multipart/form-data with any number of `images` files and/or
+             zip archives of JPG/PNG images (as `images` or `archive`)
+    Response: per-image results plus a per-disease summary
+
+    With ?stream=1 (or Accept: application/x-ndjson) results are streamed
+    as NDJSON while the batch is processed, followed by the summary.
+    """
+    try:
+        # Surveys are far larger than a single upload; raise the limits for
+        # this request only, before the form is parsed
+        request.max_content_length = BATCH_MAX_UPLOAD_BYTES
+        request.max_form_parts = BATCH_MAX_FILES + 16
+
+        files = request.files.getlist('images') + request.files.getlist('archive')
+        if not files:
+            return jsonify({
+                'success': False,
+                'error': 'No image files provided'
+            }), 400
+
+        # Load prediction model
+        model = get_prediction_model()
+        if model is None:
+            return jsonify({
+                'success': False,
+                'error': 'Model loading failed. Please try again.'
+            }), 500
+
+        if wants_stream():
+            return Response(
+                stream_with_context(stream_batch_results(model, detach_uploads(files))),
+                mimetype='application/x-ndjson',
+                headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+            )
+
+        summary = BatchSummary()
+        results = list(iter_batch_results(model, files, summary))
+
+        return jsonify({
+            'success': True,
+            'results': results,
+            'summary': summary.to_dict()
+        }), 200
+
+    except Exception as e:
+        print(f"Batch prediction error: {str(e)}")
+        print(traceback.format_exc())
+        return jsonify({
+            'success': False,
+            'error': 'Batch prediction failed. Please try again.'
+        }), 500
+
+
+@api_bp.route('/health/ready', methods=['GET'])
+def health_ready():
+    """
+    Readiness Endpoint
+
+    Response: 200 once the models are loaded and warmed up, 503 before that.
+    Includes per-phase warm-up timings. Starts the warm-up if nothing has
+    (e.g. under a WSGI server with the startup warm-up disabled).
+    """
+    start_model_warmup()
+    body = {
+        'ready': _warmup_state['ready'],
+        'phases': dict(_warmup_state['phases']),
+        'errors': dict(_warmup_state['errors']),
+        'enhancer_available': _warmup_state.get('enhancer_available')
+    }
+    return jsonify(body), 200 if body['ready'] else 503
+
+
+@api_bp.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    """
+    Prediction Cache Statistics Endpoint
+
+    Response: hit/miss/eviction counters and current size of the prediction cache
+    """
+    return jsonify({
+        'success': True,
+        'prediction_cache': _prediction_cache.stats()
+    }), 200
+
+
+@api_bp.route('/config', methods=['GET'])
+def client_config():
+    """
+    Client Configuration Endpoint
+
+    Response: upload limits and the target the browser downscales photos
+    to before uploading (longest side in pixels, JPEG quality 0-1)
+    """
+    response = jsonify({
+        'success': True,
+        'upload': {
+            'max_file_size': MAX_FILE_SIZE,
+            'allowed_mime_types': sorted(ALLOWED_MIME_TYPES),
+            'resize': {
+                'enabled': CLIENT_RESIZE_ENABLED,
+                'max_side': CLIENT_RESIZE_MAX_SIDE,
+                'jpeg_quality': CLIENT_RESIZE_JPEG_QUALITY
+            }
+        }
+    })
+    response.headers['Cache-Control'] = 'public, max-age=300'
+    return response, 200
+
+
 # ============ BLUEPRINT REGISTRATION ============
 # This blueprint will be imported and registered in main.py
 # The routes will be prefixed with /api automatically
@@ -5,10 +5,15 @@ Main entry point for the crop disease detection web application.
 
 import os
 from pathlib import Path
-from flask import Flask, render_template_string, send_from_directory, jsonify
+from flask import Flask, Response, request, send_file, send_from_directory, jsonify
 from flask_cors import CORS
 from dotenv import load_dotenv
 
+from app.services import metrics
+from app.services.assets import AssetPipeline
+from app.services.pages import PageRenderer
+from app.services.profiling import RequestProfiler
+
 # Load environment variables
 load_dotenv()
 
@@ -31,8 +36,36 @@ app.config['DEBUG'] = os.getenv('DEBUG', 'True').lower() == 'true'
 # Enable CORS for API endpoints
 CORS(app)
 
+# Opt-in request profiles (PROFILE_TOKEN / PROFILE_SAMPLE_RATE). Registered
+# before the metrics hooks so its after_request runs last and sees the
+# Server-Timing header
+profiler = RequestProfiler()
+profiler.init_app(app)
+
+# Per-request latency / status metrics and the Server-Timing header
+metrics.init_app(app)
+
+
+# ============ FINGERPRINTED ASSETS ============
+# Content-hashed, precompressed copies of the files below, cached by
+# browsers for a year; templates link them with asset_url() / image_url().
+# Built by `python -m app.services.assets build`; only the debug server
+# rebuilds them itself
+assets = AssetPipeline(APP_ROOT / 'frontend')
+assets.load(app.config['DEBUG'])
+app.jinja_env.globals['asset_url'] = assets.url
+app.jinja_env.globals['image_url'] = assets.image_url
+app.jinja_env.globals['image_srcset'] = assets.image_srcset
+
+
+@app.route('/assets/<path:filename>')
+def serve_asset(filename):
+    """Serve a fingerprinted asset (or the asset manifest)"""
+    return assets.response(filename)
+
 
 # ============ STATIC FILE SERVING ROUTES ============
+# Unversioned URLs, kept for old cached pages and external links
 
 @app.route('/static/style.css')
 def serve_main_css():
@@ -60,8 +93,11 @@ def serve_script_js():
 
 @app.route('/static/sw.js')
 def serve_sw_js():
-    """Serve service worker"""
-    return send_from_directory(str(APP_ROOT / 'frontend/scripts'), 'sw.js')
+    """Serve service worker (stable URL, allowed to control the whole site)"""
+    response = send_from_directory(str(APP_ROOT / 'frontend/scripts'), 'sw.js', max_age=0)
+    response.headers['Service-Worker-Allowed'] = '/'
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
 
 
 @app.route('/static/images/<filename>')
@@ -76,12 +112,15 @@ def serve_image(filename):
 
 # ============ TEMPLATE RENDERING ROUTES ============
 
+# Pages are compiled and rendered once, then served from memory with
+# an ETag and precompressed variants
+page_renderer = PageRenderer(APP_ROOT / 'frontend', version=assets.current_version)
+
+
 def render_html_file(filename):
-    """Helper function to render HTML files with Jinja2 templating"""
+    """Helper function to serve a cached, pre-rendered HTML page"""
     try:
-        with open(APP_ROOT / 'frontend' / filename, 'r', encoding='utf-8') as f:
-            content = f.read()
-        return render_template_string(content)
+        return page_renderer.response(filename)
     except Exception as e:
         return jsonify({'error': f'Template rendering failed: {str(e)}'}), 500
 
@@ -114,9 +153,7 @@ def upload():
 def login():
     """Render login page (login.html)"""
     try:
-        with open(APP_ROOT / 'frontend' / 'login.html', 'r', encoding='utf-8') as f:
-            content = f.read()
-        return render_template_string(content)
+        return page_renderer.response('login.html')
     except FileNotFoundError:
         # If login.html doesn't exist yet, return placeholder
         return jsonify({'message': 'Login page not yet implemented'}), 200
@@ -126,9 +163,7 @@ def login():
 def profile():
     """Render profile page (profile.html)"""
     try:
-        with open(APP_ROOT / 'frontend' / 'profile.html', 'r', encoding='utf-8') as f:
-            content = f.read()
-        return render_template_string(content)
+        return page_renderer.response('profile.html')
     except FileNotFoundError:
         # If profile.html doesn't exist yet, return placeholder
         return jsonify({'message': 'Profile page not yet implemented'}), 200
@@ -137,9 +172,60 @@ def profile():
 # ============ API ROUTE REGISTRATION ============
 
 # Import and register API blueprint
-from app.api.endpoints import api_bp
+from app.api.endpoints import api_bp, start_model_warmup
 app.register_blueprint(api_bp)
 
+# Load and warm up the models in the background so the first request does
+# not pay for it; /api/health/ready turns 200 once done. Off by default so
+# importing the app (e.g. in every gunicorn worker, or a pre-fork master)
+# does not load torch; run.py turns it on for the single-process server,
+# and elsewhere the first readiness probe starts it in the process that
+# answers. Under the debug reloader only the child process that serves
+# requests warms up.
+if os.getenv('WARMUP_ON_STARTUP', 'false').lower() == 'true' and \
+        not (app.config['DEBUG'] and os.environ.get('WERKZEUG_RUN_MAIN') != 'true'):
+    start_model_warmup()
+
+
+# ============ METRICS ============
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Request, stage, cache, enhancer and LLM metrics in Prometheus text format"""
+    return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+
+# ============ REQUEST PROFILES ============
+
+def _profile_access_error():
+    """Response for a request not allowed to read profiles, or None"""
+    if not profiler.token:
+        return jsonify({'success': False, 'error': 'Resource not found', 'status': 404}), 404
+    if not profiler.authorized(request):
+        return jsonify({'success': False, 'error': 'Unauthorized', 'status': 401}), 401
+    return None
+
+
+@app.route('/admin/profiles')
+def list_profiles():
+    """Stored request profiles, newest first (Authorization: Bearer <PROFILE_TOKEN>)"""
+    error = _profile_access_error()
+    if error is not None:
+        return error
+    return jsonify({'success': True, 'profiles': profiler.list()}), 200
+
+
+@app.route('/admin/profiles/<name>')
+def download_profile(name):
+    """Download one profile: meta.json, cprofile.prof / .txt and torch_ops.txt in a zip"""
+    error = _profile_access_error()
+    if error is not None:
+        return error
+    path = profiler.path(name)
+    if path is None:
+        return jsonify({'success': False, 'error': 'Profile not found', 'status': 404}), 404
+    return send_file(path, mimetype='application/zip', as_attachment=True, download_name=f"profile-{name}.zip")
+
 
 # ============ ERROR HANDLERS ============
 
@@ -0,0 +1,246 @@
+"""
+CropGuard AI - Offline Batch Scanner
+Re-scores a directory tree of leaf photos with the MobileNetV3 classifier,
+e.g. a historic archive after the weights change.
+
+Decoding, resizing and the blur check run in a pool of worker processes,
+spawned rather than forked because the parent has already initialised
+torch and its thread pools; batched inference and severity estimation
+(predict_images, the path /api/predict/batch uses) run in the main
+process. Results are appended to a CSV after every batch and a checkpoint
+is written next to it, so an interrupted scan picks up where it stopped.
+
+USAGE:
+    python -m app.scan DIR --output scan.csv
+    python -m app.scan DIR --output scan.csv --weights new_weights.pth --workers 8
+    python -m app.scan DIR --output scan.csv --restart     # ignore an existing checkpoint
+"""
+
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+
+from app.services.enhancer import check_image_quality
+from app.services.imaging import DecodedImage
+from app.services.prediction import MAX_BATCH_SIZE, MODEL_WEIGHTS_PATH, load_mobilenet_model, predict_images
+
+# ==========================================================
+# CONFIG
+# ==========================================================
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+CSV_COLUMNS = [
+    'path', 'disease_name', 'confidence', 'severity_level', 'image_quality',
+    'width', 'height', 'weights_version', 'error'
+]
+# Decoded batches waiting for the main process, per worker
+PREFETCH_PER_WORKER = 2
+PROGRESS_INTERVAL_SECONDS = 10.0
+
+
+def iter_image_paths(root: str):
+    """Yield image paths under `root` relative to it, in a stable sorted order."""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if name.lower().endswith(IMAGE_EXTENSIONS) and not name.startswith('.'):
+                yield os.path.relpath(os.path.join(dirpath, name), root)
+
+
+def iter_chunks(items, size: int):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# ==========================================================
+# WORKER PROCESSES
+# ==========================================================
+def _init_worker():
+    # One OpenCV thread per process; the pool already uses every core
+    cv2.setNumThreads(1)
+
+
+def _decode_chunk(root: str, paths):
+    """
+    Decode a chunk of images in a worker process. Returns a list of
+    (path, resized uint8 array or None, width, height, image_quality, error);
+    only the 224x224 model input crosses back to the main process.
+    """
+    decoded = []
+    for path in paths:
+        try:
+            image = DecodedImage.from_path(os.path.join(root, path))
+            image_quality = 'blurry' if check_image_quality(image) else 'good'
+            decoded.append((path, image.resized, image.width, image.height, image_quality, ''))
+        except Exception as e:
+            decoded.append((path, None, '', '', '', f"{type(e).__name__}: {e}"))
+    return decoded
+
+
+# ==========================================================
+# CHECKPOINTING
+# ==========================================================
+def load_checkpoint(checkpoint_path: str):
+    try:
+        with open(checkpoint_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_checkpoint(checkpoint_path: str, checkpoint: dict):
+    tmp_path = f"{checkpoint_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(tmp_path, checkpoint_path)
+
+
+def resume_output(output_path: str, checkpoint: dict):
+    """
+    Cut the CSV back to the last checkpointed batch (dropping a partially
+    written one) and return the set of paths already scored.
+    """
+    with open(output_path, 'r+', encoding='utf-8', newline='') as f:
+        f.truncate(checkpoint['output_bytes'])
+    with open(output_path, 'r', encoding='utf-8', newline='') as f:
+        reader = csv.DictReader(f)
+        if reader.fieldnames != CSV_COLUMNS:
+            raise SystemExit(
+                f"❌ {output_path} has different columns (written by an older version). "
+                f"Use --restart or a new --output."
+            )
+        return {row['path'] for row in reader}
+
+
+# ==========================================================
+# SCAN
+# ==========================================================
+def scan_directory(root: str, output_path: str, weights_path: str = MODEL_WEIGHTS_PATH,
+                   batch_size: int = MAX_BATCH_SIZE, workers: int = None,
+                   checkpoint_path: str = None, restart: bool = False, limit: int = 0) -> dict:
+    """
+    Score every image under `root` and append one CSV row per image to
+    `output_path`. Returns throughput statistics for this run.
+    """
+    workers = workers or os.cpu_count() or 1
+    checkpoint_path = checkpoint_path or f"{output_path}.checkpoint.json"
+
+    model = load_mobilenet_model(weights_path)
+    weights_version = model.weights_version
+
+    checkpoint = None if restart else load_checkpoint(checkpoint_path)
+    done = set()
+    if checkpoint is not None and os.path.exists(output_path):
+        if checkpoint.get('weights_version') != weights_version:
+            raise SystemExit(
+                f"❌ {checkpoint_path} was written with different weights. "
+                f"Use --restart or a new --output."
+            )
+        done = resume_output(output_path, checkpoint)
+        print(f"Resuming: {len(done)} images already scored in {output_path}")
+    else:
+        checkpoint = {'root': os.path.abspath(root), 'weights_version': weights_version,
+                      'rows': 0, 'errors': 0}
+        with open(output_path, 'w', encoding='utf-8', newline='') as f:
+            csv.writer(f).writerow(CSV_COLUMNS)
+            checkpoint['output_bytes'] = f.tell()
+        write_checkpoint(checkpoint_path, checkpoint)
+
+    todo = (path for path in iter_image_paths(root) if path not in done)
+    if limit:
+        todo = (path for _, path in zip(range(limit), todo))
+    chunks = iter_chunks(todo, batch_size)
+
+    print(f"Scanning {root} with {workers} decode workers, batch size {batch_size}")
+    stats = {'images': 0, 'errors': 0}
+    start = last_report = time.perf_counter()
+
+    with open(output_path, 'a', encoding='utf-8', newline='') as out, \
+            ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                mp_context=multiprocessing.get_context('spawn')) as pool:
+        writer = csv.writer(out)
+        pending = deque()
+
+        def refill():
+            # Bounded prefetch keeps memory flat however large the tree is
+            while len(pending) < workers * PREFETCH_PER_WORKER:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    return
+                pending.append(pool.submit(_decode_chunk, root, chunk))
+
+        refill()
+        while pending:
+            decoded = pending.popleft().result()
+            refill()
+
+            ok = [item for item in decoded if item[1] is not None]
+            results = iter(predict_images(model, [item[1] for item in ok]) if ok else [])
+            batch_errors = len(decoded) - len(ok)
+            for path, resized, width, height, image_quality, error in decoded:
+                if resized is None:
+                    writer.writerow([path, '', '', '', '', '', '', weights_version, error])
+                    continue
+                result = next(results)
+                writer.writerow([path, result['disease_name'], result['confidence'], result['severity_level'],
+                                 image_quality, width, height, weights_version, ''])
+            stats['images'] += len(decoded)
+            stats['errors'] += batch_errors
+
+            out.flush()
+            checkpoint['rows'] += len(decoded)
+            checkpoint['errors'] += batch_errors
+            checkpoint['output_bytes'] = out.tell()
+            write_checkpoint(checkpoint_path, checkpoint)
+
+            now = time.perf_counter()
+            if now - last_report >= PROGRESS_INTERVAL_SECONDS:
+                last_report = now
+                print(f"  {stats['images']} images, {stats['images'] / (now - start):.1f} images/sec, "
+                      f"{stats['errors']} errors")
+
+    elapsed = time.perf_counter() - start
+    stats.update({
+        'elapsed_s': round(elapsed, 2),
+        'images_per_sec': round(stats['images'] / elapsed, 1) if elapsed > 0 else 0.0,
+        'total_rows': checkpoint['rows'],
+    })
+    print(f"✅ Scanned {stats['images']} images in {elapsed:.1f}s "
+          f"({stats['images_per_sec']} images/sec, {stats['errors']} errors); "
+          f"{checkpoint['rows']} rows in {output_path}")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score a directory of leaf photos to CSV")
+    parser.add_argument('directory', help='Root directory, scanned recursively for JPG/PNG images')
+    parser.add_argument('--output', default='scan_results.csv')
+    parser.add_argument('--weights', default=MODEL_WEIGHTS_PATH, help='Default: PREDICT_WEIGHTS_PATH')
+    parser.add_argument('--batch-size', type=int, default=MAX_BATCH_SIZE)
+    parser.add_argument('--workers', type=int, default=0, help='Decode processes (default: CPU count)')
+    parser.add_argument('--checkpoint', help='Checkpoint file (default: <output>.checkpoint.json)')
+    parser.add_argument('--restart', action='store_true', help='Ignore the checkpoint and overwrite the output')
+    parser.add_argument('--limit', type=int, default=0, help='Stop after this many new images')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.directory):
+        raise SystemExit(f"❌ Not a directory: {args.directory}")
+
+    scan_directory(args.directory, args.output, args.weights, args.batch_size,
+                   args.workers or None, args.checkpoint, args.restart, args.limit)
+
+
+if __name__ == '__main__':
+    main()
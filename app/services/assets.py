@@ -0,0 +1,337 @@
+"""
+CropGuard AI - Static Asset Pipeline
+Builds fingerprinted copies of the stylesheets, scripts and images in
+frontend/ (style.css -> style.1f3a9c0e52d4.css) plus gzip / brotli
+variants, and a manifest.json mapping public names to built files.
+
+Because a built file's name changes whenever its content does, it is
+served with `Cache-Control: immutable` and a one-year max-age: repeat page
+views on slow connections fetch nothing and revalidate nothing. Templates
+link assets with {{ asset_url('style.css') }} and images with
+{{ image_url('images/apple.jpg', 640) }} / {{ image_srcset('images/apple.jpg') }},
+which return resized AVIF / WebP derivatives (app/services/image_derivatives.py).
+The service worker (frontend/scripts/sw.js) precaches the manifest's
+`precache` list (stylesheets and scripts).
+
+The build is an explicit deploy step; importing the app only reads the
+manifest, so it never writes into the source tree (or a read-only image):
+
+    python -m app.services.assets build
+    python -m app.services.assets build --derivatives   # also pre-generate image derivatives
+
+ASSET_BUILD_DIR puts the output somewhere other than frontend/dist. Files
+and the manifest are written to a temporary name and renamed, so a server
+reading the directory never sees a partial build. In debug mode (or with
+ASSET_CHECK_MTIME=true) stale assets are rebuilt on load and before each
+page render instead. Without a manifest, pages link the /static files.
+"""
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import shutil
+import threading
+
+from flask import abort, request, send_file
+
+from app.services.image_derivatives import (
+    DERIVATIVE_PREGENERATE, DERIVATIVE_WIDTHS, ImageDerivatives, snap_width
+)
+from app.services.lazy_imports import optional_import
+
+# ==========================================================
+# CONFIG
+# ==========================================================
+FRONTEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                            "frontend")
+ASSET_BUILD_DIR = os.getenv("ASSET_BUILD_DIR") or os.path.join(FRONTEND_DIR, "dist")
+# Unset: follow the app's debug flag
+ASSET_CHECK_MTIME = os.getenv("ASSET_CHECK_MTIME")
+ASSET_URL_PREFIX = "/assets"
+MANIFEST_NAME = "manifest.json"
+
+# Public name -> source file under frontend/; images/* are added by scanning
+ASSET_SOURCES = {
+    "style.css": "styles/main.css",
+    "about.css": "styles/about.css",
+    "guide.css": "styles/guide.css",
+    "script.js": "scripts/script.js",
+}
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".gif", ".svg", ".ico")
+COMPRESSIBLE_EXTENSIONS = (".css", ".js", ".svg", ".json")
+# Width requested for background images referenced from stylesheets
+CSS_IMAGE_WIDTH = int(os.getenv("CSS_IMAGE_WIDTH", "1280"))
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# url("/static/images/about.jpg") in stylesheets
+_CSS_STATIC_URL = re.compile(r"""/static/(images/[^"')\s]+)""")
+
+
+def fingerprint(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=6).hexdigest()
+
+
+def fingerprinted_name(name: str, digest: str) -> str:
+    """images/logo.png -> images/logo.<digest>.png"""
+    root, ext = os.path.splitext(name)
+    return f"{root}.{digest}{ext}"
+
+
+class AssetPipeline:
+    """
+    Builds and serves the fingerprinted assets of one frontend directory.
+
+        assets = AssetPipeline()
+        assets.load()                  # read the manifest written by `build`
+        assets.url('style.css')        # '/assets/style.1f3a9c0e52d4.css'
+        assets.response(filename)      # Flask response for /assets/<filename>
+    """
+
+    def __init__(self, source_dir: str = FRONTEND_DIR, build_dir: str = ASSET_BUILD_DIR,
+                 url_prefix: str = ASSET_URL_PREFIX, check_mtime: bool = None):
+        self.source_dir = str(source_dir)
+        self.build_dir = str(build_dir)
+        self.url_prefix = url_prefix
+        if check_mtime is None and ASSET_CHECK_MTIME is not None:
+            check_mtime = ASSET_CHECK_MTIME.lower() == "true"
+        self.check_mtime = check_mtime
+        self.manifest = {"version": None, "assets": {}, "encodings": {}, "widths": {}, "precache": []}
+        self._built = frozenset()
+        self._lock = threading.Lock()
+        self.derivatives = ImageDerivatives(os.path.join(self.build_dir, "derivatives"))
+
+    # ------------------------------------------------------
+    # Build
+    # ------------------------------------------------------
+    def sources(self) -> dict:
+        """Public name -> absolute source path."""
+        sources = {name: os.path.join(self.source_dir, path) for name, path in ASSET_SOURCES.items()}
+        images_dir = os.path.join(self.source_dir, "images")
+        if os.path.isdir(images_dir):
+            for filename in sorted(os.listdir(images_dir)):
+                if filename.lower().endswith(IMAGE_EXTENSIONS):
+                    sources[f"images/{filename}"] = os.path.join(images_dir, filename)
+        return {name: path for name, path in sources.items() if os.path.isfile(path)}
+
+    def _write(self, relative: str, data: bytes):
+        path = os.path.join(self.build_dir, relative)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Content-addressed: an existing file already has these bytes
+        if not os.path.exists(path):
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+
+    def _compress(self, built: str, data: bytes) -> list:
+        """Write .br / .gz next to `built` when they are smaller; returns the encodings."""
+        variants = [("gzip", ".gz", lambda body: gzip.compress(body, 9, mtime=0))]
+        brotli = optional_import("brotli")
+        if brotli is not None:
+            variants.insert(0, ("br", ".br", lambda body: brotli.compress(body, quality=11)))
+
+        encodings = []
+        for encoding, suffix, compress in variants:
+            compressed = compress(data)
+            if len(compressed) < len(data):
+                self._write(built + suffix, compressed)
+                encodings.append(encoding)
+        return encodings
+
+    def build(self) -> dict:
+        """Fingerprint, copy and precompress every asset, then write the manifest."""
+        sources = self.sources()
+        assets, encodings, widths, precache = {}, {}, {}, []
+        # Images first, so stylesheets can be rewritten to their built names
+        for name in sorted(sources, key=lambda n: not n.startswith("images/")):
+            with open(sources[name], "rb") as f:
+                data = f.read()
+            if name.endswith(".css"):
+                data = _CSS_STATIC_URL.sub(
+                    lambda m: f"{self.url_prefix}/{assets[m.group(1)]}?w={CSS_IMAGE_WIDTH}"
+                    if m.group(1) in assets else m.group(0),
+                    data.decode("utf-8"),
+                ).encode("utf-8")
+
+            built = fingerprinted_name(name, fingerprint(data))
+            self._write(built, data)
+            assets[name] = built
+            if name.endswith(COMPRESSIBLE_EXTENSIONS):
+                encodings[built] = self._compress(built, data)
+            if name.startswith("images/"):
+                # Pages request images through ?w= derivatives, cached on first view
+                widths[name] = self.derivatives.source_width(os.path.join(self.build_dir, built), _digest(built))
+            else:
+                precache.append(built)
+
+        manifest = {
+            "version": fingerprint(json.dumps(assets, sort_keys=True).encode("utf-8")),
+            "assets": assets,
+            "encodings": encodings,
+            "widths": widths,
+            "precache": precache,
+        }
+        tmp_path = os.path.join(self.build_dir, f"{MANIFEST_NAME}.{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+        print(f"✅ Built {len(assets)} assets into {self.build_dir} (version {manifest['version']})")
+        return manifest
+
+    # ------------------------------------------------------
+    # Manifest
+    # ------------------------------------------------------
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.build_dir, MANIFEST_NAME)
+
+    def is_stale(self) -> bool:
+        try:
+            built_at = os.path.getmtime(self.manifest_path)
+        except OSError:
+            return True
+        return any(os.path.getmtime(path) > built_at for path in self.sources().values())
+
+    def watches_sources(self, debug: bool = False) -> bool:
+        """Whether stale sources are rebuilt (debug mode / ASSET_CHECK_MTIME)."""
+        return debug if self.check_mtime is None else self.check_mtime
+
+    def load(self, debug: bool = False) -> dict:
+        """Read the manifest, rebuilding first when watching sources that changed."""
+        with self._lock:
+            try:
+                if self.watches_sources(debug) and self.is_stale():
+                    self.build()
+                with open(self.manifest_path, "r", encoding="utf-8") as f:
+                    self.manifest = json.load(f)
+                self._built = frozenset(self.manifest["assets"].values())
+                if DERIVATIVE_PREGENERATE:
+                    self.pregenerate_derivatives()
+            except OSError as e:
+                # e.g. a deploy that skipped `python -m app.services.assets build`
+                print(f"⚠️ Asset manifest unavailable ({e}); serving assets from /static")
+        return self.manifest
+
+    def current_version(self, debug: bool = False):
+        """Manifest version, rebuilding first when sources changed (debug / ASSET_CHECK_MTIME)."""
+        if self.watches_sources(debug) and self.is_stale():
+            self.load(debug)
+        return self.manifest["version"]
+
+    def url(self, name: str) -> str:
+        """Fingerprinted URL of an asset; its legacy /static URL if it was not built."""
+        built = self.manifest["assets"].get(name)
+        if built is None:
+            return f"/static/{name}"
+        return f"{self.url_prefix}/{built}"
+
+    def image_url(self, name: str, width: int) -> str:
+        """URL of an image resized to (about) `width` pixels, in the best format the browser accepts."""
+        return f"{self.url(name)}?w={width}"
+
+    def image_srcset(self, name: str) -> str:
+        """srcset attribute value listing the derivative widths up to the source width."""
+        source_width = self.manifest.get("widths", {}).get(name)
+        if not source_width:
+            return ""
+        widths = sorted({snap_width(width, source_width) for width in DERIVATIVE_WIDTHS})
+        return ", ".join(f"{self.image_url(name, width)} {width}w" for width in widths)
+
+    def pregenerate_derivatives(self) -> list:
+        """Queue every image derivative in the background; returns the Futures."""
+        return self.derivatives.pregenerate(
+            (os.path.join(self.build_dir, built), _digest(built))
+            for name, built in self.manifest["assets"].items() if name.startswith("images/")
+        )
+
+    # ------------------------------------------------------
+    # Serving
+    # ------------------------------------------------------
+    def response(self, filename: str):
+        """
+        Serve a built asset: the br / gzip variant the client accepts,
+        cached for a year. The manifest itself is revalidated every time.
+        """
+        if filename == MANIFEST_NAME:
+            response = send_file(self.manifest_path, mimetype="application/json", conditional=True)
+            response.headers["Cache-Control"] = "no-cache"
+            return response
+
+        if filename not in self._built:
+            abort(404)
+        if filename.startswith("images/") and self.derivatives.original_format(filename):
+            return self._image_response(filename)
+
+        available = self.manifest["encodings"].get(filename, [])
+        encoding = request.accept_encodings.best_match(available, default="identity") if available else "identity"
+        suffix = {"br": ".br", "gzip": ".gz"}.get(encoding, "")
+        mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+
+        response = send_file(os.path.join(self.build_dir, filename + suffix),
+                             mimetype=mimetype, download_name=os.path.basename(filename),
+                             conditional=True, max_age=None)
+        if suffix:
+            response.headers["Content-Encoding"] = encoding
+        if available:
+            response.vary.add("Accept-Encoding")
+        response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+        return response
+
+    def _image_response(self, filename: str):
+        """
+        Serve an image at the width from ?w= (snapped to DERIVATIVE_WIDTHS)
+        in AVIF / WebP when the Accept header allows it. Until a derivative
+        exists the original is sent without long-term caching.
+        """
+        source = os.path.join(self.build_dir, filename)
+        digest = _digest(filename)
+        original = self.derivatives.original_format(filename)
+        fmt = self.derivatives.choose_format(request.accept_mimetypes, original)
+        source_width = self.derivatives.source_width(source, digest)
+        width = snap_width(request.args.get("w", source_width, type=int), source_width)
+
+        path = source
+        if fmt != original or width != source_width:
+            path = self.derivatives.get(source, digest, width, fmt)
+        if path is None:
+            response = send_file(source, mimetype=mimetypes.guess_type(filename)[0],
+                                 download_name=os.path.basename(filename), conditional=True, max_age=0)
+            response.headers["Cache-Control"] = "no-cache"
+        else:
+            served_fmt = fmt if path != source else original
+            response = send_file(path, mimetype=f"image/{served_fmt}",
+                                 download_name=os.path.basename(filename), conditional=True, max_age=None)
+            response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+        response.vary.add("Accept")
+        return response
+
+
+def _digest(built_name: str) -> str:
+    """images/logo.823b9977707a.png -> 823b9977707a"""
+    return built_name.rsplit(".", 2)[-2]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build fingerprinted, precompressed frontend assets")
+    parser.add_argument("command", choices=["build"])
+    parser.add_argument("--source", default=FRONTEND_DIR)
+    parser.add_argument("--output", default=ASSET_BUILD_DIR)
+    parser.add_argument("--clean", action="store_true", help="Delete the output directory first")
+    parser.add_argument("--derivatives", action="store_true",
+                        help="Also generate every image width / format (in parallel)")
+    args = parser.parse_args()
+
+    if args.clean and os.path.isdir(args.output):
+        shutil.rmtree(args.output)
+    pipeline = AssetPipeline(args.source, args.output)
+    pipeline.build()
+    pipeline.load()
+    if args.derivatives:
+        futures = pipeline.pregenerate_derivatives()
+        failed = sum(1 for future in futures if future.exception() is not None)
+        print(f"✅ Generated {len(futures) - failed} image derivatives ({failed} failed)")
@@ -0,0 +1,267 @@
+"""
+CropGuard AI - Prediction Result Cache
+Content-addressed cache for repeat uploads of the same photo. Entries are
+keyed by a hash of the uploaded bytes plus the model weights version, and
+hold the prediction, image_quality, recommendations per language and,
+once requested, the Grad-CAM overlay.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+# ==========================================================
+# CONFIG
+# ==========================================================
+CACHE_MAX_ENTRIES = int(os.getenv("PREDICTION_CACHE_MAX_ENTRIES", "1024"))
+CACHE_MAX_BYTES = int(os.getenv("PREDICTION_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+# Optional on-disk tier that survives restarts; disabled when unset
+CACHE_DIR = os.getenv("PREDICTION_CACHE_DIR") or None
+# Bounds of the disk tier; least recently used files are deleted beyond them
+CACHE_DISK_MAX_ENTRIES = int(os.getenv("PREDICTION_CACHE_DISK_MAX_ENTRIES", "20000"))
+CACHE_DISK_MAX_BYTES = int(os.getenv("PREDICTION_CACHE_DISK_MAX_BYTES", str(256 * 1024 * 1024)))
+
+
+def hash_image_bytes(data: bytes) -> str:
+    """Fast content hash of an upload (BLAKE2b, 128-bit)."""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def hash_file(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """Content hash of a weights file, used as the model version."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# ==========================================================
+# CACHE
+# ==========================================================
+class PredictionCache:
+    """
+    LRU cache bounded by entry count and total serialized bytes.
+
+    An entry looks like:
+        {'prediction': {...}, 'image_quality': 'good',
+         'recommendations': {'en': '...', 'hi': '...'},
+         'gradcam': '<base64 JPEG>' or None}
+
+    With `disk_dir` set, entries are also written there as JSON and a
+    memory miss falls back to disk (promoting the entry back into memory).
+    The disk tier is an LRU too, bounded by `disk_max_entries` and
+    `disk_max_bytes`; its order is rebuilt from file mtimes at startup, so
+    entries of old weights versions, which are never read again, are the
+    first to be deleted.
+    """
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES,
+                 max_bytes: int = CACHE_MAX_BYTES, disk_dir: str = CACHE_DIR,
+                 disk_max_entries: int = CACHE_DISK_MAX_ENTRIES,
+                 disk_max_bytes: int = CACHE_DISK_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_entries = disk_max_entries
+        self.disk_max_bytes = disk_max_bytes
+        self._entries = OrderedDict()  # key -> (entry, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._disk_files = OrderedDict()  # key -> file size, least recently used first
+        self._disk_bytes = 0
+        self._disk_evictions = 0
+        self._disk_lock = threading.Lock()
+        self._counters = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0}
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._load_disk_index()
+
+    @staticmethod
+    def make_key(image_bytes: bytes, model_version: str) -> str:
+        return f"{model_version}-{hash_image_bytes(image_bytes)}"
+
+    def get(self, key: str):
+        """Return a copy of the cached entry, or None."""
+        with self._lock:
+            item = self._entries.get(key)
+            if item is not None:
+                self._entries.move_to_end(key)
+                self._counters['hits'] += 1
+                return _copy_entry(item[0])
+
+        entry = self._read_disk(key)
+        with self._lock:
+            if entry is None:
+                self._counters['misses'] += 1
+                return None
+            self._counters['disk_hits'] += 1
+            self._store(key, entry)
+            return _copy_entry(entry)
+
+    def put(self, key: str, prediction: dict, image_quality: str, recommendations: dict = None):
+        entry = {
+            'prediction': dict(prediction),
+            'image_quality': image_quality,
+            'recommendations': dict(recommendations or {}),
+            'gradcam': None,
+        }
+        with self._lock:
+            self._store(key, entry)
+        self._write_disk(key, entry)
+
+    def get_recommendation(self, key: str, language_code: str):
+        """Cached recommendation text for an entry already in memory; does not touch counters."""
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            return item[0]['recommendations'].get(language_code)
+
+    def add_recommendation(self, key: str, language_code: str, text: str):
+        """Attach a recommendation to an existing entry (no-op if it was evicted)."""
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return
+            entry = _copy_entry(item[0])
+            entry['recommendations'][language_code] = text
+            self._store(key, entry)
+        self._write_disk(key, entry)
+
+    def get_gradcam(self, key: str):
+        """Cached Grad-CAM overlay for an entry already in memory; does not touch counters."""
+        with self._lock:
+            item = self._entries.get(key)
+            return None if item is None else item[0].get('gradcam')
+
+    def add_gradcam(self, key: str, overlay: str):
+        """Attach a Grad-CAM overlay to an existing entry (no-op if it was evicted)."""
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return
+            entry = _copy_entry(item[0])
+            entry['gradcam'] = overlay
+            self._store(key, entry)
+        self._write_disk(key, entry)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._counters, entries=len(self._entries), bytes=self._bytes,
+                         max_entries=self.max_entries, max_bytes=self.max_bytes,
+                         disk_dir=self.disk_dir)
+        if self.disk_dir:
+            with self._disk_lock:
+                stats.update(disk_entries=len(self._disk_files), disk_bytes=self._disk_bytes,
+                             disk_evictions=self._disk_evictions,
+                             disk_max_entries=self.disk_max_entries, disk_max_bytes=self.disk_max_bytes)
+        return stats
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    # --- internals (call with self._lock held) ---
+    def _store(self, key: str, entry: dict):
+        size = len(json.dumps(entry, ensure_ascii=False).encode("utf-8"))
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old[1]
+        if size > self.max_bytes:
+            return
+        self._entries[key] = (entry, size)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+            self._counters['evictions'] += 1
+
+    # --- disk tier ---
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _load_disk_index(self):
+        """Rebuild the disk LRU from file mtimes and drop leftover temp files."""
+        files = []
+        with os.scandir(self.disk_dir) as it:
+            for item in it:
+                try:
+                    if item.name.endswith(".tmp"):
+                        os.remove(item.path)
+                    elif item.name.endswith(".json"):
+                        stat = item.stat()
+                        files.append((stat.st_mtime, item.name[:-5], stat.st_size))
+                except OSError:
+                    pass
+        with self._disk_lock:
+            for _, key, size in sorted(files):
+                self._disk_files[key] = size
+                self._disk_bytes += size
+            self._prune_disk()
+
+    def _touch_disk(self, key: str, size: int = None):
+        """Mark a disk entry as recently used (size given when it was just written)."""
+        with self._disk_lock:
+            old = self._disk_files.pop(key, None)
+            if size is None:
+                if old is None:
+                    return
+                size = old
+                try:
+                    os.utime(self._disk_path(key))  # keeps the order across restarts
+                except OSError:
+                    pass
+            self._disk_bytes += size - (old or 0)
+            self._disk_files[key] = size
+            self._prune_disk()
+
+    def _prune_disk(self):
+        """Delete least recently used files beyond the bounds (call with _disk_lock held)."""
+        while self._disk_files and (len(self._disk_files) > self.disk_max_entries
+                                    or self._disk_bytes > self.disk_max_bytes):
+            key, size = self._disk_files.popitem(last=False)
+            self._disk_bytes -= size
+            self._disk_evictions += 1
+            try:
+                os.remove(self._disk_path(key))
+            except OSError:
+                pass
+
+    def _read_disk(self, key: str):
+        if not self.disk_dir:
+            return None
+        try:
+            with open(self._disk_path(key), "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        self._touch_disk(key)
+        return entry
+
+    def _write_disk(self, key: str, entry: dict):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            data = json.dumps(entry, ensure_ascii=False).encode("utf-8")
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Prediction cache disk write failed: {e}")
+            return
+        self._touch_disk(key, len(data))
+
+
+def _copy_entry(entry: dict) -> dict:
+    return {
+        'prediction': dict(entry['prediction']),
+        'image_quality': entry['image_quality'],
+        'recommendations': dict(entry.get('recommendations', {})),
+        'gradcam': entry.get('gradcam'),
+    }
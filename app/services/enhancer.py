@@ -1,25 +1,65 @@
 # Location: SmartCropDoc-AI/app/services/enhancer.py (Refined for Testing)
 
 import io
+import os
 import random
+import threading
+import time
+from contextlib import nullcontext
 from PIL import Image
 import numpy as np
-import cv2 
 import base64
-import torch
-from realesrgan import RealESRGANer
-from basicsr.archs.rrdbnet_arch import RRDBNet
+from app.services.imaging import THUMBNAIL_MAX_SIDE, DecodedImage, InvalidImageError
+from app.services.lazy_imports import loaded_module, torch_device
+# torch, cv2, realesrgan and basicsr are imported on first use: the blur
+# check needs only OpenCV, and Real-ESRGAN loads with the enhancer model.
 # Note: You need to ensure the imports for basicsr/rrdbnet_arch are correct based on your pip install.
 
 # --- Configuration ---
-DEVICE = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
 MODEL_PATH = 'models/enhancer_weights/RealESRGAN_x4plus.pth' 
 SCALE_FACTOR = 4
 BLUR_VARIANCE_THRESHOLD = 8.0 
+# Thumbnail pre-filter bounds, calibrated with benchmarks/bench_blur.py so that
+# thumbnail decisions agree with BLUR_VARIANCE_THRESHOLD at full resolution.
+# Scores in between fall through to the exact full-resolution check.
+BLUR_THUMBNAIL_BLURRY_BELOW = float(os.getenv('BLUR_THUMBNAIL_BLURRY_BELOW', '24.0'))
+BLUR_THUMBNAIL_SHARP_ABOVE = float(os.getenv('BLUR_THUMBNAIL_SHARP_ABOVE', '150.0'))
+
+# --- Size-capped enhancement (default on CPU) ---
+# "capped": downsample to a working resolution, tile from available RAM and
+#           upscale only as far as the classifier needs
+# "full":   original behaviour, full-resolution 4x with no tiling
+# Unset: "full" on CUDA, "capped" otherwise (see get_enhance_mode)
+ENHANCE_MODE = os.getenv('ENHANCE_MODE', '')
+ENHANCE_WORKING_MAX_SIDE = int(os.getenv('ENHANCE_WORKING_MAX_SIDE', '512'))
+# Shortest output side; 2x headroom over the classifier's 224x224 input
+ENHANCE_TARGET_MIN_SIDE = int(os.getenv('ENHANCE_TARGET_MIN_SIDE', '448'))
+# Fraction of currently available RAM one enhancement may use
+ENHANCE_MEMORY_FRACTION = float(os.getenv('ENHANCE_MEMORY_FRACTION', '0.25'))
+# Rough RRDBNet x4 activation footprint per input pixel (float32), incl. upsampling stages
+ENHANCE_BYTES_PER_PIXEL = 10 * 1024
+MIN_TILE_SIZE = 64
+
+# RealESRGANer keeps tile_size as instance state; serialize calls that change it.
+# Reentrant: on GPU the whole call also holds it, see enhance_image
+_enhance_lock = threading.RLock()
+
+def get_enhance_mode() -> str:
+    if ENHANCE_MODE:
+        return ENHANCE_MODE
+    device = torch_device()
+    return 'full' if device is not None and device.type == 'cuda' else 'capped'
+
 
 # --- Model Loading ---
 def load_real_esrgan_model():
     """Loads the Real-ESRGAN model once and caches it."""
+    try:
+        from realesrgan import RealESRGANer
+        from basicsr.archs.rrdbnet_arch import RRDBNet
+    except ImportError:  # The blur check still works; blurry images are not enhanced
+        print("Real-ESRGAN is not installed; blurry images will be classified without enhancement.")
+        return None
     try:
         # Define the model structure
         model = RRDBNet(num_in_ch=3, num_out_ch=3, num_feat=64, 
@@ -34,21 +74,58 @@ def load_real_esrgan_model():
             tile_pad=10,
             pre_pad=0,
             half=False, 
-            device=DEVICE
+            device=torch_device()
         )
-        print(f"Real-ESRGAN Model Loaded on: {DEVICE}")
+        print(f"Real-ESRGAN Model Loaded on: {torch_device()}")
         return upsampler
     except Exception as e:
         print(f"ERROR: Failed to load Real-ESRGAN model! Check path/dependencies. {e}")
         return None
 
 # --- Core Logic ---
-def check_image_quality(image_bytes: bytes) -> bool:
-    """Analyzes an image to determine if enhancement is necessary (Blur Check)."""
+def _laplacian_variance(gray: np.ndarray) -> float:
+    # The 3x3 Laplacian of uint8 input fits in int16 exactly, and
+    # cv2.meanStdDev reduces it without materializing a float64 copy
+    import cv2
+
+    laplacian = cv2.Laplacian(gray, cv2.CV_16S)
+    _, std = cv2.meanStdDev(laplacian)
+    return float(std[0, 0]) ** 2
+
+
+def laplacian_variance_reference(image) -> float:
+    """Original blur score: float64 Laplacian variance at full resolution. Kept for calibration."""
+    import cv2
+
+    img_np = DecodedImage.coerce(image).gray
+    return cv2.Laplacian(img_np, cv2.CV_64F).var()
+
+
+def laplacian_variance_full(image) -> float:
+    """Same score as laplacian_variance_reference, computed in integer arithmetic."""
+    return _laplacian_variance(DecodedImage.coerce(image).gray)
+
+
+def laplacian_variance_thumbnail(image) -> float:
+    """Blur score on the bounded-size grayscale thumbnail (JPEG draft decode when possible)."""
+    return _laplacian_variance(DecodedImage.coerce(image).thumbnail_gray)
+
+
+def check_image_quality(image) -> bool:
+    """
+    Analyzes an image to determine if enhancement is necessary (Blur Check).
+    Accepts a DecodedImage or raw bytes. Clear cases are decided on the
+    thumbnail; only scores between the calibrated bounds pay for the
+    full-resolution check.
+    """
     try:
-        # Convert to grayscale for blur check
-        img_np = np.array(Image.open(io.BytesIO(image_bytes)).convert("L")) 
-        laplacian_variance = cv2.Laplacian(img_np, cv2.CV_64F).var()
+        thumbnail_variance = laplacian_variance_thumbnail(image)
+        if thumbnail_variance < BLUR_THUMBNAIL_BLURRY_BELOW:
+            return True
+        if thumbnail_variance >= BLUR_THUMBNAIL_SHARP_ABOVE:
+            return False
+
+        laplacian_variance = laplacian_variance_full(image)
         
         is_blurred = laplacian_variance < BLUR_VARIANCE_THRESHOLD
         
@@ -56,42 +133,208 @@ def check_image_quality(image_bytes: bytes) -> bool:
              return True
         return False
         
+    except InvalidImageError:
+        raise  # an undecodable upload is the caller's 400, not a sharp photo
     except Exception:
         return False
 
-def enhance_image(image_bytes: bytes, upsampler_instance, force_run: bool = False) -> bytes:
+def check_resized_image_quality(image, margin: float = 0.15):
     """
-    Runs Real-ESRGAN inference. Returns enhanced image bytes or original bytes.
+    Blur check for an upload the browser already downscaled (to a longest
+    side of at least THUMBNAIL_MAX_SIDE, so its thumbnail matches the
+    original's). Returns True / False when the thumbnail score decides it,
+    with `margin` headroom on both bounds for resampling and re-encoding,
+    or None when only the full-resolution check could decide, i.e. the
+    original upload is needed to give the same answer as check_image_quality.
+    """
+    image = DecodedImage.coerce(image)
+    if max(image.width, image.height) < THUMBNAIL_MAX_SIDE:
+        return None
+    thumbnail_variance = laplacian_variance_thumbnail(image)
+    if thumbnail_variance < BLUR_THUMBNAIL_BLURRY_BELOW * (1 - margin):
+        return True
+    if thumbnail_variance >= BLUR_THUMBNAIL_SHARP_ABOVE * (1 + margin):
+        return False
+    return None
+
+# --- Resource Helpers ---
+def _available_memory_bytes() -> int:
+    """Currently available physical memory, or 0 if it cannot be determined."""
+    try:
+        import psutil
+        return psutil.virtual_memory().available
+    except ImportError:
+        pass
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (ValueError, OSError, AttributeError):
+        return 0
+
+
+def _current_rss_bytes() -> int:
+    """Resident set size of this process (Linux /proc), or 0 if unavailable."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+class _PeakRSSSampler:
+    """Samples RSS on a background thread to report a per-call peak."""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.start_rss = 0
+        self.peak_rss = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.start_rss = self.peak_rss = _current_rss_bytes()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak_rss = max(self.peak_rss, _current_rss_bytes())
+        return False
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak_rss = max(self.peak_rss, _current_rss_bytes())
+
+
+def choose_tile_size(height: int, width: int) -> int:
+    """
+    Pick a Real-ESRGAN tile size that fits the memory budget.
+    Returns 0 (no tiling) when the whole image fits.
+    """
+    budget = _available_memory_bytes() * ENHANCE_MEMORY_FRACTION
+    if budget <= 0:
+        return 256
+    max_pixels = budget / ENHANCE_BYTES_PER_PIXEL
+    if height * width <= max_pixels:
+        return 0
+    tile = int(max_pixels ** 0.5) // 32 * 32
+    return max(MIN_TILE_SIZE, tile)
+
+
+def _working_copy(rgb: np.ndarray) -> np.ndarray:
+    """Downsample so the longest side is at most ENHANCE_WORKING_MAX_SIDE."""
+    import cv2
+
+    h, w = rgb.shape[:2]
+    longest = max(h, w)
+    if longest <= ENHANCE_WORKING_MAX_SIDE:
+        return rgb
+    ratio = ENHANCE_WORKING_MAX_SIDE / longest
+    size = (max(1, round(w * ratio)), max(1, round(h * ratio)))
+    return cv2.resize(rgb, size, interpolation=cv2.INTER_AREA)
+
+
+def _enhance_capped(rgb: np.ndarray, upsampler_instance, stats: dict) -> np.ndarray:
+    """Size-capped, auto-tiled Real-ESRGAN pass. Fills `stats` with timings and memory."""
+    working = _working_copy(rgb)
+    h, w = working.shape[:2]
+    # Upscale only far enough for the classifier, never beyond the network's native scale
+    outscale = min(float(SCALE_FACTOR), max(1.0, ENHANCE_TARGET_MIN_SIDE / min(h, w)))
+    tile = choose_tile_size(h, w)
+
+    with _enhance_lock:
+        previous_tile = upsampler_instance.tile_size
+        upsampler_instance.tile_size = tile
+        try:
+            output, _ = upsampler_instance.enhance(working, outscale=outscale)
+        finally:
+            upsampler_instance.tile_size = previous_tile
+
+    stats.update({
+        'input_size': (rgb.shape[1], rgb.shape[0]),
+        'working_size': (w, h),
+        'output_size': (output.shape[1], output.shape[0]),
+        'outscale': round(outscale, 3),
+        'tile': tile,
+    })
+    return output
+
+
+def enhance_image(image, upsampler_instance, force_run: bool = False, stats: dict = None):
+    """
+    Runs Real-ESRGAN inference. Returns the enhanced image or the original input.
     Added 'force_run' flag to bypass quality check during development/testing.
+
+    A DecodedImage input returns a new DecodedImage (no PNG round-trip);
+    raw bytes input returns PNG bytes as before.
+
+    get_enhance_mode() selects the full 4x pass or the size-capped tiled pass.
+    If `stats` is given it is filled with the mode, wall time and peak RSS of the call
+    (plus peak CUDA memory on GPU). CUDA peak counters are device-wide, so on
+    GPU enhancements are serialized from the counter reset to the read;
+    classifier batches running on the same device meanwhile are included.
     """
     
     if not upsampler_instance:
         print("Error: Enhancer model instance is missing.")
-        return image_bytes
+        return image
 
-    if not force_run and not check_image_quality(image_bytes):
+    try:
+        decoded = DecodedImage.coerce(image)
+    except Exception as e:
+        print(f"Could not decode image for enhancement: {e}. Returning original image.")
+        return image
+
+    if not force_run and not check_image_quality(decoded):
         print("Enhancement skipped based on quality check.")
-        return image_bytes
+        return image
 
     # --- If force_run=True OR check_image_quality=True, the code proceeds here ---
-    print(f"--- Running Enhancement (Scale: {SCALE_FACTOR}x) ---")
+    stats = {} if stats is None else stats
+    enhance_mode = get_enhance_mode()
+    stats['mode'] = enhance_mode
+    print(f"--- Running Enhancement (Mode: {enhance_mode}, Scale: up to {SCALE_FACTOR}x) ---")
     
     try:
-        # 1. Decode image_bytes to NumPy array
-        img = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-        img_np = np.array(img)
-        
-        # 2. Run Inference
-        output, _ = upsampler_instance.enhance(img_np, outscale=SCALE_FACTOR)
-        
-        # 3. Convert enhanced output (NumPy array) back to PNG bytes
-        enhanced_pil = Image.fromarray(output)
-        enhanced_buffer = io.BytesIO()
-        enhanced_pil.save(enhanced_buffer, format="PNG")
+        torch = loaded_module('torch')
+        on_cuda = torch is not None and torch_device().type == 'cuda'
+
+        # 1. Run Inference on the already-decoded RGB array
+        start_time = time.perf_counter()
+        # Another enhancement must not reset the device-wide peak between our reset and read
+        with _enhance_lock if on_cuda else nullcontext():
+            if on_cuda:
+                torch.cuda.reset_peak_memory_stats()
+                cuda_start = torch.cuda.memory_allocated()
+            with _PeakRSSSampler() as memory:
+                if enhance_mode == 'capped':
+                    output = _enhance_capped(decoded.rgb, upsampler_instance, stats)
+                else:
+                    output, _ = upsampler_instance.enhance(decoded.rgb, outscale=SCALE_FACTOR)
+            if on_cuda:
+                cuda_peak = torch.cuda.max_memory_allocated()
+                stats['cuda_peak_mb'] = round(cuda_peak / 2**20, 1)
+                stats['cuda_peak_delta_mb'] = round((cuda_peak - cuda_start) / 2**20, 1)
+        enhanced = DecodedImage(output)
+
+        stats['wall_time_s'] = round(time.perf_counter() - start_time, 3)
+        stats['peak_rss_mb'] = round(memory.peak_rss / 2**20, 1)
+        stats['peak_rss_delta_mb'] = round((memory.peak_rss - memory.start_rss) / 2**20, 1)
         
-        print("Enhancement complete.")
-        return enhanced_buffer.getvalue()
+        print(f"Enhancement complete. {stats}")
+        # 2. Only legacy bytes callers pay for a PNG encode
+        if isinstance(image, DecodedImage):
+            return enhanced
+        return enhanced.to_bytes("PNG")
         
     except Exception as e:
         print(f"Real-ESRGAN inference failed at runtime: {e}. Returning original image.")
-        return image_bytes
\ No newline at end of file
+        return image
@@ -0,0 +1,169 @@
+"""
+CropGuard AI - Grad-CAM Heatmaps
+Class-activation heatmaps for the MobileNetV3 classifier: which parts of
+the leaf drove the predicted disease.
+
+Grad-CAM needs a backward pass, so it is never part of a normal
+prediction. It runs only when the client asks for it (gradcam=1), and
+concurrent requests are batched into one forward + backward pass, like
+predictions are. A forward hook on the last conv block captures its
+activations; the gradient of the target class scores is taken with
+respect to those activations only, so autograd walks back through the
+classifier head and stops there instead of differentiating the whole
+network. Overlays are small JPEGs and are cached with the prediction, by
+image hash, so repeat views never recompute.
+
+Quantized, TorchScript and ONNX models cannot be differentiated; with
+those backends (or the worker pool) a separate eager fp32 copy of the same
+weights is loaded on the first Grad-CAM request.
+"""
+
+import base64
+import os
+import threading
+from concurrent.futures import Future
+
+import numpy as np
+
+from app.services.imaging import DecodedImage
+from app.services.lazy_imports import torch_device
+from app.services.prediction import MODEL_WEIGHTS_PATH, InferenceBatcher, load_mobilenet_model
+
+# ==========================================================
+# CONFIG
+# ==========================================================
+GRADCAM_MAX_BATCH_SIZE = int(os.getenv("GRADCAM_MAX_BATCH_SIZE", "8"))
+GRADCAM_MAX_WAIT_MS = float(os.getenv("GRADCAM_MAX_WAIT_MS", "10"))
+# Side of the square overlay image sent to the client, in pixels
+GRADCAM_SIZE = int(os.getenv("GRADCAM_SIZE", "224"))
+GRADCAM_ALPHA = float(os.getenv("GRADCAM_ALPHA", "0.4"))
+GRADCAM_JPEG_QUALITY = int(os.getenv("GRADCAM_JPEG_QUALITY", "80"))
+
+
+class GradCam:
+    """
+    Grad-CAM on an eager MobileNetV3 (any module whose `features[-1]` is
+    the last conv block):
+
+        engine = GradCam(model)
+        heatmaps = engine(batch_tensor, class_indices)   # (N, 7, 7) in [0, 1]
+
+    The model may be shared with the prediction batcher: the hook only
+    records activations on the thread that is computing a heatmap, and no
+    parameter gradients are accumulated.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.weights_version = getattr(model, "weights_version", None)
+        self._local = threading.local()
+        self._hook = model.features[-1].register_forward_hook(self._capture)
+
+    def _capture(self, module, inputs, output):
+        if getattr(self._local, "capture", False):
+            self._local.activations = output
+
+    def __call__(self, image_tensors, class_indices) -> np.ndarray:
+        import torch
+
+        if isinstance(image_tensors, np.ndarray):
+            image_tensors = torch.from_numpy(image_tensors)
+        inputs = image_tensors.to(torch_device())
+        targets = torch.as_tensor(list(class_indices), device=inputs.device)
+
+        self._local.capture = True
+        try:
+            with torch.enable_grad():
+                logits = self.model(inputs)
+                activations = self._local.activations
+                score = logits[torch.arange(len(targets), device=inputs.device), targets].sum()
+                gradients, = torch.autograd.grad(score, activations)
+        finally:
+            self._local.capture = False
+            self._local.activations = None
+
+        with torch.no_grad():
+            weights = gradients.mean(dim=(2, 3), keepdim=True)
+            cams = torch.relu((weights * activations).sum(dim=1))
+            peaks = cams.flatten(1).max(dim=1).values
+            cams = cams / torch.where(peaks > 0, peaks, torch.ones_like(peaks))[:, None, None]
+        return cams.cpu().numpy()
+
+    def close(self):
+        self._hook.remove()
+
+
+def load_gradcam_engine(model=None, weights_path: str = MODEL_WEIGHTS_PATH) -> GradCam:
+    """
+    Grad-CAM engine sharing `model` when it is an eager PyTorch model,
+    otherwise on its own eager fp32 copy of `weights_path`.
+    """
+    if getattr(model, "backend", None) != "eager" or not hasattr(model, "features"):
+        model = load_mobilenet_model(getattr(model, "weights_path", weights_path), backend="eager")
+    return GradCam(model)
+
+
+class GradCamBatcher(InferenceBatcher):
+    """
+    Micro-batches Grad-CAM requests from concurrent callers into one
+    forward + backward pass:
+
+        heatmap = batcher.predict(decoded_image, class_index)
+        overlay = render_overlay(decoded_image, heatmap)
+    """
+
+    def __init__(self, engine: GradCam, max_batch_size: int = GRADCAM_MAX_BATCH_SIZE,
+                 max_wait_ms: float = GRADCAM_MAX_WAIT_MS):
+        super().__init__(engine, max_batch_size, max_wait_ms)
+
+    def submit(self, image, class_index: int) -> Future:
+        if self._closed:
+            raise RuntimeError("GradCamBatcher is closed")
+        decoded = DecodedImage.coerce(image)
+        decoded.resized  # resize in the request thread, not the batch worker
+        future = Future()
+        self._queue.put(((decoded, class_index), future))
+        return future
+
+    def predict(self, image, class_index: int, timeout: float = None) -> np.ndarray:
+        """Submit an image and wait for its heatmap."""
+        return self.submit(image, class_index).result(timeout=timeout)
+
+    def _run_batch(self, batch):
+        batch = [(item, f) for item, f in batch if f.set_running_or_notify_cancel()]
+        if not batch:
+            return
+
+        try:
+            images = [image for (image, _), _ in batch]
+            heatmaps = self.model(self._preprocessor(images), [index for (_, index), _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        for (_, future), heatmap in zip(batch, heatmaps):
+            future.set_result(heatmap)
+
+
+# ==========================================================
+# RENDERING
+# ==========================================================
+def render_overlay(image, heatmap: np.ndarray, size: int = GRADCAM_SIZE,
+                   alpha: float = GRADCAM_ALPHA, quality: int = GRADCAM_JPEG_QUALITY) -> str:
+    """
+    Blend a JET-colored heatmap over the (224x224) model input and return
+    it as a base64 JPEG (around 10 KB).
+    """
+    import cv2
+
+    base = cv2.cvtColor(DecodedImage.coerce(image).resized, cv2.COLOR_RGB2BGR)
+    if base.shape[:2] != (size, size):
+        base = cv2.resize(base, (size, size), interpolation=cv2.INTER_AREA)
+    heat = cv2.resize(heatmap.astype(np.float32), (size, size), interpolation=cv2.INTER_CUBIC)
+    heat = cv2.applyColorMap(np.clip(heat * 255, 0, 255).astype(np.uint8), cv2.COLORMAP_JET)
+    overlay = cv2.addWeighted(base, 1.0 - alpha, heat, alpha, 0)
+    ok, encoded = cv2.imencode(".jpg", overlay, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise RuntimeError("Grad-CAM overlay encoding failed")
+    return base64.b64encode(encoded.tobytes()).decode("ascii")
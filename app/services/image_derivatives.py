@@ -0,0 +1,172 @@
+"""
+CropGuard AI - Responsive Image Derivatives
+Resized and re-encoded copies (AVIF / WebP / the original format at a few
+widths) of the frontend images, so a phone showing a 120px team photo does
+not download a 2.6 MB JPEG.
+
+Derivatives are cached on disk under the asset build directory, keyed by
+the source's content hash, width and format, so they survive restarts and
+are never stale. A cache hit is just a stat(). Misses are generated by a
+small thread pool (Pillow releases the GIL while resizing and encoding);
+the request waits briefly for its own derivative and otherwise gets the
+original image, uncached, while generation finishes in the background.
+
+Served through /assets/images/<name>.<hash>.<ext>?w=<width>; the format
+follows the request's Accept header (AVIF, then WebP, then the original).
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, features
+
+from app.services.lazy_imports import optional_import
+
+# ==========================================================
+# CONFIG
+# ==========================================================
+DERIVATIVE_WIDTHS = sorted(
+    int(width) for width in os.getenv("IMAGE_DERIVATIVE_WIDTHS", "160,320,640,960,1280,1920").split(",") if width
+)
+DERIVATIVE_WORKERS = int(os.getenv("IMAGE_DERIVATIVE_WORKERS", "2"))
+# How long a request waits for its own derivative on a cache miss
+DERIVATIVE_WAIT_SECONDS = float(os.getenv("IMAGE_DERIVATIVE_WAIT_SECONDS", "2"))
+# Generate every derivative in the background at startup instead of on first request
+DERIVATIVE_PREGENERATE = os.getenv("IMAGE_DERIVATIVE_PREGENERATE", "false").lower() == "true"
+WEBP_QUALITY = 80
+AVIF_QUALITY = 60
+JPEG_QUALITY = 82
+
+MIMETYPES = {"avif": "image/avif", "webp": "image/webp", "jpeg": "image/jpeg", "png": "image/png"}
+SAVE_OPTIONS = {
+    "avif": {"quality": AVIF_QUALITY},
+    "webp": {"quality": WEBP_QUALITY, "method": 4},
+    "jpeg": {"quality": JPEG_QUALITY, "optimize": True, "progressive": True},
+    "png": {"optimize": True},
+}
+
+
+def supported_formats() -> list:
+    """Modern formats this Pillow build can encode, best first."""
+    optional_import("pillow_avif")  # registers AVIF on Pillow < 11.3
+    formats = []
+    for name in ("avif", "webp"):
+        try:
+            available = features.check(name) or name.upper() in Image.SAVE
+        except ValueError:  # feature unknown to this Pillow version
+            available = name.upper() in Image.SAVE
+        if available:
+            formats.append(name)
+    return formats
+
+
+def snap_width(requested: int, source_width: int) -> int:
+    """Smallest configured width >= `requested`, never wider than the source."""
+    for width in DERIVATIVE_WIDTHS:
+        if width >= requested:
+            return min(width, source_width)
+    return min(DERIVATIVE_WIDTHS[-1] if DERIVATIVE_WIDTHS else source_width, source_width)
+
+
+class ImageDerivatives:
+    """
+    Disk cache + generator for resized / re-encoded images:
+
+        derivatives = ImageDerivatives(cache_dir)
+        fmt = derivatives.choose_format(request.accept_mimetypes, 'jpeg')
+        path = derivatives.get(source_path, digest, width, fmt)   # None: not ready yet
+    """
+
+    def __init__(self, cache_dir: str, workers: int = DERIVATIVE_WORKERS):
+        self.cache_dir = cache_dir
+        self.formats = supported_formats()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="image-derivative")
+        self._pending = {}  # path -> Future
+        self._source_widths = {}  # digest -> width
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def original_format(path: str) -> str:
+        ext = os.path.splitext(path)[1].lower()
+        return "jpeg" if ext in (".jpg", ".jpeg") else "png" if ext == ".png" else None
+
+    def choose_format(self, accept_mimetypes, original: str) -> str:
+        for fmt in self.formats:
+            if accept_mimetypes.quality(MIMETYPES[fmt]) > 0 and MIMETYPES[fmt] in accept_mimetypes.values():
+                return fmt
+        return original
+
+    def source_width(self, source_path: str, digest: str) -> int:
+        width = self._source_widths.get(digest)
+        if width is None:
+            with Image.open(source_path) as img:  # reads the header only
+                width = self._source_widths[digest] = img.width
+        return width
+
+    def path(self, digest: str, width: int, fmt: str) -> str:
+        return os.path.join(self.cache_dir, f"{digest}-{width}w.{fmt}")
+
+    def get(self, source_path: str, digest: str, width: int, fmt: str, wait: float = DERIVATIVE_WAIT_SECONDS):
+        """Path of the derivative, generating it on a miss; None if not ready within `wait`."""
+        path = self.path(digest, width, fmt)
+        if os.path.exists(path):
+            return path
+        future = self.schedule(source_path, digest, width, fmt)
+        try:
+            future.result(timeout=wait)
+        except Exception:
+            return None  # still running, or failed (logged by _generate)
+        return path if os.path.exists(path) else None
+
+    def schedule(self, source_path: str, digest: str, width: int, fmt: str):
+        """Queue generation of one derivative (deduplicated); returns its Future."""
+        path = self.path(digest, width, fmt)
+        with self._lock:
+            future = self._pending.get(path)
+            if future is None:
+                future = self._pending[path] = self._executor.submit(self._generate, source_path, path, width, fmt)
+                future.add_done_callback(lambda _: self._forget(path))
+        return future
+
+    def _forget(self, path: str):
+        with self._lock:
+            self._pending.pop(path, None)
+
+    def _generate(self, source_path: str, path: str, width: int, fmt: str):
+        try:
+            with Image.open(source_path) as img:
+                img.draft("RGB", (width, width * img.height // max(1, img.width)))  # JPEG DCT scaling
+                if img.width > width:
+                    img = img.resize((width, max(1, round(img.height * width / img.width))), Image.LANCZOS)
+                if fmt == "jpeg" and img.mode not in ("RGB", "L"):
+                    img = img.convert("RGB")
+                elif fmt in ("webp", "avif") and img.mode not in ("RGB", "RGBA"):
+                    img = img.convert("RGBA" if "transparency" in img.info or img.mode in ("LA", "PA") else "RGB")
+                os.makedirs(self.cache_dir, exist_ok=True)
+                tmp_path = f"{path}.{threading.get_ident()}.tmp"
+                img.save(tmp_path, format=fmt.upper(), **SAVE_OPTIONS[fmt])
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"⚠️ Image derivative {os.path.basename(path)} failed: {e}")
+            raise
+
+    def pregenerate(self, sources) -> list:
+        """
+        Queue every width x format for `sources` ((path, digest) pairs) and
+        return the Futures; used at build time.
+        """
+        futures = []
+        for source_path, digest in sources:
+            original = self.original_format(source_path)
+            if original is None:
+                continue
+            source_width = self.source_width(source_path, digest)
+            widths = sorted({snap_width(width, source_width) for width in DERIVATIVE_WIDTHS})
+            for width in widths:
+                for fmt in self.formats + [original]:
+                    if fmt == original and width == source_width:
+                        continue  # that is the source itself
+                    if not os.path.exists(self.path(digest, width, fmt)):
+                        futures.append(self.schedule(source_path, digest, width, fmt))
+        return futures
@@ -0,0 +1,314 @@
+"""
+CropGuard AI - Decoded Image Pipeline
+An upload is decoded once into a DecodedImage; the blur check, the enhancer
+and the classifier all read the views they need from that one object.
+
+OpenCV is imported on first use. Batches come out as torch tensors once a
+PyTorch model has been loaded (which imports torch) and as float32
+ndarrays otherwise, e.g. on the ONNX Runtime backend.
+"""
+
+import io
+import os
+import threading
+from contextlib import contextmanager
+from functools import cached_property, lru_cache
+
+import numpy as np
+from PIL import Image
+
+from app.services.lazy_imports import loaded_module
+
+# ==========================================================
+# CONFIG
+# ==========================================================
+INPUT_SIZE = 224
+NORMALIZE_MEAN = [0.485, 0.456, 0.406]
+NORMALIZE_STD = [0.229, 0.224, 0.225]
+
+# Longest side of the grayscale thumbnail used by the blur check
+THUMBNAIL_MAX_SIDE = int(os.getenv("BLUR_THUMBNAIL_MAX_SIDE", "512"))
+
+# Built once at import: mean/std scaled to the uint8 range so normalization
+# is a single subtract + divide over the whole batch
+_MEAN_255 = np.array(NORMALIZE_MEAN, dtype=np.float32).reshape(1, 3, 1, 1) * 255.0
+_STD_255 = np.array(NORMALIZE_STD, dtype=np.float32).reshape(1, 3, 1, 1) * 255.0
+
+
+@lru_cache(maxsize=None)
+def _torch_mean_std():
+    torch = loaded_module("torch")
+    return torch.from_numpy(_MEAN_255), torch.from_numpy(_STD_255)
+
+
+def resize_for_model(rgb: np.ndarray, size: int = INPUT_SIZE, out: np.ndarray = None) -> np.ndarray:
+    """Resize an (H, W, 3) uint8 array to (size, size, 3), optionally in place into `out`."""
+    import cv2
+
+    h, w = rgb.shape[:2]
+    if (h, w) == (size, size):
+        if out is None:
+            return rgb
+        out[...] = rgb
+        return out
+    # INTER_AREA antialiases when shrinking; bilinear when enlarging small crops
+    interpolation = cv2.INTER_AREA if h > size or w > size else cv2.INTER_LINEAR
+    return cv2.resize(rgb, (size, size), dst=out, interpolation=interpolation)
+
+
+def normalize_batch(batch_hwc: np.ndarray, out=None):
+    """
+    Convert an (N, H, W, 3) uint8 array into an (N, 3, H, W) normalized
+    float tensor in one vectorized pass. Writes into `out` when given.
+    Without a loaded PyTorch (or with an ndarray `out`) the result is a
+    float32 ndarray instead.
+    """
+    torch = loaded_module("torch")
+    if torch is None or isinstance(out, np.ndarray):
+        src = batch_hwc.transpose(0, 3, 1, 2)
+        if out is None:
+            out = np.empty(src.shape, dtype=np.float32)
+        np.subtract(src, _MEAN_255, out=out)
+        out /= _STD_255
+        return out
+
+    mean, std = _torch_mean_std()
+    src = torch.from_numpy(batch_hwc).permute(0, 3, 1, 2)
+    if out is None:
+        out = torch.empty(src.shape, dtype=torch.float32)
+    out.copy_(src)
+    out.sub_(mean).div_(std)
+    return out
+
+
+# ==========================================================
+# DECODED IMAGE
+# ==========================================================
+class InvalidImageError(ValueError):
+    """The upload's header parsed but its pixels cannot be decoded (e.g. truncated)."""
+
+
+def _thumbnail_size(width: int, height: int, max_side: int):
+    scale = min(1.0, max_side / max(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+class DecodedImage:
+    """
+    RGB image decoded once from an upload.
+
+    `rgb` is an (H, W, 3) uint8 array. For uploads it is decoded from `data`
+    on first access, so a cheap view such as `thumbnail_gray` can be read
+    without ever paying for the full-resolution decode. `gray`, `resized`,
+    `tensor` and `thumbnail_gray` are likewise derived lazily and cached for
+    the lifetime of the object.
+
+    Because pixels are decoded lazily, a damaged upload only fails when a
+    view is first read; the views raise InvalidImageError in that case.
+    `data` keeps the original encoded bytes when the image came from an upload.
+    """
+
+    def __init__(self, rgb: np.ndarray = None, data: bytes = None):
+        if rgb is None and data is None:
+            raise ValueError("DecodedImage needs pixels or encoded data")
+        if rgb is not None:
+            self.__dict__["rgb"] = rgb
+            self._size = (rgb.shape[1], rgb.shape[0])
+        self.data = data
+        self.format = None
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "DecodedImage":
+        """Validate the header now; pixels are decoded on first use of `rgb`."""
+        with Image.open(io.BytesIO(data)) as img:
+            size, image_format = img.size, img.format
+        image = cls(data=data)
+        image._size = size
+        image.format = image_format
+        return image
+
+    @classmethod
+    def from_path(cls, path: str) -> "DecodedImage":
+        with open(path, "rb") as f:
+            return cls.from_bytes(f.read())
+
+    @classmethod
+    def from_pil(cls, img: Image.Image) -> "DecodedImage":
+        return cls(np.asarray(img.convert("RGB")))
+
+    @classmethod
+    def coerce(cls, image) -> "DecodedImage":
+        """Accept a DecodedImage, raw bytes, a file path or a PIL image."""
+        if isinstance(image, DecodedImage):
+            return image
+        if isinstance(image, (bytes, bytearray)):
+            return cls.from_bytes(bytes(image))
+        if isinstance(image, str):
+            return cls.from_path(image)
+        if isinstance(image, Image.Image):
+            return cls.from_pil(image)
+        raise TypeError(f"Unsupported image type: {type(image).__name__}")
+
+    @property
+    def width(self) -> int:
+        return self._size[0]
+
+    @property
+    def height(self) -> int:
+        return self._size[1]
+
+    @property
+    def is_decoded(self) -> bool:
+        return "rgb" in self.__dict__
+
+    @cached_property
+    def rgb(self) -> np.ndarray:
+        # OpenCV decodes straight into an ndarray, skipping PIL's buffer copy;
+        # orientation is ignored to match what PIL returns
+        import cv2
+
+        buffer = np.frombuffer(self.data, dtype=np.uint8)
+        bgr = cv2.imdecode(buffer, cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION)
+        if bgr is not None:
+            return cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
+        try:
+            return np.asarray(Image.open(io.BytesIO(self.data)).convert("RGB"))
+        except (OSError, ValueError) as e:
+            raise InvalidImageError(f"Cannot decode image: {e}") from e
+
+    @cached_property
+    def gray(self) -> np.ndarray:
+        """(H, W) uint8 luma, same coefficients as PIL's convert('L')."""
+        import cv2
+
+        return cv2.cvtColor(self.rgb, cv2.COLOR_RGB2GRAY)
+
+    @cached_property
+    def thumbnail_gray(self) -> np.ndarray:
+        """
+        Grayscale copy with its longest side at most THUMBNAIL_MAX_SIDE.
+        JPEGs that have not been fully decoded yet use PIL's draft() mode,
+        which downscales in the DCT domain while decoding.
+        """
+        import cv2
+
+        size = _thumbnail_size(self.width, self.height, THUMBNAIL_MAX_SIDE)
+
+        if not self.is_decoded and self.format == "JPEG":
+            try:
+                with Image.open(io.BytesIO(self.data)) as img:
+                    img.draft("L", size)
+                    small = np.asarray(img.convert("L"))
+            except (OSError, ValueError) as e:
+                raise InvalidImageError(f"Cannot decode image: {e}") from e
+        elif "gray" in self.__dict__:
+            small = self.gray
+        else:
+            # Shrink first so the color conversion runs on the small copy
+            small = cv2.cvtColor(
+                cv2.resize(self.rgb, size, interpolation=cv2.INTER_AREA),
+                cv2.COLOR_RGB2GRAY
+            )
+
+        if (small.shape[1], small.shape[0]) != size:
+            small = cv2.resize(small, size, interpolation=cv2.INTER_AREA)
+        return small
+
+    @cached_property
+    def resized(self) -> np.ndarray:
+        """(224, 224, 3) uint8 copy at the classifier's input size."""
+        return resize_for_model(self.rgb)
+
+    @cached_property
+    def tensor(self):
+        """(3, 224, 224) normalized float tensor for the classifier."""
+        return normalize_batch(self.resized[None])[0]
+
+    def to_pil(self) -> Image.Image:
+        return Image.fromarray(self.rgb)
+
+    def to_bytes(self, format: str = "PNG") -> bytes:
+        """Encode the RGB pixels, e.g. for saving an enhanced result."""
+        buffer = io.BytesIO()
+        self.to_pil().save(buffer, format=format)
+        return buffer.getvalue()
+
+
+# ==========================================================
+# BATCH PREPROCESSING ENGINE
+# ==========================================================
+class BatchPreprocessor:
+    """
+    Turns a list of images into one (N, 3, 224, 224) normalized tensor
+    (a float32 ndarray while PyTorch is not loaded).
+
+    Images are resized into a reusable uint8 staging array and normalized
+    into a preallocated float buffer (pinned when CUDA is available), so
+    repeated batches allocate nothing per photo. The buffers are allocated
+    on the first call and grow to the largest batch seen.
+
+    The returned tensor is a view into the shared buffer and is only valid
+    until the next call; callers that keep it must clone it. An engine
+    shared between threads should be used through `batch()`, which keeps
+    the buffer reserved until inference is done:
+
+        with engine.batch(images) as tensor:
+            outputs = model(tensor)
+    """
+
+    def __init__(self, capacity: int = 16, size: int = INPUT_SIZE, pin_memory: bool = None):
+        self.size = size
+        self.pin_memory = pin_memory
+        self._lock = threading.Lock()
+        self._initial_capacity = max(1, capacity)
+        self._capacity = 0
+        self._buffer = None
+
+    def _allocate(self, capacity: int, torch):
+        self._staging = np.empty((capacity, self.size, self.size, 3), dtype=np.uint8)
+        if torch is None:
+            self._buffer = np.empty((capacity, 3, self.size, self.size), dtype=np.float32)
+        else:
+            if self.pin_memory is None:
+                self.pin_memory = torch.cuda.is_available()
+            self._buffer = torch.empty(
+                (capacity, 3, self.size, self.size),
+                dtype=torch.float32,
+                pin_memory=self.pin_memory
+            )
+        self._capacity = capacity
+
+    def __call__(self, images):
+        """
+        `images` may mix DecodedImage objects, raw bytes, paths, PIL images
+        or (H, W, 3) uint8 arrays.
+        """
+        with self._lock:
+            return self._fill(images)
+
+    @contextmanager
+    def batch(self, images):
+        """Like calling the engine, but other calls wait until the block exits."""
+        with self._lock:
+            yield self._fill(images)
+
+    def _fill(self, images):
+        n = len(images)
+        torch = loaded_module("torch")
+        # Switch to a tensor buffer once a PyTorch model has been loaded
+        if n > self._capacity or isinstance(self._buffer, np.ndarray) != (torch is None):
+            self._allocate(max(n, self._capacity * 2, self._initial_capacity), torch)
+
+        staging = self._staging[:n]
+        for i, image in enumerate(images):
+            if isinstance(image, np.ndarray):
+                resize_for_model(image, self.size, out=staging[i])
+            else:
+                decoded = DecodedImage.coerce(image)
+                # Reuse a resize already done in the request thread
+                if "resized" in decoded.__dict__ and self.size == INPUT_SIZE:
+                    staging[i] = decoded.resized
+                else:
+                    resize_for_model(decoded.rgb, self.size, out=staging[i])
+
+        return normalize_batch(staging, out=self._buffer[:n])
@@ -0,0 +1,40 @@
+"""
+CropGuard AI - Lazy Imports
+PyTorch, torchvision, OpenCV, Real-ESRGAN and the OpenAI client cost
+seconds and hundreds of MB to import. The service modules import them on
+first use through these helpers, so a web worker that only serves pages
+(or has not received its first prediction yet) never loads them.
+"""
+
+import importlib
+import importlib.util
+import sys
+from functools import lru_cache
+
+
+def is_installed(name: str) -> bool:
+    """Check whether a top-level package is installed, without importing it."""
+    return importlib.util.find_spec(name) is not None
+
+
+@lru_cache(maxsize=None)
+def optional_import(name: str):
+    """Import and return a module, or None if it (or a dependency) is not installed."""
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        return None
+
+
+def loaded_module(name: str):
+    """The module if something already imported it, else None. Never imports."""
+    return sys.modules.get(name)
+
+
+@lru_cache(maxsize=None)
+def torch_device():
+    """torch.device('cuda') or torch.device('cpu'); None without PyTorch."""
+    torch = optional_import("torch")
+    if torch is None:
+        return None
+    return torch.device("cuda" if torch.cuda.is_available() else "cpu")
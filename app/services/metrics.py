@@ -0,0 +1,290 @@
+"""
+CropGuard AI - Metrics
+Counters, gauges and histograms for the request pipeline, exported at
+/metrics in the Prometheus text format (no client library needed).
+
+Each pipeline stage is timed with `stage()`:
+
+    with stage('blur_check'):
+        is_blurry = check_image_quality(image)
+
+which records into the `cropguard_stage_duration_seconds` histogram and,
+inside a request, adds an entry to that response's Server-Timing header
+(visible in the browser's network panel). Streamed responses send their
+headers before the streamed stages run, so those stages only reach the
+histogram.
+"""
+
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+# ==========================================================
+# CONFIG
+# ==========================================================
+METRIC_PREFIX = "cropguard_"
+# Request methods kept as labels; anything else a client sends is "other"
+KNOWN_METHODS = frozenset(("GET", "POST", "PUT", "DELETE", "PATCH", "HEAD", "OPTIONS"))
+# Seconds; spans a cached hit (~1 ms) to a slow LLM answer
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric:
+    type_name = None
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = METRIC_PREFIX + name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(labels[name] for name in self.labelnames)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    """Monotonic count, e.g. requests or errors."""
+
+    type_name = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """
+    Value that goes up and down. `set_function` makes it read a callback at
+    scrape time instead (e.g. a queue length).
+    """
+
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._function = None
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def set_function(self, function):
+        self._function = function
+
+    @contextmanager
+    def track_inprogress(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def render(self) -> list:
+        if self._function is not None:
+            try:
+                self.set(self._function())
+            except Exception:
+                pass  # a broken callback must not break the scrape
+        return super().render()
+
+
+class Histogram(_Metric):
+    """Distribution of observed values in cumulative buckets, plus sum and count."""
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0] * len(self.buckets) + [0.0]  # bucket counts..., sum
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            counts[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        with self._lock:
+            items = sorted((key, list(counts)) for key, counts in self._values.items())
+        for key, counts in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(counts[-1])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    """All metrics of the process, rendered together for /metrics."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is already registered as a {metric.type_name}")
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames=()) -> Counter:
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames=()) -> Gauge:
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+histogram = REGISTRY.histogram
+
+# ==========================================================
+# PIPELINE METRICS
+# ==========================================================
+STAGE_SECONDS = histogram("stage_duration_seconds", "Time spent in each pipeline stage.", ("stage",))
+REQUEST_SECONDS = histogram("http_request_duration_seconds", "Request handling time.", ("endpoint", "method"))
+REQUESTS = counter("http_requests_total", "Requests handled.", ("endpoint", "method", "status"))
+IN_FLIGHT = gauge("http_requests_in_flight", "Requests currently being handled.", ("endpoint",))
+
+
+def record_server_timing(name: str, seconds: float):
+    """Add an entry to the current response's Server-Timing header, if inside a request."""
+    from flask import g, has_request_context
+
+    if has_request_context():
+        g.setdefault("server_timing", []).append((name, seconds))
+
+
+@contextmanager
+def stage(name: str):
+    """Time one pipeline stage (histogram + Server-Timing)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=name)
+        record_server_timing(name, elapsed)
+
+
+def server_timing_header(entries, total: float = None) -> str:
+    """Server-Timing value; repeated stages (e.g. one per batch chunk) are summed."""
+    durations = {}
+    for name, seconds in entries:
+        durations[name] = durations.get(name, 0.0) + seconds
+    parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in durations.items()]
+    if total is not None:
+        parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+def init_app(app):
+    """Request counters, latency histogram, in-flight gauge and the Server-Timing header."""
+    from flask import g, request
+
+    def endpoint_label():
+        return request.url_rule.rule if request.url_rule is not None else "unmatched"
+
+    def method_label():
+        # Arbitrary client verbs must not create new label series
+        return request.method if request.method in KNOWN_METHODS else "other"
+
+    @app.before_request
+    def _start_request_metrics():
+        g.metrics_start = time.perf_counter()
+        g.metrics_endpoint = endpoint_label()
+        IN_FLIGHT.inc(endpoint=g.metrics_endpoint)
+
+    @app.after_request
+    def _finish_request_metrics(response):
+        start = g.pop("metrics_start", None)
+        endpoint = g.pop("metrics_endpoint", None)
+        if start is None:
+            return response
+        elapsed = time.perf_counter() - start
+        IN_FLIGHT.dec(endpoint=endpoint)
+        REQUEST_SECONDS.observe(elapsed, endpoint=endpoint, method=method_label())
+        REQUESTS.inc(endpoint=endpoint, method=method_label(), status=str(response.status_code))
+        response.headers["Server-Timing"] = server_timing_header(g.pop("server_timing", []), elapsed)
+        return response
+
+    @app.teardown_request
+    def _abandoned_request_metrics(error):
+        # after_request is skipped when a view raises; still release the gauge
+        endpoint = g.pop("metrics_endpoint", None)
+        if endpoint is not None and g.pop("metrics_start", None) is not None:
+            IN_FLIGHT.dec(endpoint=endpoint)
+            REQUESTS.inc(endpoint=endpoint, method=method_label(), status="500")
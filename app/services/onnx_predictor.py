@@ -0,0 +1,176 @@
+"""
+CropGuard AI - ONNX Runtime Classifier
+Runs the MobileNetV3 disease classifier with ONNX Runtime, so edge servers
+can serve predictions without installing PyTorch. Selected with
+PREDICT_BACKEND=onnx; load_mobilenet_model then returns an OnnxPredictor
+and predict_disease / predict_batch keep their result contract.
+
+USAGE:
+    # Export (needs PyTorch + onnx, run once wherever the .pth lives)
+    python -m app.services.onnx_predictor export --weights mobilenetv3_best.pth --output mobilenetv3_best.onnx
+
+    # Compare ONNX Runtime logits with the PyTorch model
+    python -m app.services.onnx_predictor parity --weights mobilenetv3_best.pth --onnx mobilenetv3_best.onnx
+"""
+
+import os
+
+import numpy as np
+
+from app.services.cache import hash_file
+
+# ==========================================================
+# CONFIG
+# ==========================================================
+ONNX_OPSET = 17
+ONNX_INPUT_NAME = "input"
+ONNX_OUTPUT_NAME = "logits"
+# 0 lets ONNX Runtime pick the thread count
+ONNX_INTRA_OP_THREADS = int(os.getenv("ONNX_INTRA_OP_THREADS", "0"))
+PARITY_ATOL = 1e-3
+
+
+def default_onnx_path(weights_path: str) -> str:
+    """mobilenetv3_best.pth -> mobilenetv3_best.onnx, unless PREDICT_ONNX_PATH is set."""
+    return os.getenv("PREDICT_ONNX_PATH") or os.path.splitext(weights_path)[0] + ".onnx"
+
+
+# ==========================================================
+# EXPORT
+# ==========================================================
+def export_onnx(weights_path: str = "mobilenetv3_best.pth", output_path: str = None,
+                opset: int = ONNX_OPSET) -> str:
+    """
+    Export the eager fp32 model to ONNX with a dynamic batch dimension.
+    The weights hash is stored in the model metadata so the ONNX backend
+    shares prediction cache versioning with the .pth it came from.
+    """
+    import onnx
+    import torch
+    from app.services.prediction import load_mobilenet_model
+
+    output_path = output_path or default_onnx_path(weights_path)
+    model = load_mobilenet_model(weights_path, backend="eager").cpu()
+    example = torch.zeros(1, 3, 224, 224)
+
+    torch.onnx.export(
+        model, example, output_path,
+        input_names=[ONNX_INPUT_NAME],
+        output_names=[ONNX_OUTPUT_NAME],
+        dynamic_axes={ONNX_INPUT_NAME: {0: "batch"}, ONNX_OUTPUT_NAME: {0: "batch"}},
+        opset_version=opset,
+        dynamo=False,
+    )
+
+    exported = onnx.load(output_path)
+    onnx.helper.set_model_props(exported, {"weights_version": model.weights_version})
+    onnx.checker.check_model(exported)
+    onnx.save(exported, output_path)
+    print(f"✅ Exported {weights_path} to {output_path} (opset {opset}, dynamic batch)")
+    return output_path
+
+
+# ==========================================================
+# ONNX RUNTIME PREDICTOR
+# ==========================================================
+class OnnxPredictor:
+    """
+    Callable wrapper around an onnxruntime.InferenceSession: takes an
+    (N, 3, 224, 224) float32 batch (ndarray or CPU tensor) and returns
+    (N, num_classes) logits as an ndarray, like calling the torch model.
+    """
+
+    backend = "onnx"
+
+    def __init__(self, onnx_path: str):
+        import onnxruntime as ort
+
+        if not os.path.exists(onnx_path):
+            raise FileNotFoundError(f"❌ ONNX model not found at: {onnx_path}")
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if ONNX_INTRA_OP_THREADS:
+            options.intra_op_num_threads = ONNX_INTRA_OP_THREADS
+        preferred = ["CUDAExecutionProvider", "CPUExecutionProvider"]
+        providers = [p for p in preferred if p in ort.get_available_providers()]
+
+        self.onnx_path = onnx_path
+        self.session = ort.InferenceSession(onnx_path, sess_options=options, providers=providers)
+        self.input_name = self.session.get_inputs()[0].name
+
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        self.weights_version = f"{metadata.get('weights_version') or hash_file(onnx_path)}-onnx"
+
+    def __call__(self, batch) -> np.ndarray:
+        inputs = np.ascontiguousarray(batch, dtype=np.float32)
+        return self.session.run(None, {self.input_name: inputs})[0]
+
+
+def softmax(logits: np.ndarray) -> np.ndarray:
+    shifted = logits - logits.max(axis=1, keepdims=True)
+    exp = np.exp(shifted)
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+# ==========================================================
+# PARITY CHECK
+# ==========================================================
+def check_parity(weights_path: str = "mobilenetv3_best.pth", onnx_path: str = None,
+                 images_dir: str = None, samples: int = 32, atol: float = PARITY_ATOL) -> dict:
+    """
+    Compare ONNX Runtime logits with the eager PyTorch model on photos from
+    `images_dir` (or random normalized inputs). Raises AssertionError when
+    the largest logit difference exceeds `atol` or top-1 classes differ.
+    """
+    import torch
+    from app.services.imaging import BatchPreprocessor
+    from app.services.prediction import load_calibration_images, load_mobilenet_model
+
+    onnx_path = onnx_path or default_onnx_path(weights_path)
+    model = load_mobilenet_model(weights_path, backend="eager").cpu()
+    predictor = OnnxPredictor(onnx_path)
+
+    if images_dir:
+        images = load_calibration_images(images_dir, samples)
+        inputs = BatchPreprocessor(len(images))(images).clone()
+    else:
+        inputs = torch.randn(samples, 3, 224, 224, generator=torch.Generator().manual_seed(0))
+
+    with torch.no_grad():
+        expected = model(inputs).numpy()
+    actual = predictor(inputs.numpy())
+
+    report = {
+        'samples': len(inputs),
+        'max_abs_logit_diff': float(np.abs(expected - actual).max()),
+        'max_prob_diff': float(np.abs(softmax(expected) - softmax(actual)).max()),
+        'top1_agreement': float(np.mean(expected.argmax(1) == actual.argmax(1))),
+    }
+    print(f"ONNX parity: {report}")
+    assert report['max_abs_logit_diff'] <= atol, f"Logits differ by more than {atol}"
+    assert report['top1_agreement'] == 1.0, "Top-1 predictions differ"
+    return report
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="SmartCropDoc-AI ONNX export and parity check")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser("export", help="Export the .pth classifier to ONNX")
+    export_parser.add_argument("--weights", default="mobilenetv3_best.pth")
+    export_parser.add_argument("--output")
+    export_parser.add_argument("--opset", type=int, default=ONNX_OPSET)
+    parity_parser = subparsers.add_parser("parity", help="Compare ONNX Runtime and PyTorch logits")
+    parity_parser.add_argument("--weights", default="mobilenetv3_best.pth")
+    parity_parser.add_argument("--onnx")
+    parity_parser.add_argument("--images", help="Directory of sample photos (default: random inputs)")
+    parity_parser.add_argument("--samples", type=int, default=32)
+    parity_parser.add_argument("--atol", type=float, default=PARITY_ATOL)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export_onnx(args.weights, args.output, args.opset)
+    elif args.command == "parity":
+        check_parity(args.weights, args.onnx, args.images, args.samples, args.atol)
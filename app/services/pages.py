@@ -0,0 +1,128 @@
+"""
+CropGuard AI - Cached Page Rendering
+The HTML pages in frontend/ only depend on the template file itself, so
+each one is compiled and rendered once and served from memory as bytes,
+with gzip (and brotli, when the `brotli` package is installed) variants
+compressed ahead of time. Responses carry an ETag so browsers revalidate
+with a 304 instead of downloading the page again. There is no
+Last-Modified: a page also changes when the asset manifest it links to is
+rebuilt, which the template's mtime does not reflect, while the ETag is a
+hash of the rendered bytes.
+
+In debug mode (or with PAGE_CACHE_CHECK_MTIME=true) the template file is
+stat()ed on every request and re-rendered when it changes on disk.
+"""
+
+import gzip
+import hashlib
+import os
+import threading
+
+from flask import Response, current_app, request
+
+from app.services.lazy_imports import optional_import
+
+# ==========================================================
+# CONFIG
+# ==========================================================
+# Unset: follow the app's debug flag
+PAGE_CACHE_CHECK_MTIME = os.getenv("PAGE_CACHE_CHECK_MTIME")
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+# Revalidate on every navigation; the ETag makes that a cheap 304
+PAGE_CACHE_CONTROL = "no-cache"
+
+
+class RenderedPage:
+    """One rendered template with its precompressed variants."""
+
+    __slots__ = ("etag", "variants")
+
+    def __init__(self, html: str):
+        body = html.encode("utf-8")
+        self.etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+        self.variants = {"identity": body, "gzip": gzip.compress(body, GZIP_LEVEL, mtime=0)}
+        brotli = optional_import("brotli")
+        if brotli is not None:
+            self.variants["br"] = brotli.compress(body, quality=BROTLI_QUALITY)
+
+
+class PageRenderer:
+    """
+    Compiles each template in `template_dir` once and caches the rendered
+    page per script root (url_for output depends on it) and per `version()`,
+    e.g. the asset manifest version the page's links point at:
+
+        pages = PageRenderer(APP_ROOT / 'frontend')
+        return pages.response('index.html')
+    """
+
+    def __init__(self, template_dir, check_mtime: bool = None, version=None):
+        self.template_dir = str(template_dir)
+        if check_mtime is None and PAGE_CACHE_CHECK_MTIME is not None:
+            check_mtime = PAGE_CACHE_CHECK_MTIME.lower() == "true"
+        self.check_mtime = check_mtime
+        self.version = version
+        self._templates = {}  # filename -> (mtime, compiled template, {(script_root, version): RenderedPage})
+        self._lock = threading.Lock()
+        self._counters = {"renders": 0, "hits": 0}
+
+    def _should_check_mtime(self) -> bool:
+        return current_app.debug if self.check_mtime is None else self.check_mtime
+
+    def _compile(self, filename: str):
+        path = os.path.join(self.template_dir, filename)
+        mtime = os.path.getmtime(path)
+        with open(path, "r", encoding="utf-8") as f:
+            source = f.read()
+        return mtime, current_app.jinja_env.from_string(source), {}
+
+    def get(self, filename: str) -> RenderedPage:
+        """The rendered page; must be called inside a request context."""
+        check_mtime = self._should_check_mtime()
+        key = (request.script_root, self.version(check_mtime) if self.version else None)
+        entry = self._templates.get(filename)
+        if entry is not None and check_mtime and \
+                os.path.getmtime(os.path.join(self.template_dir, filename)) != entry[0]:
+            entry = None
+
+        if entry is not None:
+            page = entry[2].get(key)
+            if page is not None:
+                self._counters["hits"] += 1
+                return page
+
+        with self._lock:
+            if entry is None:
+                entry = self._templates[filename] = self._compile(filename)
+            _, template, rendered = entry
+            page = rendered.get(key)
+            if page is None:
+                # Same context render_template_string provides (url_for, request, config...)
+                context = {}
+                current_app.update_template_context(context)
+                page = rendered[key] = RenderedPage(template.render(context))
+                self._counters["renders"] += 1
+        return page
+
+    def response(self, filename: str) -> Response:
+        """
+        Serve the page in the best encoding the client accepts, answering
+        If-None-Match with 304 Not Modified.
+        """
+        page = self.get(filename)
+        encoding = request.accept_encodings.best_match(
+            [name for name in ("br", "gzip") if name in page.variants], default="identity"
+        )
+
+        response = Response(page.variants[encoding], mimetype="text/html")
+        if encoding != "identity":
+            response.headers["Content-Encoding"] = encoding
+        response.vary.add("Accept-Encoding")
+        response.headers["Cache-Control"] = PAGE_CACHE_CONTROL
+        # Each encoding is a different representation, so it gets its own ETag
+        response.set_etag(page.etag if encoding == "identity" else f"{page.etag}-{encoding}")
+        return response.make_conditional(request)
+
+    def stats(self) -> dict:
+        return {"templates": len(self._templates), **self._counters}
@@ -1,13 +1,42 @@
-import torch
-import torch.nn as nn
-from torchvision import models, transforms
-from PIL import Image
+from concurrent.futures import Future
 import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+from app.services import metrics, profiling
+from app.services.cache import hash_file
+from app.services.imaging import DecodedImage, BatchPreprocessor
+from app.services.lazy_imports import is_installed, loaded_module, optional_import, torch_device
+from app.services.onnx_predictor import OnnxPredictor, default_onnx_path, softmax
+from app.services.severity import estimate_severity, estimate_severity_batch
+
+# PyTorch and torchvision are imported when a PyTorch backend is loaded,
+# not at import time: they cost seconds and hundreds of MB per worker.
 
 # ==========================================================
 # CONFIG
 # ==========================================================
-DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+# Trained weights served by the API
+MODEL_WEIGHTS_PATH = os.getenv("PREDICT_WEIGHTS_PATH", "mobilenetv3_best.pth")
+
+# Micro-batching: concurrent requests are grouped into one forward pass
+MAX_BATCH_SIZE = int(os.getenv("PREDICT_MAX_BATCH_SIZE", "16"))
+MAX_WAIT_MS = float(os.getenv("PREDICT_MAX_WAIT_MS", "10"))
+
+# Inference backend: eager (fp32), torchscript (frozen + optimized for
+# inference), dynamic_int8, static_int8 (calibrated on sample photos) or
+# onnx (ONNX Runtime, no PyTorch needed)
+BACKENDS = ("eager", "torchscript", "dynamic_int8", "static_int8", "onnx")
+PREDICT_BACKEND = os.getenv("PREDICT_BACKEND", "eager" if is_installed("torch") else "onnx").lower()
+CALIBRATION_DIR = os.getenv("PREDICT_CALIBRATION_DIR") or None
+CALIBRATION_SAMPLES = int(os.getenv("PREDICT_CALIBRATION_SAMPLES", "128"))
+# Eager CPU weights are memory-mapped from the .pth file instead of copied
+# into each process, so inference workers share one page-cached copy
+MMAP_WEIGHTS = os.getenv("PREDICT_MMAP_WEIGHTS", "true").lower() == "true"
 
 DISEASE_CLASSES = [
     "Apple_Black_rot", "Apple_scab", "Banana_Panama", "Cauliflower_Black_Rot",
@@ -22,57 +51,421 @@ DISEASE_CLASSES = [
     "Potato_Late_blight", "Tomato_healthy"
 ]
 
+BATCH_SIZES = metrics.histogram("inference_batch_size", "Images per micro-batched forward pass.",
+                                buckets=(1, 2, 4, 8, 16, 32, 64))
+BATCH_SECONDS = metrics.histogram("inference_batch_duration_seconds", "Forward pass time per micro-batch.")
+
 # ==========================================================
 # MODEL LOADING
 # ==========================================================
-def load_mobilenet_model(weights_path: str = "mobilenetv3_best.pth"):
+def _build_mobilenet(quantizable: bool = False):
+    """MobileNetV3-Large with the disease classifier head."""
+    import torch.nn as nn
+    from torchvision import models
+    from torchvision.models import quantization as quantizable_models
+
+    if quantizable:
+        # Same layers plus quant/dequant stubs and fusable blocks
+        model = quantizable_models.mobilenet_v3_large(weights=None, quantize=False)
+    else:
+        model = models.mobilenet_v3_large(pretrained=False)
+    num_ftrs = model.classifier[3].in_features
+    model.classifier[3] = nn.Linear(num_ftrs, len(DISEASE_CLASSES))
+    return model
+
+
+def load_mobilenet_model(weights_path: str = MODEL_WEIGHTS_PATH, backend: str = None,
+                         calibration_dir: str = None):
     """
     Load MobileNetV3-Large model with trained weights.
     Compatible with Flask import: app.services.prediction.load_mobilenet_model
+
+    `backend` (default: PREDICT_BACKEND) selects how inference runs; see
+    BACKENDS. static_int8 calibrates on images from `calibration_dir`
+    (default: PREDICT_CALIBRATION_DIR). onnx loads the exported model next
+    to `weights_path` (or PREDICT_ONNX_PATH) instead of the .pth.
     """
-    model = models.mobilenet_v3_large(pretrained=False)
-    num_ftrs = model.classifier[3].in_features
-    model.classifier[3] = nn.Linear(num_ftrs, len(DISEASE_CLASSES))
+    backend = (backend or PREDICT_BACKEND).lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"❌ Unknown PREDICT_BACKEND '{backend}'. Choose one of: {', '.join(BACKENDS)}")
+    if backend == "onnx":
+        onnx_path = default_onnx_path(weights_path)
+        model = OnnxPredictor(onnx_path)
+        print(f"✅ MobileNetV3 model loaded successfully from {onnx_path} (onnx backend)")
+        return model
+    torch = optional_import("torch")
+    if torch is None:
+        raise ImportError("❌ PyTorch is not installed; set PREDICT_BACKEND=onnx to use the ONNX model")
+    device = torch_device()
+    if backend.endswith("int8") and device.type != "cpu":
+        print(f"⚠️ {backend} only runs on CPU; using the eager backend on {device}")
+        backend = "eager"
 
     if not os.path.exists(weights_path):
         raise FileNotFoundError(f"❌ Model weights not found at: {weights_path}")
 
-    model.load_state_dict(torch.load(weights_path, map_location=DEVICE))
-    model.to(DEVICE)
+    model = _build_mobilenet(quantizable=backend == "static_int8")
+    if MMAP_WEIGHTS and backend == "eager" and device.type == "cpu":
+        _load_mmap_state(model, weights_path)
+    else:
+        model.load_state_dict(torch.load(weights_path, map_location=device))
+    model.to(device)
     model.eval()
-    print(f"✅ MobileNetV3 model loaded successfully from {weights_path}")
+
+    if backend == "torchscript":
+        model = compile_torchscript(model)
+    elif backend == "dynamic_int8":
+        model = quantize_dynamic_int8(model)
+    elif backend == "static_int8":
+        model = quantize_static_int8(model, calibration_dir or CALIBRATION_DIR)
+
+    # Content hash of the weights; part of the prediction cache key. Other
+    # backends give slightly different confidences, so they get their own keys
+    model.weights_version = hash_file(weights_path)
+    if backend != "eager":
+        model.weights_version += f"-{backend}"
+    model.backend = backend
+    print(f"✅ MobileNetV3 model loaded successfully from {weights_path} ({backend} backend)")
+    return model
+
+
+def _load_mmap_state(model, weights_path: str):
+    """
+    Point the parameters straight at the tensors of a memory-mapped
+    `weights_path` (assign=True) rather than copying them. The pages are
+    read-only and file-backed, so every process serving the same file
+    shares them. Legacy (non-zip) checkpoints cannot be mapped and are
+    loaded normally.
+    """
+    import torch
+
+    try:
+        state = torch.load(weights_path, map_location="cpu", mmap=True, weights_only=True)
+    except RuntimeError as e:
+        print(f"⚠️ Could not memory-map {weights_path} ({e}); loading a private copy")
+        model.load_state_dict(torch.load(weights_path, map_location="cpu"))
+        return
+    model.load_state_dict(state, assign=True)
+
+
+# ==========================================================
+# INFERENCE BACKENDS
+# ==========================================================
+def compile_torchscript(model):
+    """Trace, freeze and optimize the model for inference."""
+    import torch
+
+    device = torch_device()
+    example = torch.zeros(1, 3, 224, 224, device=device)
+    with torch.no_grad():
+        traced = torch.jit.trace(model, example)
+        frozen = torch.jit.optimize_for_inference(torch.jit.freeze(traced))
+        # The profiling executor specializes on the first calls; do them now
+        for batch_size in (1, 2):
+            frozen(torch.zeros(batch_size, 3, 224, 224, device=device))
+    return frozen
+
+
+def quantize_dynamic_int8(model):
+    """
+    int8 weights for the Linear layers, activations quantized on the fly.
+    Only the classifier head is Linear, so most of the network stays fp32.
+    """
+    import torch
+    import torch.nn as nn
+
+    return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+
+def _quantized_engine() -> str:
+    import torch
+
+    engines = torch.backends.quantized.supported_engines
+    return "x86" if "x86" in engines else "qnnpack"
+
+
+def load_calibration_images(directory: str, limit: int = CALIBRATION_SAMPLES):
+    """
+    Up to `limit` photos from `directory` (recursive, sorted) as 224x224
+    uint8 arrays. Files that fail to decode are skipped.
+    """
+    images = []
+    for dirpath, dirnames, filenames in os.walk(directory):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if len(images) >= limit:
+                return images
+            if not name.lower().endswith((".jpg", ".jpeg", ".png")):
+                continue
+            try:
+                images.append(DecodedImage.from_path(os.path.join(dirpath, name)).resized)
+            except Exception as e:
+                print(f"⚠️ Skipping {name}: {e}")
+    return images
+
+
+def quantize_static_int8(model, calibration_dir: str):
+    """
+    Full int8 post-training quantization of a quantizable MobileNetV3:
+    fuse conv/bn/relu blocks, observe activation ranges on sample photos,
+    then convert weights and activations to int8.
+    """
+    import torch
+
+    if not calibration_dir or not os.path.isdir(calibration_dir):
+        raise ValueError("❌ static_int8 needs sample photos: set PREDICT_CALIBRATION_DIR to a directory of images")
+
+    engine = _quantized_engine()
+    torch.backends.quantized.engine = engine
+    model.fuse_model(is_qat=False)
+    model.qconfig = torch.ao.quantization.get_default_qconfig(engine)
+    torch.ao.quantization.prepare(model, inplace=True)
+
+    images = load_calibration_images(calibration_dir)
+    if not images:
+        raise ValueError(f"❌ No JPG/PNG images found in calibration directory: {calibration_dir}")
+    preprocessor = BatchPreprocessor(MAX_BATCH_SIZE)
+    with torch.no_grad():
+        for start in range(0, len(images), MAX_BATCH_SIZE):
+            model(preprocessor(images[start:start + MAX_BATCH_SIZE]))
+
+    torch.ao.quantization.convert(model, inplace=True)
+    print(f"Calibrated static int8 model on {len(images)} images ({engine} engine)")
     return model
 
 
 # ==========================================================
 # IMAGE PREPROCESSING
 # ==========================================================
-def preprocess_image(image_path: str):
-    transform = transforms.Compose([
-        transforms.Resize((224, 224)),
-        transforms.ToTensor(),
-        transforms.Normalize(mean=[0.485, 0.456, 0.406],
-                             std=[0.229, 0.224, 0.225])
-    ])
-    image = Image.open(image_path).convert("RGB")
-    return transform(image).unsqueeze(0)
+def preprocess_image(image):
+    """
+    Accepts a DecodedImage, raw bytes or a file path and returns a
+    (1,3,224,224) tensor. DecodedImage inputs reuse their cached tensor view.
+    """
+    return DecodedImage.coerce(image).tensor[None]
+
+
+# Shared engine for bulk callers, which may run concurrently (warm-up,
+# predict_images, scans); the batcher owns its own instance
+_batch_preprocessor = BatchPreprocessor(MAX_BATCH_SIZE)
+
+
+def preprocess_batch(images, preprocessor: BatchPreprocessor = None):
+    """
+    Resize and normalize a list of images into one (N,3,224,224) tensor.
+    With a `preprocessor` the result is a view into its reusable buffer,
+    only valid until its next call; the shared engine's result is a copy.
+    """
+    if preprocessor is not None:
+        return preprocessor(images)
+    tensors = _batch_preprocessor(images)
+    return tensors.copy() if isinstance(tensors, np.ndarray) else tensors.clone()
 
 # ==========================================================
-# PREDICTION FUNCTION
+# PREDICTION FUNCTIONS
 # ==========================================================
-def predict_disease(model, image_path: str):
-    """Run inference and return predicted class + confidence."""
-    if not os.path.exists(image_path):
-        raise FileNotFoundError(f"❌ Image not found: {image_path}")
+def _format_prediction(pred_idx: int, confidence: float) -> dict:
+    pred_class = DISEASE_CLASSES[pred_idx]
+    return {
+        "prediction": pred_class,
+        "disease_name": pred_class,
+        "confidence": round(confidence * 100, 2),
+        "severity_level": None,
+        "gradcam_image": None,
+    }
+
+
+def predict_batch(model, image_tensors):
+    """Run inference on an (N,3,224,224) batch and return one result per image."""
+    if isinstance(model, OnnxPredictor):
+        probabilities = softmax(model(image_tensors))
+        return [
+            _format_prediction(int(idx), float(probabilities[i, idx]))
+            for i, idx in enumerate(probabilities.argmax(axis=1))
+        ]
 
-    image_tensor = preprocess_image(image_path).to(DEVICE)
+    import torch
 
+    if isinstance(image_tensors, np.ndarray):
+        image_tensors = torch.from_numpy(image_tensors)
     with torch.no_grad():
-        outputs = model(image_tensor)
+        outputs = model(image_tensors.to(torch_device()))
         probabilities = torch.softmax(outputs, dim=1)
-        confidence, pred_idx = torch.max(probabilities, 1)
+        confidences, pred_idxs = torch.max(probabilities, 1)
+
+    return [
+        _format_prediction(idx, conf)
+        for idx, conf in zip(pred_idxs.tolist(), confidences.tolist())
+    ]
+
+
+def predict_disease(model, image, batcher=None):
+    """
+    Run inference and return predicted class, confidence and severity level.
+    `image` may be a DecodedImage, raw bytes or a file path. When a batcher
+    is given the image is queued and scored with other concurrent requests.
+    """
+    if isinstance(image, str) and not os.path.exists(image):
+        raise FileNotFoundError(f"❌ Image not found: {image}")
+
+    # An InferenceWorkerPool is both the model and its batcher
+    if batcher is None and hasattr(model, "submit"):
+        batcher = model
+    decoded = DecodedImage.coerce(image)
+    with metrics.stage("inference"):
+        if batcher is not None:
+            decoded.resized  # resize in the request thread, not the batch worker
+            result = batcher.predict(decoded)
+        else:
+            result = profiling.run_profiled_inference(
+                [profiling.current_session()], lambda: predict_batch(model, preprocess_image(decoded))
+            )[0]
+    with metrics.stage("severity"):
+        result["severity_level"] = estimate_severity(decoded, result["disease_name"])
+    return result
+
+
+def predict_images(model, images, preprocessor: BatchPreprocessor = None) -> list:
+    """
+    One result per image (DecodedImage or (H, W, 3) uint8 array). Runs a
+    single forward pass, or spreads the images over the inference workers
+    when `model` is an InferenceWorkerPool. Severity levels are estimated
+    for the whole batch at once.
+    """
+    def run():
+        # The buffer stays reserved until the forward pass is done
+        with (preprocessor or _batch_preprocessor).batch(images) as tensors:
+            return predict_batch(model, tensors)
+
+    with metrics.stage("inference"):
+        if hasattr(model, "predict_images"):
+            results = model.predict_images(images)
+        else:
+            results = profiling.run_profiled_inference([profiling.current_session()], run)
+    with metrics.stage("severity"):
+        levels = estimate_severity_batch(images, [result["disease_name"] for result in results])
+    for result, level in zip(results, levels):
+        result["severity_level"] = level
+    return results
+
+
+# ==========================================================
+# DYNAMIC MICRO-BATCHING
+# ==========================================================
+def _is_tensor(item) -> bool:
+    """Preprocessed input: a torch tensor, or a float32 ndarray without PyTorch."""
+    # A tensor can only exist once something has imported torch
+    torch = loaded_module("torch")
+    return (torch is not None and isinstance(item, torch.Tensor)) or \
+        (isinstance(item, np.ndarray) and item.dtype == np.float32)
+
+
+def _stack(tensors):
+    torch = loaded_module("torch")
+    if torch is not None and all(isinstance(t, torch.Tensor) for t in tensors):
+        return torch.stack(tensors)
+    return np.stack([np.asarray(t) for t in tensors])
+
+
+class InferenceBatcher:
+    """
+    Collects images from concurrent callers and runs them through the
+    model as one batch. A batch is flushed once it reaches `max_batch_size`
+    or when the oldest queued request has waited `max_wait_ms`.
+
+    Each caller gets a Future for its own result, so request threads only
+    block on their own slot:
+
+        future = batcher.submit(decoded_image)
+        result = future.result()
+    """
+
+    def __init__(self, model, max_batch_size: int = MAX_BATCH_SIZE,
+                 max_wait_ms: float = MAX_WAIT_MS):
+        self.model = model
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._queue = queue.Queue()
+        self._preprocessor = BatchPreprocessor(self.max_batch_size)
+        self._closed = False
+        self._worker = threading.Thread(
+            target=self._run, name="inference-batcher", daemon=True
+        )
+        self._worker.start()
+
+    def submit(self, image) -> Future:
+        """
+        Queue a DecodedImage (preferred) or a (3,224,224) / (1,3,224,224)
+        tensor; returns a Future.
+        """
+        if self._closed:
+            raise RuntimeError("InferenceBatcher is closed")
+        if _is_tensor(image) and image.ndim == 4:
+            image = image[0]
+        future = Future()
+        # A profiled request gets op timings of the batch it ends up in
+        future.profile_session = profiling.current_session()
+        self._queue.put((image, future))
+        return future
+
+    def predict(self, image, timeout: float = None) -> dict:
+        """Submit an image and wait for its result."""
+        return self.submit(image).result(timeout=timeout)
+
+    def close(self):
+        """Stop the worker after draining requests already queued."""
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+            self._worker.join()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                break
+
+            batch = [item]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 \
+                        else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            self._run_batch(batch)
+
+    def _run_batch(self, batch):
+        # Skip callers that cancelled while waiting in the queue
+        batch = [(t, f) for t, f in batch if f.set_running_or_notify_cancel()]
+        if not batch:
+            return
 
-    pred_class = DISEASE_CLASSES[pred_idx.item()]
-    confidence = round(confidence.item() * 100, 2)
+        try:
+            items = [item for item, _ in batch]
+            if any(_is_tensor(item) for item in items):
+                batch_tensor = _stack([
+                    item if _is_tensor(item) else item.tensor
+                    for item in items
+                ])
+            else:
+                batch_tensor = self._preprocessor(items)
+            with BATCH_SECONDS.time():
+                results = profiling.run_profiled_inference(
+                    [future.profile_session for _, future in batch], lambda: predict_batch(self.model, batch_tensor)
+                )
+            BATCH_SIZES.observe(len(batch))
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
 
-    return {"prediction": pred_class, "confidence": confidence}
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
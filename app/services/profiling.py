@@ -0,0 +1,252 @@
+"""
+CropGuard AI - Request Profiling
+Opt-in profiles of single requests, for the rare slow prediction that does
+not reproduce locally.
+
+A request is profiled when it carries `X-Profile-Request: <PROFILE_TOKEN>`
+or is picked by PROFILE_SAMPLE_RATE. Its thread runs under cProfile, and
+the forward pass it takes part in (in the request thread or the batcher
+thread) runs under the PyTorch profiler for per-op timings. Each profile
+is written as one zip to PROFILE_DIR, which keeps only the newest
+PROFILE_MAX_ENTRIES, and can be downloaded from /admin/profiles with the
+same token.
+
+With neither the token nor a sample rate configured no hooks are
+installed, so the only cost left is one attribute lookup per queued image.
+"""
+
+import cProfile
+import hmac
+import io
+import json
+import os
+import pstats
+import random
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+from datetime import datetime, timezone
+
+from app.services.lazy_imports import loaded_module
+
+# ==========================================================
+# CONFIG
+# ==========================================================
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN") or None
+# Fraction of requests profiled without the header (0 = only on request)
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_DIR = os.getenv("PROFILE_DIR") or os.path.join(tempfile.gettempdir(), "cropguard-profiles")
+PROFILE_MAX_ENTRIES = int(os.getenv("PROFILE_MAX_ENTRIES", "50"))
+# Record per-op timings of the forward pass with torch.profiler
+PROFILE_TORCH = os.getenv("PROFILE_TORCH", "true").lower() == "true"
+PROFILE_HEADER = "X-Profile-Request"
+PROFILE_TOP_FUNCTIONS = 60
+PROFILE_TOP_OPS = 40
+
+_local = threading.local()
+
+
+def current_session():
+    """The profile being recorded on this thread, or None."""
+    return getattr(_local, "session", None)
+
+
+class ProfileSession:
+    """Everything recorded for one profiled request."""
+
+    def __init__(self, reason: str):
+        self.name = f"{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}"
+        self.reason = reason
+        self.started = time.perf_counter()
+        self.meta = {"reason": reason, "started_at": datetime.now(timezone.utc).isoformat()}
+        self.torch_ops = []  # one table per forward pass
+        self.profile = cProfile.Profile()
+        self._lock = threading.Lock()
+        self._finished = False
+        try:
+            self.profile.enable()
+        except ValueError:  # another profiler already owns this thread
+            self.profile = None
+
+    def add_torch_ops(self, table: str):
+        with self._lock:
+            self.torch_ops.append(table)
+
+    def finish(self) -> bool:
+        """Stop recording; True the first time only."""
+        with self._lock:
+            if self._finished:
+                return False
+            self._finished = True
+        if self.profile is not None:
+            self.profile.disable()
+        self.meta["duration_ms"] = round((time.perf_counter() - self.started) * 1000, 2)
+        return True
+
+    def to_zip(self) -> bytes:
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr("meta.json", json.dumps(self.meta, indent=2, default=str))
+            if self.profile is not None:
+                # Binary stats for snakeviz / pstats, plus a readable summary
+                with tempfile.NamedTemporaryFile(suffix=".prof", delete=False) as f:
+                    path = f.name
+                try:
+                    self.profile.dump_stats(path)
+                    archive.write(path, "cprofile.prof")
+                finally:
+                    os.remove(path)
+                summary = io.StringIO()
+                pstats.Stats(self.profile, stream=summary).sort_stats("cumulative").print_stats(PROFILE_TOP_FUNCTIONS)
+                archive.writestr("cprofile.txt", summary.getvalue())
+            if self.torch_ops:
+                archive.writestr("torch_ops.txt", "\n\n".join(self.torch_ops))
+        return buffer.getvalue()
+
+
+def run_profiled_inference(sessions, fn):
+    """
+    Call `fn` (a forward pass), under the PyTorch profiler when any of
+    `sessions` is recording; its op table is attached to each of them.
+    """
+    sessions = [session for session in sessions if session is not None]
+    torch = loaded_module("torch")
+    if not sessions or not PROFILE_TORCH or torch is None:
+        return fn()
+
+    from torch.profiler import ProfilerActivity, profile
+
+    activities = [ProfilerActivity.CPU]
+    if torch.cuda.is_available():
+        activities.append(ProfilerActivity.CUDA)
+    with profile(activities=activities, record_shapes=True) as prof:
+        result = fn()
+    table = prof.key_averages(group_by_input_shape=True).table(
+        sort_by="self_cpu_time_total", row_limit=PROFILE_TOP_OPS
+    )
+    for session in sessions:
+        session.add_torch_ops(table)
+    return result
+
+
+# ==========================================================
+# FLASK INTEGRATION
+# ==========================================================
+class RequestProfiler:
+    """
+    Per-request profiling for a Flask app plus the on-disk ring buffer:
+
+        profiler = RequestProfiler()
+        profiler.init_app(app)
+        profiler.list()                # metadata, newest first
+        profiler.path(name)            # zip to download
+    """
+
+    def __init__(self, directory: str = PROFILE_DIR, max_entries: int = PROFILE_MAX_ENTRIES,
+                 token: str = PROFILE_TOKEN, sample_rate: float = PROFILE_SAMPLE_RATE):
+        self.directory = directory
+        self.max_entries = max(1, max_entries)
+        self.token = token
+        self.sample_rate = max(0.0, min(1.0, sample_rate))
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.token) or self.sample_rate > 0
+
+    def authorized(self, request, header: str = "Authorization") -> bool:
+        """Token check for the profile header (raw token) or the admin endpoints (Bearer token)."""
+        if not self.token:
+            return False
+        value = request.headers.get(header, "")
+        if header == "Authorization":
+            value = value[len("Bearer "):] if value.startswith("Bearer ") else ""
+        return hmac.compare_digest(value.encode(), self.token.encode())
+
+    def init_app(self, app):
+        if not self.enabled:
+            return
+        from flask import g, request
+
+        @app.before_request
+        def _start_profile():
+            _local.session = None
+            if request.headers.get(PROFILE_HEADER) is not None and self.authorized(request, PROFILE_HEADER):
+                reason = "header"
+            elif self.sample_rate > 0 and random.random() < self.sample_rate:
+                reason = "sampled"
+            else:
+                return
+            g.profile_session = _local.session = ProfileSession(reason)
+            g.profile_session.meta.update(method=request.method, path=request.path)
+
+        @app.after_request
+        def _attach_profile(response):
+            session = g.get("profile_session")
+            if session is not None:
+                session.meta.update(status=response.status_code, server_timing=response.headers.get("Server-Timing"))
+                response.headers["X-Profile-Id"] = session.name
+                # Streamed bodies are still being produced; stop when the response closes
+                response.call_on_close(lambda: self._finish(session))
+            return response
+
+        @app.teardown_request
+        def _abandoned_profile(error):
+            session = g.get("profile_session")
+            if session is not None and error is not None:
+                session.meta["error"] = repr(error)
+                self._finish(session)
+
+    def _finish(self, session: ProfileSession):
+        if current_session() is session:
+            _local.session = None
+        if not session.finish():
+            return
+        try:
+            self.save(session)
+        except OSError as e:
+            print(f"⚠️ Could not save profile {session.name}: {e}")
+
+    def save(self, session: ProfileSession):
+        data = session.to_zip()
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, f"{session.name}.zip")
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            # Ring buffer: drop the oldest beyond max_entries
+            for name in self._names()[self.max_entries:]:
+                try:
+                    os.remove(os.path.join(self.directory, f"{name}.zip"))
+                except OSError:
+                    pass
+        print(f"Saved request profile {session.name} ({session.meta.get('path')}, {session.meta['duration_ms']} ms)")
+
+    def _names(self) -> list:
+        """Stored profile names, newest first."""
+        try:
+            files = os.listdir(self.directory)
+        except OSError:
+            return []
+        return sorted((name[:-4] for name in files if name.endswith(".zip")), reverse=True)
+
+    def list(self) -> list:
+        profiles = []
+        for name in self._names():
+            path = os.path.join(self.directory, f"{name}.zip")
+            try:
+                with zipfile.ZipFile(path) as archive:
+                    meta = json.loads(archive.read("meta.json"))
+                size = os.path.getsize(path)
+            except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+                continue  # rotated out or half-written
+            profiles.append(dict(meta, name=name, size=size))
+        return profiles
+
+    def path(self, name: str):
+        """Path of a stored profile, or None (names are validated, never joined raw)."""
+        return os.path.join(self.directory, f"{name}.zip") if name in self._names() else None
@@ -1,7 +1,16 @@
 import os
-from openai import OpenAI
+import gzip
+import json
+import random
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
 from dotenv import load_dotenv
 
+from app.services import metrics
+# The OpenAI SDK is imported when the first LLM call is made, not at startup
+
 # ------------------------------------------------------------------------
 # Load Environment Variables
 # ------------------------------------------------------------------------
@@ -18,6 +27,35 @@ else:
     BASE_URL = "https://api.openai.com/v1"
     MODEL_NAME = "gpt-4-turbo"
 
+# Point at a different OpenAI-compatible server (e.g. benchmarks/llm_stub.py)
+BASE_URL = os.getenv("LLM_BASE_URL", BASE_URL)
+MODEL_NAME = os.getenv("LLM_MODEL_NAME", MODEL_NAME)
+
+# --- LLM Client Configuration ---
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "20"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BACKOFF_SECONDS = float(os.getenv("LLM_RETRY_BACKOFF_SECONDS", "0.5"))
+# Cap on in-flight LLM calls across all request threads of this process
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+# How long a request waits for a free LLM slot before giving up
+LLM_QUEUE_TIMEOUT_SECONDS = float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", "10"))
+
+# --- Recommendation Store Configuration ---
+# Pre-warmed advice file (see `python -m app.services.recommendation prewarm`)
+RECOMMENDATION_STORE_PATH = os.getenv("RECOMMENDATION_STORE_PATH", "models/recommendations.json.gz")
+# How long live LLM answers are memoized in process (seconds)
+RECOMMENDATION_CACHE_TTL = float(os.getenv("RECOMMENDATION_CACHE_TTL", str(7 * 24 * 3600)))
+# Cap on memoized answers; keys come from client input, so this bounds memory
+RECOMMENDATION_CACHE_MAX_ENTRIES = int(os.getenv("RECOMMENDATION_CACHE_MAX_ENTRIES", "2048"))
+SUPPORTED_LANGUAGES = ["en", "hi", "es", "fr", "pt", "zh", "ja", "ru", "de"]
+SEVERITY_LEVELS = [1, 2, 3, 4, 5]
+
+# The system prompt mandates exactly this answer for severity 5
+SEVERE_INFECTION_MESSAGE = (
+    '🚨 "This is a severe infection. Immediate professional lab diagnosis is required. '
+    'Please check the Nearest Labs section for contact information."'
+)
+
 # ------------------------------------------------------------------------
 # TREATMENT KNOWLEDGE BASE (RAG CONTEXT)
 # Matches your 31 DISEASE_CLASSES exactly
@@ -138,54 +176,414 @@ def get_treatment_context(disease_name: str, severity: int) -> str:
 
     return f"Disease: {disease_name}. Severity: {severity}/5. Details: {base_treatment} Additional Instructions: {severity_note}"
 
+def is_error_recommendation(text: str) -> bool:
+    """True for the warning/error strings generate_recommendation returns instead of advice."""
+    return text.startswith(("⚠️", "❌"))
+
+# ------------------------------------------------------------------------
+# LLM Client Manager – one pooled client per process
+# ------------------------------------------------------------------------
+@lru_cache(maxsize=None)
+def retryable_llm_errors():
+    """
+    Transient failures worth another attempt; anything else (bad request,
+    auth errors) is raised straight away
+    """
+    import openai
+
+    return (
+        openai.APIConnectionError,   # includes APITimeoutError
+        openai.RateLimitError,
+        openai.InternalServerError,
+    )
+
+
+class LLMBusyError(RuntimeError):
+    """Raised when no LLM slot frees up within LLM_QUEUE_TIMEOUT_SECONDS."""
+
+
+class LLMClientManager:
+    """
+    Owns a single OpenAI-compatible client, created on first use and reused
+    for every call so its HTTP keep-alive pool and TLS sessions are shared.
+
+    Every call gets a timeout, transient errors are retried with exponential
+    backoff plus jitter, and a semaphore caps concurrent in-flight calls.
+    The semaphore is released while backing off, so a retrying call does
+    not hold a slot another request could use.
+    """
+
+    def __init__(self, api_key: str = None, base_url: str = None,
+                 timeout: float = LLM_TIMEOUT_SECONDS,
+                 max_retries: int = LLM_MAX_RETRIES,
+                 backoff: float = LLM_RETRY_BACKOFF_SECONDS,
+                 max_concurrency: int = LLM_MAX_CONCURRENCY,
+                 queue_timeout: float = LLM_QUEUE_TIMEOUT_SECONDS):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.timeout = timeout
+        self.max_retries = max(0, max_retries)
+        self.backoff = backoff
+        self.queue_timeout = queue_timeout
+        self._semaphore = threading.BoundedSemaphore(max(1, max_concurrency))
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    from openai import OpenAI
+
+                    # Retries are handled here, not inside the SDK, so the
+                    # concurrency slot is not held during backoff
+                    self._client = OpenAI(
+                        api_key=self.api_key,
+                        base_url=self.base_url,
+                        timeout=self.timeout,
+                        max_retries=0,
+                    )
+        return self._client
+
+    def chat_completion(self, timeout: float = None, **kwargs):
+        """chat.completions.create with a concurrency slot, timeout and bounded retries."""
+        timeout = self.timeout if timeout is None else timeout
+        for attempt in range(self.max_retries + 1):
+            if not self._semaphore.acquire(timeout=self.queue_timeout):
+                raise LLMBusyError("Too many concurrent LLM requests; please retry shortly.")
+            try:
+                return self.client.chat.completions.create(timeout=timeout, **kwargs)
+            except retryable_llm_errors() as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self.backoff * (2 ** attempt) * (1 + random.random())
+                print(f"LLM call failed ({type(e).__name__}); retry {attempt + 1}/{self.max_retries} in {delay:.2f}s")
+            finally:
+                self._semaphore.release()
+            time.sleep(delay)
+
+    def stream_chat_completion(self, timeout: float = None, **kwargs):
+        """
+        Streaming variant of chat_completion; yields content deltas as they arrive.
+        Retries only cover opening the stream. The concurrency slot is held
+        until the stream is exhausted or closed.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        for attempt in range(self.max_retries + 1):
+            if not self._semaphore.acquire(timeout=self.queue_timeout):
+                raise LLMBusyError("Too many concurrent LLM requests; please retry shortly.")
+            try:
+                stream = self.client.chat.completions.create(stream=True, timeout=timeout, **kwargs)
+            except retryable_llm_errors() as e:
+                self._semaphore.release()
+                if attempt == self.max_retries:
+                    raise
+                delay = self.backoff * (2 ** attempt) * (1 + random.random())
+                print(f"LLM stream failed ({type(e).__name__}); retry {attempt + 1}/{self.max_retries} in {delay:.2f}s")
+                time.sleep(delay)
+                continue
+            except Exception:
+                self._semaphore.release()
+                raise
+
+            try:
+                for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+            finally:
+                self._semaphore.release()
+            return
+
+    def close(self):
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+
+
+llm_client = LLMClientManager(api_key=API_KEY, base_url=BASE_URL)
+
+# ------------------------------------------------------------------------
+# Recommendation Store – Memoized + Pre-warmed Advice
+# ------------------------------------------------------------------------
+class RecommendationStore:
+    """
+    Serves advice for (disease_name, severity, language_code).
+
+    Two tiers, both plain dict lookups:
+      - the pre-warmed file at RECOMMENDATION_STORE_PATH (no expiry), loaded on first use
+      - in-process memo of live LLM answers, expiring after RECOMMENDATION_CACHE_TTL;
+        an LRU of at most RECOMMENDATION_CACHE_MAX_ENTRIES, swept of expired
+        entries on every insert
+    """
+
+    def __init__(self, path: str = RECOMMENDATION_STORE_PATH, ttl: float = RECOMMENDATION_CACHE_TTL,
+                 max_entries: int = RECOMMENDATION_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self._prewarmed = None
+        self._memo = OrderedDict()  # key -> (text, expires_at), least recently used first
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(disease_name: str, severity: int, language_code: str) -> str:
+        return f"{disease_name}|{severity}|{language_code}"
+
+    def get(self, disease_name: str, severity: int, language_code: str):
+        key = self.make_key(disease_name, severity, language_code)
+        text = self._load_prewarmed().get(key)
+        if text is not None:
+            return text
+
+        with self._lock:
+            item = self._memo.get(key)
+            if item is None:
+                return None
+            text, expires_at = item
+            if time.monotonic() >= expires_at:
+                del self._memo[key]
+                return None
+            self._memo.move_to_end(key)
+            return text
+
+    def put(self, disease_name: str, severity: int, language_code: str, text: str):
+        key = self.make_key(disease_name, severity, language_code)
+        now = time.monotonic()
+        with self._lock:
+            self._memo.pop(key, None)
+            # Expired entries that are never asked for again would otherwise stay
+            for old_key in [k for k, (_, expires_at) in self._memo.items() if now >= expires_at]:
+                del self._memo[old_key]
+            self._memo[key] = (text, now + self.ttl)
+            while len(self._memo) > self.max_entries:
+                self._memo.popitem(last=False)
+
+    def reload(self):
+        with self._lock:
+            self._prewarmed = None
+        self._load_prewarmed()
+
+    def _load_prewarmed(self) -> dict:
+        if self._prewarmed is not None:
+            return self._prewarmed
+        with self._lock:
+            if self._prewarmed is None:
+                self._prewarmed = load_store_file(self.path).get("entries", {})
+                if self._prewarmed:
+                    print(f"Loaded {len(self._prewarmed)} pre-warmed recommendations from {self.path}")
+        return self._prewarmed
+
+
+def load_store_file(path: str) -> dict:
+    """Read a gzip-compressed JSON store file; returns {} if it is missing or unreadable."""
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_store_file(path: str, entries: dict):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    payload = {"provider": LLM_PROVIDER_NAME, "model": MODEL_NAME, "entries": entries}
+    tmp_path = f"{path}.tmp"
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+
+_store = RecommendationStore()
+
+LLM_REQUESTS = metrics.counter("llm_requests_total", "Live LLM calls by outcome (ok, error, not_configured).", ("outcome",))
+LLM_FIRST_TOKEN_SECONDS = metrics.histogram("llm_time_to_first_token_seconds", "Time until a streamed LLM answer starts.")
+STORE_LOOKUPS = metrics.counter("recommendation_store_lookups_total", "Recommendation store lookups.", ("result",))
+
+
+def _store_get(disease_name: str, severity: int, language_code: str):
+    text = _store.get(disease_name, severity, language_code)
+    STORE_LOOKUPS.inc(result="miss" if text is None else "hit")
+    return text
+
 # ------------------------------------------------------------------------
 # Main Function – Generate Recommendation via LLM
 # ------------------------------------------------------------------------
 def generate_recommendation(disease_name: str, severity: int, language_code: str = "en") -> str:
-    """Generate localized, farmer-friendly recommendation using Groq/OpenAI."""
+    """
+    Generate localized, farmer-friendly recommendation using Groq/OpenAI.
+    Served from the recommendation store when possible; the LLM is only
+    called on a miss, and severity 5 never reaches it.
+    """
+    if severity == 5:
+        return SEVERE_INFECTION_MESSAGE
+
+    cached = _store_get(disease_name, severity, language_code)
+    if cached is not None:
+        return cached
+
+    text = _generate_with_llm(disease_name, severity, language_code)
+    if not is_error_recommendation(text):
+        _store.put(disease_name, severity, language_code, text)
+    return text
+
+
+def _build_messages(disease_name: str, severity: int, language_code: str) -> list:
+    rag_context = get_treatment_context(disease_name, severity)
+
+    system_prompt = f"""
+    You are SmartCropDoc-AI, a professional agricultural assistant for farmers.
+    Your job: generate easy-to-understand, localized (language = {language_code}) disease management advice.
+
+    RULES:
+    1. Base the answer strictly on the CONTEXT provided below.
+    2. If severity = 5, return ONLY:
+       🚨 "This is a severe infection. Immediate professional lab diagnosis is required. Please check the Nearest Labs section for contact information."
+    3. Divide the output into:
+       - **Sanitation / Cultural Practices**
+       - **Treatment / Pesticide Recommendation**
+       - **Safety Note**
+    4. Keep the tone simple and instructive for farmers.
+
+    CONTEXT:
+    ---
+    {rag_context}
+    ---
+    """
+
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": f"Give treatment plan for {disease_name} (Severity {severity}) translated to {language_code}."}
+    ]
+
+
+def _generate_with_llm(disease_name: str, severity: int, language_code: str) -> str:
+    """Single live LLM round-trip (no caching)."""
     if not API_KEY:
+        LLM_REQUESTS.inc(outcome="not_configured")
         return f"⚠️ Missing API key for {LLM_PROVIDER_NAME}. Please set `{LLM_PROVIDER_NAME.upper()}_API_KEY` in .env."
-
     try:
-        client = OpenAI(api_key=API_KEY, base_url=BASE_URL)
-        rag_context = get_treatment_context(disease_name, severity)
-
-        system_prompt = f"""
-        You are SmartCropDoc-AI, a professional agricultural assistant for farmers.
-        Your job: generate easy-to-understand, localized (language = {language_code}) disease management advice.
-
-        RULES:
-        1. Base the answer strictly on the CONTEXT provided below.
-        2. If severity = 5, return ONLY:
-           🚨 "This is a severe infection. Immediate professional lab diagnosis is required. Please check the Nearest Labs section for contact information."
-        3. Divide the output into:
-           - **Sanitation / Cultural Practices**
-           - **Treatment / Pesticide Recommendation**
-           - **Safety Note**
-        4. Keep the tone simple and instructive for farmers.
-
-        CONTEXT:
-        ---
-        {rag_context}
-        ---
-        """
-
-        response = client.chat.completions.create(
-            model=MODEL_NAME,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": f"Give treatment plan for {disease_name} (Severity {severity}) translated to {language_code}."}
-            ],
-            temperature=0.3,
-        )
-
+        with metrics.stage("llm"):
+            response = llm_client.chat_completion(
+                model=MODEL_NAME,
+                messages=_build_messages(disease_name, severity, language_code),
+                temperature=0.3,
+            )
+
+        LLM_REQUESTS.inc(outcome="ok")
         return response.choices[0].message.content.strip()
 
     except Exception as e:
+        LLM_REQUESTS.inc(outcome="error")
         return f"❌ Error: {str(e)}. Please verify your internet connection or API configuration."
 
+
+def stream_recommendation(disease_name: str, severity: int, language_code: str = "en"):
+    """
+    Same answer as generate_recommendation, yielded as text chunks while the
+    LLM produces them. Stored/short-circuited answers arrive as one chunk.
+    A failure mid-stream yields the usual "❌ Error" text as the last chunk.
+    """
+    if severity == 5:
+        yield SEVERE_INFECTION_MESSAGE
+        return
+
+    cached = _store_get(disease_name, severity, language_code)
+    if cached is not None:
+        yield cached
+        return
+
+    if not API_KEY:
+        LLM_REQUESTS.inc(outcome="not_configured")
+        yield f"⚠️ Missing API key for {LLM_PROVIDER_NAME}. Please set `{LLM_PROVIDER_NAME.upper()}_API_KEY` in .env."
+        return
+
+    parts = []
+    start = time.perf_counter()
+    try:
+        with metrics.stage("llm"):
+            for token in llm_client.stream_chat_completion(
+                model=MODEL_NAME,
+                messages=_build_messages(disease_name, severity, language_code),
+                temperature=0.3,
+            ):
+                if not parts:
+                    token = token.lstrip()
+                if token:
+                    if not parts:
+                        LLM_FIRST_TOKEN_SECONDS.observe(time.perf_counter() - start)
+                    parts.append(token)
+                    yield token
+    except Exception as e:
+        LLM_REQUESTS.inc(outcome="error")
+        yield f"❌ Error: {str(e)}. Please verify your internet connection or API configuration."
+        return
+
+    LLM_REQUESTS.inc(outcome="ok")
+    text = "".join(parts).strip()
+    if text and not is_error_recommendation(text):
+        _store.put(disease_name, severity, language_code, text)
+
+# ------------------------------------------------------------------------
+# Offline Pre-warming – enumerate every (disease, severity, language)
+# ------------------------------------------------------------------------
+def prewarm_store(path: str = RECOMMENDATION_STORE_PATH, languages=None, workers: int = 4,
+                  refresh: bool = False) -> dict:
+    """
+    Generate advice for every disease x severity 1-4 x language and write it to `path`.
+    Existing entries are kept unless `refresh` is set, so an interrupted run can be resumed.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    languages = languages or SUPPORTED_LANGUAGES
+    entries = {} if refresh else load_store_file(path).get("entries", {})
+    todo = [
+        (disease, severity, language)
+        for disease in TREATMENT_DOCUMENTS
+        for severity in SEVERITY_LEVELS if severity != 5
+        for language in languages
+        if RecommendationStore.make_key(disease, severity, language) not in entries
+    ]
+    print(f"Pre-warming {len(todo)} recommendations ({len(entries)} already stored)")
+    if todo and not API_KEY:
+        print(f"❌ Missing API key for {LLM_PROVIDER_NAME}. Set `{LLM_PROVIDER_NAME.upper()}_API_KEY` in .env.")
+        return entries
+
+    failures = 0
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        results = pool.map(lambda combo: (combo, _generate_with_llm(*combo)), todo)
+        for done, (combo, text) in enumerate(results, 1):
+            if is_error_recommendation(text):
+                failures += 1
+                print(f"  ✗ {combo}: {text}")
+                continue
+            entries[RecommendationStore.make_key(*combo)] = text
+            if done % 50 == 0:
+                write_store_file(path, entries)
+                print(f"  {done}/{len(todo)} done")
+
+    write_store_file(path, entries)
+    print(f"✅ Wrote {len(entries)} recommendations to {path} ({failures} failed)")
+    return entries
+
+
 # ------------------------------------------------------------------------
-# Example Debug Run (Uncomment to test)
+# Example Debug Run / CLI
 # ------------------------------------------------------------------------
-# if __name__ == "__main__":
-#     print(generate_recommendation("Tomato_Early_blight", 3, "en"))
+# print(generate_recommendation("Tomato_Early_blight", 3, "en"))
+#
+#   python -m app.services.recommendation prewarm [--languages en,hi] [--output PATH]
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="SmartCropDoc-AI recommendation store")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    prewarm_parser = subparsers.add_parser("prewarm", help="Generate the pre-warmed advice file")
+    prewarm_parser.add_argument("--output", default=RECOMMENDATION_STORE_PATH)
+    prewarm_parser.add_argument("--languages", default=",".join(SUPPORTED_LANGUAGES))
+    prewarm_parser.add_argument("--workers", type=int, default=4)
+    prewarm_parser.add_argument("--refresh", action="store_true", help="Regenerate existing entries")
+    args = parser.parse_args()
+
+    if args.command == "prewarm":
+        prewarm_store(args.output, args.languages.split(","), args.workers, args.refresh)
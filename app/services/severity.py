@@ -0,0 +1,130 @@
+"""
+CropGuard AI - Severity Estimation
+Estimates how much of the leaf is diseased and maps that fraction to the
+1-5 severity scale used by the recommendation prompt.
+
+Segmentation is a fixed color rule on the 224x224 copy the classifier
+already uses (area ratios survive the resize), so it costs no extra decode
+and about a millisecond per image:
+  - background: pixels within a small Lab box around the median color of
+                the image border, unless they are healthy green
+  - leaf:       everything else, with enclosed holes filled so dark
+                necrotic spots that match the background still count
+  - healthy:    green hues with enough saturation and brightness
+  - lesion:     leaf pixels that are not healthy
+
+A batch is converted and masked as one stacked array; images are separated
+by blank rows so the hole filling never leaks from one image into the next.
+"""
+
+import os
+
+import numpy as np
+
+from app.services.imaging import DecodedImage, INPUT_SIZE, resize_for_model
+
+# ==========================================================
+# CONFIG
+# ==========================================================
+# Upper bounds of the lesion fraction for levels 1-4; anything above is 5
+SEVERITY_THRESHOLDS = tuple(
+    float(value) for value in os.getenv("SEVERITY_THRESHOLDS", "0.05,0.15,0.30,0.50").split(",")
+)
+# OpenCV hue scale (0-179): 33-90 is yellow-green through cyan-green
+HEALTHY_HUE = (33, 90)
+MIN_SATURATION = 50
+MIN_VALUE = 40
+# Largest per-channel Lab difference (0-255 scale) from the border color
+# that still counts as background
+BACKGROUND_DISTANCE = int(os.getenv("SEVERITY_BACKGROUND_DISTANCE", "20"))
+# Below this fraction of the image there is no leaf to grade
+MIN_LEAF_FRACTION = 0.02
+
+
+def _as_model_input(image) -> np.ndarray:
+    """(224, 224, 3) uint8 RGB from a DecodedImage, an RGB array or raw bytes / path."""
+    if isinstance(image, np.ndarray):
+        return image if image.shape[:2] == (INPUT_SIZE, INPUT_SIZE) else resize_for_model(image)
+    return DecodedImage.coerce(image).resized
+
+
+def _fill_holes(masks: np.ndarray) -> np.ndarray:
+    """
+    Fill enclosed holes in an (N, H, W) bool stack with one flood fill:
+    the masks are tiled vertically inside a blank frame, the outside is
+    filled from a corner, and whatever it cannot reach is inside a mask.
+    """
+    import cv2
+
+    n, height, width = masks.shape
+    tall = np.zeros((n, height + 1, width + 2), dtype=np.uint8)
+    tall[:, 1:, 1:-1] = masks
+    tall = np.vstack([tall.reshape(-1, width + 2), np.zeros((1, width + 2), dtype=np.uint8)])
+    outside = np.zeros((tall.shape[0] + 2, tall.shape[1] + 2), dtype=np.uint8)
+    cv2.floodFill(tall, outside, (0, 0), 1, flags=4 | cv2.FLOODFILL_MASK_ONLY | (1 << 8))
+    outside = outside[1:-2, 1:-1].reshape(n, height + 1, width + 2)
+    return outside[:, 1:, 1:-1] == 0
+
+
+def lesion_masks(images: np.ndarray):
+    """
+    Leaf and lesion masks for an (N, H, W, 3) uint8 RGB stack.
+    Returns two (N, H, W) bool arrays: (leaf, lesion).
+    """
+    import cv2
+
+    n, height, width, _ = images.shape
+    flat = images.reshape(n * height, width, 3)
+    healthy = cv2.inRange(
+        cv2.cvtColor(flat, cv2.COLOR_RGB2HSV),
+        (HEALTHY_HUE[0], MIN_SATURATION, MIN_VALUE), (HEALTHY_HUE[1], 255, 255)
+    ).reshape(n, height, width) > 0
+
+    lab = cv2.cvtColor(flat, cv2.COLOR_RGB2LAB)
+    stack = lab.reshape(images.shape)
+    border = np.concatenate([stack[:, 0], stack[:, -1], stack[:, :, 0], stack[:, :, -1]], axis=1)
+    background_color = np.median(border, axis=1).astype(np.uint8)
+    # One absdiff + inRange for the whole batch: each image against its own border color
+    reference = np.repeat(background_color, height * width, axis=0).reshape(lab.shape)
+    distance = cv2.absdiff(lab, reference)
+    background = cv2.inRange(distance, (0, 0, 0), (BACKGROUND_DISTANCE,) * 3).reshape(n, height, width) > 0
+
+    leaf = _fill_holes(~background | healthy)
+    return leaf, leaf & ~healthy
+
+
+def lesion_fractions(images) -> np.ndarray:
+    """Diseased fraction of the leaf area for each image (0.0 when no leaf is found)."""
+    stack = np.stack([_as_model_input(image) for image in images])
+    leaf, lesion = lesion_masks(stack)
+    leaf_pixels = leaf.sum(axis=(1, 2))
+    fractions = lesion.sum(axis=(1, 2)) / np.maximum(leaf_pixels, 1)
+    fractions[leaf_pixels < MIN_LEAF_FRACTION * leaf[0].size] = 0.0
+    return fractions
+
+
+def severity_levels(fractions) -> np.ndarray:
+    """Map lesion fractions to severity levels 1-5."""
+    return 1 + np.searchsorted(SEVERITY_THRESHOLDS, np.asarray(fractions), side="right")
+
+
+def is_healthy_class(disease_name: str) -> bool:
+    return "healthy" in disease_name.lower()
+
+
+def estimate_severity_batch(images, disease_names=None) -> list:
+    """
+    Severity level (1-5) per image. Images predicted as a healthy class are
+    level 1 whatever the color rule finds (natural yellowing, soil, ...).
+    """
+    if len(images) == 0:
+        return []
+    levels = severity_levels(lesion_fractions(images)).tolist()
+    if disease_names is not None:
+        levels = [1 if is_healthy_class(name) else level for name, level in zip(disease_names, levels)]
+    return levels
+
+
+def estimate_severity(image, disease_name: str = None) -> int:
+    """Severity level (1-5) for one image."""
+    return estimate_severity_batch([image], None if disease_name is None else [disease_name])[0]
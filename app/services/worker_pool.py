@@ -0,0 +1,495 @@
+"""
+CropGuard AI - Out-of-Process Inference Workers
+Runs the classifier in a pool of dedicated worker processes instead of the
+Flask request threads, so PyTorch's thread pool no longer competes with the
+web server (and its GIL) for the same cores, and the web process never
+imports torch at all.
+
+Request threads resize the photo to the 224x224 model input and write it
+into a slot of one multiprocessing.shared_memory block; only the slot index
+crosses the pipe to a worker. Each worker micro-batches, runs predict_batch
+and sends back the small result dicts.
+
+Enabled with INFERENCE_WORKERS=N. Run the web tier as a single process
+with threads (e.g. gunicorn --workers 1 --threads 16) so all requests
+share one pool.
+
+Workers share one copy of torch and of the weights. A fork server (`python
+-m app.services.worker_pool --fork-server --fd N`, a fresh interpreter that
+imports only the prediction service, not Flask or the app module that
+started it) imports torch and loads the model once, then forks every worker
+from that state, so the import heap and the weights are copy-on-write
+pages shared by all of them. The weights themselves are memory-mapped from
+the .pth file (PREDICT_MMAP_WEIGHTS), so they stay shared with any other
+process serving the same file too. Set INFERENCE_WORKER_START=spawn (the
+default where os.fork is missing) to start each worker as its own
+interpreter with its own copy instead.
+"""
+
+import argparse
+import atexit
+import os
+import traceback
+import queue
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing import resource_tracker
+from multiprocessing.connection import Connection
+from multiprocessing.reduction import recv_handle, send_handle
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from app.services.imaging import INPUT_SIZE, DecodedImage, resize_for_model
+
+# ==========================================================
+# CONFIG
+# ==========================================================
+# 0 keeps inference in the web process (InferenceBatcher)
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "0"))
+# torch / ONNX Runtime threads per worker; 0 splits the cores evenly
+INFERENCE_WORKER_THREADS = int(os.getenv("INFERENCE_WORKER_THREADS", "0"))
+# Images in flight at once; submit() blocks while every slot is in use
+INFERENCE_SHM_SLOTS = int(os.getenv("INFERENCE_SHM_SLOTS", "0"))
+INFERENCE_TIMEOUT_SECONDS = float(os.getenv("INFERENCE_TIMEOUT_SECONDS", "30"))
+WORKER_STARTUP_TIMEOUT_SECONDS = float(os.getenv("INFERENCE_WORKER_STARTUP_TIMEOUT", "180"))
+# fork-server (workers share the preloaded model) or spawn (one interpreter each)
+WORKER_START_METHODS = ("fork-server", "spawn")
+INFERENCE_WORKER_START = os.getenv("INFERENCE_WORKER_START", "fork-server" if hasattr(os, "fork") else "spawn")
+
+SLOT_SHAPE = (INPUT_SIZE, INPUT_SIZE, 3)
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def default_worker_threads(workers: int) -> int:
+    return INFERENCE_WORKER_THREADS or max(1, (os.cpu_count() or 1) // max(1, workers))
+
+
+# ==========================================================
+# WORKER PROCESS
+# ==========================================================
+def _attach_slots(shm_name: str, slots: int):
+    shm = SharedMemory(name=shm_name)
+    # The parent owns the block; stop this process's resource tracker from
+    # unlinking it when the worker exits
+    resource_tracker.unregister(shm._name, "shared_memory")
+    return shm, np.ndarray((slots,) + SLOT_SHAPE, dtype=np.uint8, buffer=shm.buf)
+
+
+def _import_prediction_service(config: dict):
+    """Import the prediction service configured for a worker; returns torch (or None)."""
+    # Before importing the prediction service, which reads it at import
+    os.environ["ONNX_INTRA_OP_THREADS"] = str(config["threads"])
+    from app.services.lazy_imports import optional_import
+    import app.services.prediction  # noqa: F401
+
+    return optional_import("torch")
+
+
+def _load_worker_model(config: dict):
+    from app.services.prediction import load_mobilenet_model
+
+    return load_mobilenet_model(config["weights_path"], backend=config["backend"])
+
+
+def _serve(conn: Connection, config: dict, model=None):
+    """
+    Worker loop: load the model unless one was inherited, then answer
+    [slot, ...] batches with one result dict per slot until told to stop.
+    """
+    from app.services.imaging import BatchPreprocessor
+    from app.services.prediction import predict_batch
+
+    if model is None:
+        try:
+            model = _load_worker_model(config)
+        except Exception as e:
+            conn.send(("failed", f"{type(e).__name__}: {e}"))
+            return
+    shm, slots = _attach_slots(config["shm_name"], config["slots"])
+    preprocessor = BatchPreprocessor(config["max_batch_size"])
+    conn.send(("ready", {"weights_version": model.weights_version, "backend": model.backend}))
+
+    try:
+        while True:
+            try:
+                batch = conn.recv()
+            except EOFError:
+                break  # parent went away
+            if batch is None:
+                break
+            try:
+                # The staging copy happens here; the slots are free once it returns
+                results = predict_batch(model, preprocessor([slots[slot] for slot in batch]))
+                conn.send(("ok", results))
+            except Exception as e:
+                conn.send(("error", f"{type(e).__name__}: {e}"))
+    finally:
+        del slots
+        shm.close()
+
+
+def worker_main(fd: int):
+    """Spawned worker: receive a config, load the model and serve."""
+    conn = Connection(fd)
+    config = conn.recv()
+    torch = _import_prediction_service(config)
+    if torch is not None:
+        torch.set_num_threads(config["threads"])
+    _serve(conn, config)
+
+
+def fork_server_main(fd: int):
+    """
+    Fork server: receive a config, load the model once, then fork one
+    worker per ("fork", index) request, handing it the socket that follows
+    the request. Replies ("forked", pid). Exits, after its workers, when
+    the pool closes the connection.
+    """
+    conn = Connection(fd)
+    config = conn.recv()
+    torch = _import_prediction_service(config)
+    if torch is not None:
+        # A single thread keeps OpenMP from starting its pool, which does not
+        # survive fork; each worker sets its own thread count
+        torch.set_num_threads(1)
+
+    from app.services.prediction import PREDICT_BACKEND
+
+    model = None
+    # ONNX Runtime sessions own threads, so each worker opens its own
+    if (config["backend"] or PREDICT_BACKEND).lower() != "onnx":
+        try:
+            model = _load_worker_model(config)
+        except Exception as e:
+            conn.send(("failed", f"{type(e).__name__}: {e}"))
+            return
+    conn.send(("ready", None))
+
+    children = set()
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+        handle = recv_handle(conn)
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                conn.close()
+                if torch is not None:
+                    torch.set_num_threads(config["threads"])
+                _serve(Connection(handle), config, model)
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            finally:
+                os._exit(code)
+        os.close(handle)
+        children.add(pid)
+        conn.send(("forked", pid))
+        for child in list(children):
+            if os.waitpid(child, os.WNOHANG)[0]:
+                children.discard(child)
+
+    for child in children:
+        os.waitpid(child, 0)
+
+
+# ==========================================================
+# POOL (WEB PROCESS SIDE)
+# ==========================================================
+class InferenceWorkerPool:
+    """
+    Same interface as InferenceBatcher (submit / predict / close) backed by
+    worker processes. Also carries `weights_version` and `backend`, so the
+    endpoints can use it in place of the model object:
+
+        pool = InferenceWorkerPool(workers=4)
+        result = pool.predict(decoded_image)
+        results = pool.predict_images([decoded_a, decoded_b])
+
+    One feeder thread per worker pulls requests from a shared queue, groups
+    them into a micro-batch (up to `max_batch_size`, or whatever arrived
+    within `max_wait_ms`), and waits for that worker's answer. Idle workers
+    pick up the next batch first. A worker that dies is restarted (forked
+    again from the preloaded model) and the requests it held fail with
+    RuntimeError.
+    """
+
+    def __init__(self, workers: int = None, weights_path: str = None,
+                 backend: str = None, max_batch_size: int = None, max_wait_ms: float = None,
+                 threads: int = None, slots: int = None, start_method: str = None):
+        from app.services.prediction import MAX_BATCH_SIZE, MAX_WAIT_MS, MODEL_WEIGHTS_PATH
+
+        self.start_method = (start_method or INFERENCE_WORKER_START).lower()
+        if self.start_method not in WORKER_START_METHODS:
+            raise ValueError(f"❌ Unknown INFERENCE_WORKER_START '{self.start_method}'. "
+                             f"Choose one of: {', '.join(WORKER_START_METHODS)}")
+        self.workers = max(1, workers or INFERENCE_WORKERS or 1)
+        self.weights_path = weights_path = weights_path or MODEL_WEIGHTS_PATH
+        self.max_batch_size = max(1, max_batch_size or MAX_BATCH_SIZE)
+        self.max_wait = max(0.0, MAX_WAIT_MS if max_wait_ms is None else max_wait_ms) / 1000.0
+        self.threads = threads or default_worker_threads(self.workers)
+        self.slot_count = slots or INFERENCE_SHM_SLOTS or 2 * self.workers * self.max_batch_size
+
+        self._shm = SharedMemory(create=True, size=self.slot_count * int(np.prod(SLOT_SHAPE)))
+        self._slots = np.ndarray((self.slot_count,) + SLOT_SHAPE, dtype=np.uint8, buffer=self._shm.buf)
+        self._free_slots = queue.Queue()
+        for slot in range(self.slot_count):
+            self._free_slots.put(slot)
+        self._queue = queue.Queue()
+        self._closed = False
+        self._config = {
+            "weights_path": weights_path,
+            "backend": backend,
+            "threads": self.threads,
+            "max_batch_size": self.max_batch_size,
+            "shm_name": self._shm.name,
+            "slots": self.slot_count,
+        }
+
+        self._processes = [None] * self.workers
+        self._pids = [None] * self.workers
+        self._connections = [None] * self.workers
+        self._server = self._server_conn = None
+        self._server_lock = threading.Lock()
+        try:
+            info = self._start_workers()
+        except Exception:
+            self._shutdown_workers()
+            self._release_shared_memory()
+            raise
+        self.weights_version = info["weights_version"]
+        self.backend = f"{info['backend']}-workers"
+
+        self._feeders = [
+            threading.Thread(target=self._feed, args=(i,), name=f"inference-feeder-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for feeder in self._feeders:
+            feeder.start()
+        atexit.register(self.close)
+        print(f"✅ Started {self.workers} inference workers "
+              f"({self.threads} threads each, {self.slot_count} shared-memory slots, {self.start_method})")
+
+    @property
+    def pids(self) -> list:
+        """Process ids of the workers and of the fork server, if any."""
+        pids = [pid for pid in self._pids if pid is not None]
+        return pids + ([self._server.pid] if self._server is not None else [])
+
+    # ------------------------------------------------------
+    # Worker lifecycle
+    # ------------------------------------------------------
+    def _popen_worker(self, *args) -> tuple:
+        """Start `python -m app.services.worker_pool <args> --fd N`; returns (process, connection)."""
+        parent_sock, child_sock = socket.socketpair()
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join(p for p in (PROJECT_ROOT, env.get("PYTHONPATH")) if p)
+        process = subprocess.Popen(
+            [sys.executable, "-m", "app.services.worker_pool", *args, "--fd", str(child_sock.fileno())],
+            pass_fds=(child_sock.fileno(),), env=env,
+        )
+        child_sock.close()
+        conn = Connection(parent_sock.detach())
+        conn.send(self._config)
+        return process, conn
+
+    def _start_fork_server(self):
+        self._server, self._server_conn = self._popen_worker("--fork-server")
+        self._await_ready(self._server_conn, "fork server")
+
+    def _spawn(self, index: int):
+        if self.start_method == "spawn":
+            process, conn = self._popen_worker()
+            self._processes[index], self._pids[index] = process, process.pid
+            self._connections[index] = conn
+            return
+
+        parent_sock, child_sock = socket.socketpair()
+        try:
+            with self._server_lock:
+                if self._server.poll() is not None:
+                    print(f"⚠️ Inference fork server exited with code {self._server.poll()}; restarting")
+                    self._server_conn.close()
+                    self._start_fork_server()
+                self._server_conn.send(("fork", index))
+                send_handle(self._server_conn, child_sock.fileno(), self._server.pid)
+                _, pid = self._server_conn.recv()
+        finally:
+            child_sock.close()
+        self._pids[index], self._connections[index] = pid, Connection(parent_sock.detach())
+
+    def _await_ready(self, conn: Connection, name: str):
+        if not conn.poll(WORKER_STARTUP_TIMEOUT_SECONDS):
+            raise RuntimeError(f"❌ Inference {name} did not start within "
+                               f"{WORKER_STARTUP_TIMEOUT_SECONDS:.0f}s")
+        try:
+            status, payload = conn.recv()
+        except EOFError:
+            raise RuntimeError(f"❌ Inference {name} exited during startup")
+        if status != "ready":
+            raise RuntimeError(f"❌ Inference {name} failed to load the model: {payload}")
+        return payload
+
+    def _start_workers(self) -> dict:
+        if self.start_method == "fork-server":
+            self._start_fork_server()
+        # Start everything first so spawned workers load their models in parallel
+        for index in range(self.workers):
+            self._spawn(index)
+        infos = [self._await_ready(self._connections[index], f"worker {index}") for index in range(self.workers)]
+        return infos[0]
+
+    def _restart(self, index: int):
+        process = self._processes[index]
+        exit_code = f" with exit code {process.poll()}" if process is not None else ""
+        print(f"⚠️ Inference worker {index} (pid {self._pids[index]}) died{exit_code}; restarting")
+        self._connections[index].close()
+        self._spawn(index)
+        self._await_ready(self._connections[index], f"worker {index}")
+
+    # ------------------------------------------------------
+    # Request side
+    # ------------------------------------------------------
+    def submit(self, image) -> Future:
+        """Queue a DecodedImage (or any (H, W, 3) uint8 array); returns a Future."""
+        if self._closed:
+            raise RuntimeError("InferenceWorkerPool is closed")
+        if isinstance(image, np.ndarray):
+            resized = resize_for_model(image) if image.dtype == np.uint8 else None
+        else:
+            resized = DecodedImage.coerce(image).resized
+        if resized is None:
+            raise TypeError("InferenceWorkerPool takes images, not preprocessed tensors")
+
+        slot = self._free_slots.get(timeout=INFERENCE_TIMEOUT_SECONDS)
+        self._slots[slot] = resized
+        future = Future()
+        self._queue.put((slot, future))
+        return future
+
+    def predict(self, image, timeout: float = INFERENCE_TIMEOUT_SECONDS) -> dict:
+        """Submit an image and wait for its result."""
+        return self.submit(image).result(timeout=timeout)
+
+    def predict_images(self, images, timeout: float = INFERENCE_TIMEOUT_SECONDS) -> list:
+        """Results for a list of images, in order; they are spread over the workers."""
+        futures = [self.submit(image) for image in images]
+        return [future.result(timeout=timeout) for future in futures]
+
+    def close(self):
+        """Stop the workers after draining requests already queued."""
+        if self._closed:
+            return
+        self._closed = True
+        for _ in self._feeders:
+            self._queue.put(None)
+        for feeder in self._feeders:
+            feeder.join()
+        self._shutdown_workers()
+        self._release_shared_memory()
+
+    def _shutdown_workers(self):
+        for conn in self._connections:
+            if conn is not None:
+                try:
+                    conn.send(None)
+                except OSError:
+                    pass
+        if self._server_conn is not None:
+            # The fork server waits for its workers, then exits
+            try:
+                self._server_conn.send(None)
+            except OSError:
+                pass
+        for process in self._processes + [self._server]:
+            if process is None:
+                continue
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+        for conn in self._connections + [self._server_conn]:
+            if conn is not None:
+                conn.close()
+
+    def _release_shared_memory(self):
+        del self._slots
+        self._shm.close()
+        self._shm.unlink()
+
+    # ------------------------------------------------------
+    # Feeder threads
+    # ------------------------------------------------------
+    def _feed(self, index: int):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                break
+
+            batch = [item]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 \
+                        else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            self._run_batch(index, batch)
+
+    def _run_batch(self, index: int, batch):
+        # Skip callers that cancelled while waiting in the queue
+        live = [(slot, future) for slot, future in batch if future.set_running_or_notify_cancel()]
+        try:
+            if not live:
+                return
+            try:
+                conn = self._connections[index]
+                conn.send([slot for slot, _ in live])
+                status, payload = conn.recv()
+            except (EOFError, OSError):
+                status, payload = "error", f"inference worker {index} died"
+                self._restart(index)
+
+            if status == "ok":
+                for (_, future), result in zip(live, payload):
+                    future.set_result(result)
+            else:
+                error = RuntimeError(f"❌ Inference failed: {payload}")
+                for _, future in live:
+                    future.set_exception(error)
+        except Exception as e:
+            for _, future in live:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            for slot, _ in batch:
+                self._free_slots.put(slot)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="CropGuard AI inference worker (started by InferenceWorkerPool)")
+    parser.add_argument("--fd", type=int, required=True, help="Inherited socket to the web process")
+    parser.add_argument("--fork-server", action="store_true", help="Preload the model and fork the workers")
+    cli_args = parser.parse_args()
+    if cli_args.fork_server:
+        fork_server_main(cli_args.fd)
+    else:
+        worker_main(cli_args.fd)
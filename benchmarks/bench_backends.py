@@ -0,0 +1,164 @@
+"""
+Inference backend benchmark and accuracy-drift report.
+
+Loads the classifier once per backend in app/services/prediction.py
+(eager fp32, torchscript, dynamic_int8, static_int8) and reports:
+  - latency at batch size 1 (p50 / p95) and throughput at --batch-size
+  - drift against eager fp32: top-1 agreement, mean / max probability
+    difference, and accuracy when the images are labelled
+
+USAGE:
+    python benchmarks/bench_backends.py --images DIR            # DIR/<class name>/*.jpg is labelled
+    python benchmarks/bench_backends.py --images DIR --calibration CALIB_DIR --json report.json
+    python benchmarks/bench_backends.py --random-weights         # latency only, no trained weights
+
+Static int8 calibrates on --calibration (default: --images). Keep the
+calibration photos separate from the evaluated ones for an honest drift number.
+"""
+
+import argparse
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import torch
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.services.imaging import BatchPreprocessor
+from app.services.prediction import BACKENDS, DISEASE_CLASSES, _build_mobilenet, load_mobilenet_model
+
+
+def load_labelled_images(directory, limit):
+    """Returns (paths, labels); a label is the class index of the parent folder name, or None."""
+    paths, labels = [], []
+    for dirpath, dirnames, filenames in os.walk(directory):
+        dirnames.sort()
+        folder = os.path.basename(dirpath)
+        for name in sorted(filenames):
+            if name.lower().endswith(('.jpg', '.jpeg', '.png')):
+                paths.append(os.path.join(dirpath, name))
+                labels.append(DISEASE_CLASSES.index(folder) if folder in DISEASE_CLASSES else None)
+    if limit:
+        paths, labels = paths[:limit], labels[:limit]
+    return paths, labels
+
+
+def write_synthetic_images(directory, count, seed=0):
+    rng = np.random.default_rng(seed)
+    os.makedirs(directory, exist_ok=True)
+    for i in range(count):
+        small = rng.integers(0, 256, (48, 64, 3), dtype=np.uint8)
+        Image.fromarray(small).resize((640, 480), Image.BILINEAR).save(os.path.join(directory, f"{i:04d}.jpg"))
+    return directory
+
+
+def preprocess_all(paths, batch_size):
+    engine = BatchPreprocessor(batch_size)
+    return torch.cat([engine(paths[i:i + batch_size]).clone() for i in range(0, len(paths), batch_size)])
+
+
+def probabilities(model, inputs, batch_size):
+    with torch.no_grad():
+        return torch.cat([
+            torch.softmax(model(inputs[i:i + batch_size]), dim=1)
+            for i in range(0, len(inputs), batch_size)
+        ])
+
+
+def time_backend(model, inputs, batch_size, repeat):
+    with torch.no_grad():
+        single = inputs[:1]
+        for _ in range(5):
+            model(single)
+        latencies = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            model(single)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+        batch = inputs[:batch_size]
+        model(batch)
+        start = time.perf_counter()
+        runs = max(1, repeat // 4)
+        for _ in range(runs):
+            model(batch)
+        throughput = runs * len(batch) / (time.perf_counter() - start)
+
+    return {
+        'latency_p50_ms': round(float(np.percentile(latencies, 50)), 2),
+        'latency_p95_ms': round(float(np.percentile(latencies, 95)), 2),
+        'throughput_images_per_sec': round(throughput, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare prediction backends for latency and accuracy drift")
+    parser.add_argument('--images', help='Evaluation images; DIR/<class name>/ folders are used as labels')
+    parser.add_argument('--calibration', help='Calibration images for static_int8 (default: --images)')
+    parser.add_argument('--weights', default='mobilenetv3_best.pth')
+    parser.add_argument('--random-weights', action='store_true',
+                        help='Use an untrained model (latency comparison only)')
+    parser.add_argument('--backends', default=','.join(BACKENDS))
+    parser.add_argument('--count', type=int, default=0, help='Limit the number of evaluation images')
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--threads', type=int, default=0, help='torch.set_num_threads (default: torch default)')
+    parser.add_argument('--json', help='Write the report to this file')
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        weights = args.weights
+        if args.random_weights:
+            weights = os.path.join(tmp, 'random.pth')
+            torch.save(_build_mobilenet().state_dict(), weights)
+
+        images_dir = args.images or write_synthetic_images(os.path.join(tmp, 'images'), args.count or 64)
+        calibration_dir = args.calibration or images_dir
+        paths, labels = load_labelled_images(images_dir, args.count)
+        if not paths:
+            print("No images found.")
+            return
+        inputs = preprocess_all(paths, args.batch_size)
+        labelled = [(i, label) for i, label in enumerate(labels) if label is not None]
+        print(f"Images: {len(paths)} ({len(labelled)} labelled)  threads: {torch.get_num_threads()}")
+
+        report = {'images': len(paths), 'labelled': len(labelled), 'backends': {}}
+        reference = None
+        for backend in args.backends.split(','):
+            start = time.perf_counter()
+            model = load_mobilenet_model(weights, backend=backend, calibration_dir=calibration_dir)
+            entry = {'load_s': round(time.perf_counter() - start, 2)}
+            entry.update(time_backend(model, inputs, args.batch_size, args.repeat))
+
+            probs = probabilities(model, inputs, args.batch_size)
+            if reference is None:
+                reference = probs  # first backend (eager by default) is the baseline
+            diff = (probs - reference).abs()
+            entry['top1_agreement'] = round(float((probs.argmax(1) == reference.argmax(1)).float().mean()), 4)
+            entry['mean_prob_diff'] = round(float(diff.mean()), 6)
+            entry['max_prob_diff'] = round(float(diff.max()), 6)
+            if labelled:
+                index = torch.tensor([i for i, _ in labelled])
+                target = torch.tensor([label for _, label in labelled])
+                entry['accuracy'] = round(float((probs[index].argmax(1) == target).float().mean()), 4)
+
+            report['backends'][backend] = entry
+            print(f"{backend:14s} " + "  ".join(f"{k}={v}" for k, v in entry.items()))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.json}")
+
+
+if __name__ == '__main__':
+    main()
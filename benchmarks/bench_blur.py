@@ -0,0 +1,193 @@
+"""
+Blur-detection benchmark, calibration and agreement report.
+
+Compares check_image_quality (thumbnail pre-filter + full-resolution
+fallback) against the original float64 full-resolution Laplacian variance
+with BLUR_VARIANCE_THRESHOLD, whose decisions are the labels.
+
+Calibration picks the widest thumbnail bounds that never disagree with the
+labels on this set (BLUR_THUMBNAIL_BLURRY_BELOW / BLUR_THUMBNAIL_SHARP_ABOVE),
+widened by --margin for images outside the set.
+
+USAGE:
+    python benchmarks/bench_blur.py                          # synthetic labelled set
+    python benchmarks/bench_blur.py --images DIR             # real photos (recursive)
+    python benchmarks/bench_blur.py --images DIR --json report.json
+
+With --images, any sub-directory named "sharp" or "blurry" is also used as a
+human label and reported alongside the agreement with the existing function.
+"""
+
+import argparse
+import io
+import json
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.services.enhancer import (
+    BLUR_THUMBNAIL_BLURRY_BELOW,
+    BLUR_THUMBNAIL_SHARP_ABOVE,
+    BLUR_VARIANCE_THRESHOLD,
+    check_image_quality,
+    laplacian_variance_reference,
+    laplacian_variance_thumbnail,
+)
+from app.services.imaging import DecodedImage
+
+
+def synthetic_leaf(rng, width, height, blur_sigma):
+    """Multi-octave texture with vein-like strokes, optical blur, sensor noise and JPEG encoding."""
+    texture = np.zeros((height, width), dtype=np.float32)
+    for octave in (2, 4, 8, 32, 128):
+        noise = rng.random((max(2, height // octave), max(2, width // octave)), dtype=np.float32)
+        texture += cv2.resize(noise, (width, height), interpolation=cv2.INTER_CUBIC) * (octave / 128)
+    texture = cv2.normalize(texture, None, 40, 200, cv2.NORM_MINMAX)
+
+    for _ in range(rng.integers(5, 20)):
+        x1, x2 = rng.integers(0, width, 2)
+        y1, y2 = rng.integers(0, height, 2)
+        cv2.line(texture, (int(x1), int(y1)), (int(x2), int(y2)),
+                 float(rng.integers(20, 240)), int(rng.integers(1, 6)))
+
+    if blur_sigma > 0:
+        texture = cv2.GaussianBlur(texture, (0, 0), blur_sigma)
+    # Sensor noise lands after the lens blur; phone pipelines denoise most of it
+    texture += rng.normal(0, rng.uniform(0.0, 1.5), texture.shape).astype(np.float32)
+
+    green = np.clip(texture, 0, 255).astype(np.uint8)
+    rgb = np.stack([green // 3, green, green // 4], axis=-1)
+    buffer = io.BytesIO()
+    Image.fromarray(rgb).save(buffer, format='JPEG', quality=int(rng.integers(70, 95)))
+    return buffer.getvalue()
+
+
+def load_samples(args):
+    """Returns a list of (name, bytes, human_label or None)."""
+    if args.images:
+        samples = []
+        for root, _, files in os.walk(args.images):
+            label = os.path.basename(root).lower()
+            label = label if label in ('sharp', 'blurry') else None
+            for name in sorted(files):
+                if name.lower().endswith(('.jpg', '.jpeg', '.png')):
+                    with open(os.path.join(root, name), 'rb') as f:
+                        samples.append((os.path.join(root, name), f.read(), label))
+        return samples[:args.count] if args.count else samples
+
+    rng = np.random.default_rng(args.seed)
+    samples = []
+    count = args.count or 120
+    for i in range(count):
+        # Log-spaced blur covers both sides of the decision boundary
+        sigma = 0.0 if i % 4 == 0 else float(np.exp(rng.uniform(np.log(0.5), np.log(20))))
+        samples.append((f"synthetic_{i:03d}_sigma{sigma:.1f}",
+                        synthetic_leaf(rng, args.width, args.height, sigma), None))
+    return samples
+
+
+def calibrate(labels, thumb_scores, margin):
+    """
+    Thumbnail bounds with zero disagreements on this set: everything below
+    the lowest sharp score is blurry, everything above the highest blurry
+    score is sharp. `margin` widens the undecided band on both sides.
+    """
+    sharp_scores = thumb_scores[~labels]
+    blurry_scores = thumb_scores[labels]
+    low = sharp_scores.min() if len(sharp_scores) else thumb_scores.max() + 1
+    high = blurry_scores.max() if len(blurry_scores) else thumb_scores.min() - 1
+    low, high = low * (1 - margin), np.nextafter(high, np.inf) * (1 + margin)
+    if low > high:
+        low = high = (low + high) / 2
+    return float(low), float(high)
+
+
+def timed(fn, samples):
+    scores, start = [], time.perf_counter()
+    for _, data, _ in samples:
+        # Fresh DecodedImage per call: each detector pays for its own decode
+        scores.append(fn(DecodedImage.from_bytes(data)))
+    return np.array(scores), time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark and calibrate the thumbnail blur detector")
+    parser.add_argument('--images', help='Directory of labelled photos (default: synthetic)')
+    parser.add_argument('--count', type=int, default=0)
+    parser.add_argument('--width', type=int, default=4000)
+    parser.add_argument('--height', type=int, default=3000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--margin', type=float, default=0.1,
+                        help='Relative widening of the calibrated undecided band')
+    parser.add_argument('--json', help='Write the report to this file')
+    args = parser.parse_args()
+
+    samples = load_samples(args)
+    if not samples:
+        print("No images found.")
+        return
+    print(f"Samples: {len(samples)}")
+
+    reference_scores, reference_time = timed(laplacian_variance_reference, samples)
+    thumb_scores, thumb_time = timed(laplacian_variance_thumbnail, samples)
+    decisions, check_time = timed(check_image_quality, samples)
+
+    reference = reference_scores < BLUR_VARIANCE_THRESHOLD
+    current = decisions.astype(bool)
+    decided_on_thumbnail = (thumb_scores < BLUR_THUMBNAIL_BLURRY_BELOW) | \
+        (thumb_scores >= BLUR_THUMBNAIL_SHARP_ABOVE)
+    low, high = calibrate(reference, thumb_scores, args.margin)
+    suggested_decided = (thumb_scores < low) | (thumb_scores >= high)
+
+    report = {
+        'samples': len(samples),
+        'reference_threshold': BLUR_VARIANCE_THRESHOLD,
+        'thumbnail_bounds': [BLUR_THUMBNAIL_BLURRY_BELOW, BLUR_THUMBNAIL_SHARP_ABOVE],
+        'agreement': round(float(np.mean(reference == current)), 4),
+        'confusion': {
+            'both_blurry': int(np.sum(reference & current)),
+            'both_sharp': int(np.sum(~reference & ~current)),
+            'only_reference_blurry': int(np.sum(reference & ~current)),
+            'only_new_blurry': int(np.sum(~reference & current)),
+        },
+        'decided_on_thumbnail': round(float(np.mean(decided_on_thumbnail)), 4),
+        'suggested_bounds': [round(low, 2), round(high, 2)],
+        'suggested_decided_on_thumbnail': round(float(np.mean(suggested_decided)), 4),
+        'reference_ms_per_image': round(reference_time / len(samples) * 1000, 2),
+        'thumbnail_ms_per_image': round(thumb_time / len(samples) * 1000, 2),
+        'check_ms_per_image': round(check_time / len(samples) * 1000, 2),
+        'speedup': round(reference_time / check_time, 1),
+    }
+
+    human = [(label, blurry) for (_, _, label), blurry in zip(samples, current) if label]
+    if human:
+        report['human_label_agreement'] = round(
+            float(np.mean([(label == 'blurry') == blurry for label, blurry in human])), 4)
+
+    disagreements = [
+        {'image': name, 'reference_score': round(float(f), 2), 'thumbnail_score': round(float(t), 2)}
+        for (name, _, _), f, t, r, c in zip(samples, reference_scores, thumb_scores, reference, current)
+        if r != c
+    ]
+    report['disagreements'] = disagreements
+
+    for key, value in report.items():
+        if key != 'disagreements':
+            print(f"{key:24s} {value}")
+    for item in disagreements[:20]:
+        print(f"  disagree: {item}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.json}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""
+Import-time benchmark and regression guard for the web app.
+
+Imports a module (app.main by default) in fresh interpreters with
+`python -X importtime` and reports the cumulative import time, the slowest
+imports, max RSS and which heavy libraries got loaded. Exits with status 1
+when a budget is exceeded or a forbidden module is imported, so CI can run:
+
+    python benchmarks/bench_import_time.py --max-ms 1500 --json import_time.json
+
+USAGE:
+    python benchmarks/bench_import_time.py                       # report only
+    python benchmarks/bench_import_time.py --module app.services.prediction
+    python benchmarks/bench_import_time.py --forbid torch,cv2 --max-rss-mb 150
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# Loaded on first use by the services; importing app.main must not pull them in
+DEFAULT_FORBIDDEN = 'torch,torchvision,cv2,realesrgan,basicsr,openai,onnxruntime'
+
+PROBE = """
+import json, resource, sys
+import {module}
+print(json.dumps({{
+    'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    'modules': sorted(name for name in sys.modules if '.' not in name),
+}}))
+"""
+
+
+def run_probe(module):
+    """One fresh interpreter: returns (importtime rows, probe result)."""
+    env = dict(os.environ, PYTHONPATH=ROOT, WARMUP_ON_STARTUP='false', DEBUG='false')
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', PROBE.format(module=module)],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=False,
+    )
+    if proc.returncode != 0:
+        raise SystemExit(f"Importing {module} failed:\n{proc.stderr[-2000:]}")
+
+    rows = []
+    for line in proc.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package"
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        rows.append((name.rstrip(), int(self_us), int(cumulative_us)))
+    return rows, json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure and guard the import time of the web app")
+    parser.add_argument('--module', default='app.main')
+    parser.add_argument('--runs', type=int, default=5, help='Fresh interpreters; the median is reported')
+    parser.add_argument('--top', type=int, default=15, help='Slowest imports to list')
+    parser.add_argument('--forbid', default=DEFAULT_FORBIDDEN,
+                        help='Comma-separated top-level modules that must not be imported ("" to disable)')
+    parser.add_argument('--max-ms', type=float, default=0, help='Fail above this cumulative import time')
+    parser.add_argument('--max-rss-mb', type=float, default=0, help='Fail above this max RSS after import')
+    parser.add_argument('--json', help='Write the report to this file')
+    args = parser.parse_args()
+
+    runs = [run_probe(args.module) for _ in range(max(1, args.runs))]
+    totals_ms = []
+    for rows, _ in runs:
+        total = next((cum for name, _, cum in rows if name.strip() == args.module), 0)
+        totals_ms.append(total / 1000)
+    median_index = totals_ms.index(sorted(totals_ms)[len(totals_ms) // 2])
+    rows, probe = runs[median_index]
+
+    forbidden = [name for name in args.forbid.split(',') if name]
+    loaded_forbidden = [name for name in forbidden if name in probe['modules']]
+    slowest = sorted(rows, key=lambda row: row[1], reverse=True)[:args.top]
+
+    report = {
+        'module': args.module,
+        'runs': len(runs),
+        'import_ms_median': round(statistics.median(totals_ms), 1),
+        'import_ms_min': round(min(totals_ms), 1),
+        'max_rss_mb': round(probe['max_rss_mb'], 1),
+        'forbidden_loaded': loaded_forbidden,
+        'slowest_self_ms': [{'module': name.strip(), 'self_ms': round(self_us / 1000, 1),
+                             'cumulative_ms': round(cum_us / 1000, 1)}
+                            for name, self_us, cum_us in slowest],
+    }
+
+    print(f"{args.module}: {report['import_ms_median']} ms median over {len(runs)} runs "
+          f"(min {report['import_ms_min']} ms), max RSS {report['max_rss_mb']} MB")
+    print(f"Forbidden modules loaded: {', '.join(loaded_forbidden) or 'none'}")
+    print("Slowest imports (self time):")
+    for item in report['slowest_self_ms']:
+        print(f"  {item['self_ms']:8.1f} ms  (cumulative {item['cumulative_ms']:8.1f} ms)  {item['module']}")
+
+    failures = []
+    if loaded_forbidden:
+        failures.append(f"imports {', '.join(loaded_forbidden)}")
+    if args.max_ms and report['import_ms_median'] > args.max_ms:
+        failures.append(f"import time {report['import_ms_median']} ms > {args.max_ms} ms")
+    if args.max_rss_mb and report['max_rss_mb'] > args.max_rss_mb:
+        failures.append(f"max RSS {report['max_rss_mb']} MB > {args.max_rss_mb} MB")
+    report['failures'] = failures
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.json}")
+
+    if failures:
+        print(f"\nFAIL: {args.module} " + "; ".join(failures))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+HTML page rendering load test: cached pages vs per-request read + compile.
+
+Requests every page through the Flask test client (no network, so the
+numbers are pure server cost) and reports requests/sec, latency p50 / p99
+and bytes sent per request for:
+  - legacy:      open + read + render_template_string on every request
+                 (how app/main.py served pages before the render cache)
+  - cached:      PageRenderer, uncompressed
+  - cached_gzip: PageRenderer with Accept-Encoding: gzip, br
+  - revalidate:  conditional request with the page's ETag (304)
+
+USAGE:
+    python benchmarks/bench_pages.py
+    python benchmarks/bench_pages.py --requests 5000 --clients 8 --json pages.json
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ.setdefault('WARMUP_ON_STARTUP', 'false')
+
+from flask import render_template_string
+
+from app.main import APP_ROOT, app
+
+PAGES = {'/': 'index.html', '/about': 'about.html', '/guide': 'guide.html',
+         '/upload': 'upload.html', '/login': 'login.html', '/profile': 'profile.html'}
+
+
+@app.route('/_bench/legacy/<name>')
+def legacy_page(name):
+    with open(APP_ROOT / 'frontend' / name, 'r', encoding='utf-8') as f:
+        content = f.read()
+    return render_template_string(content)
+
+
+def run(label, make_request, total, clients):
+    paths = list(PAGES)
+    latencies, sizes, lock = [], [], threading.Lock()
+    counter = iter(range(total))
+
+    def client():
+        http = app.test_client()
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            start = time.perf_counter()
+            response = make_request(http, paths[i % len(paths)])
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                latencies.append(elapsed)
+                sizes.append(len(response.get_data()))
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - start
+    return {
+        'requests_per_sec': round(len(latencies) / wall, 1),
+        'latency_p50_ms': round(float(np.percentile(latencies, 50)), 3),
+        'latency_p99_ms': round(float(np.percentile(latencies, 99)), 3),
+        'bytes_per_request': round(float(np.mean(sizes))),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare cached and per-request page rendering")
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--clients', type=int, default=4, help='Concurrent client threads')
+    parser.add_argument('--json', help='Write the report to this file')
+    args = parser.parse_args()
+
+    http = app.test_client()
+    etags = {path: http.get(path, headers={'Accept-Encoding': 'gzip, br'}).headers['ETag'] for path in PAGES}
+
+    modes = {
+        'legacy': lambda c, path: c.get(f'/_bench/legacy/{PAGES[path]}'),
+        'cached': lambda c, path: c.get(path),
+        'cached_gzip': lambda c, path: c.get(path, headers={'Accept-Encoding': 'gzip, br'}),
+        'revalidate': lambda c, path: c.get(path, headers={'Accept-Encoding': 'gzip, br',
+                                                           'If-None-Match': etags[path]}),
+    }
+    report = {'requests': args.requests, 'clients': args.clients, 'modes': {}}
+    for label, make_request in modes.items():
+        make_request(http, '/')  # warm-up
+        entry = run(label, make_request, args.requests, args.clients)
+        report['modes'][label] = entry
+        print(f"{label:12s} " + "  ".join(f"{k}={v}" for k, v in entry.items()))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.json}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+"""
+Severity estimator benchmark and accuracy report.
+
+Runs app.services.severity on a labelled reference set and reports level
+accuracy, within-one-level accuracy, lesion-fraction error and latency
+(one image at a time vs batches).
+
+The default reference set is synthetic and reproducible (--seed): a
+textured green leaf on a gray, soil or dark background, with brown, dark,
+yellow and white lesions covering a known fraction of the leaf. The true
+fraction is measured from the drawn masks, so the labels are exact.
+--save DIR writes it out as JPEGs in level sub-directories.
+
+USAGE:
+    python benchmarks/bench_severity.py                          # synthetic reference set
+    python benchmarks/bench_severity.py --save reference/        # also write the set to disk
+    python benchmarks/bench_severity.py --images DIR --json report.json
+
+With --images, sub-directories named 1-5 (or severity_1 ... severity_5)
+are the human-assigned levels; other images are timed but not scored.
+"""
+
+import argparse
+import io
+import json
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.services.imaging import DecodedImage
+from app.services.severity import (
+    SEVERITY_THRESHOLDS, estimate_severity, estimate_severity_batch, lesion_fractions, severity_levels,
+)
+
+BACKGROUNDS = {'gray': (150, 150, 145), 'soil': (95, 70, 50), 'dark': (25, 25, 25)}
+LESION_COLORS = {'brown': (110, 70, 30), 'dark': (35, 30, 20), 'yellow': (200, 180, 40), 'white': (225, 225, 215)}
+
+
+def synthetic_leaf(rng, width, height, target_fraction):
+    """Returns (jpeg bytes, true lesion fraction of the leaf area)."""
+    background = list(BACKGROUNDS.values())[rng.integers(len(BACKGROUNDS))]
+    rgb = np.empty((height, width, 3), dtype=np.uint8)
+    rgb[:] = background
+    rgb = np.clip(rgb + rng.normal(0, 6, rgb.shape), 0, 255).astype(np.uint8)
+
+    leaf = np.zeros((height, width), dtype=np.uint8)
+    center = (int(width * rng.uniform(0.4, 0.6)), int(height * rng.uniform(0.4, 0.6)))
+    axes = (int(width * rng.uniform(0.25, 0.4)), int(height * rng.uniform(0.2, 0.35)))
+    cv2.ellipse(leaf, center, axes, float(rng.uniform(0, 180)), 0, 360, 1, -1)
+    leaf = leaf.astype(bool)
+
+    shade = rng.uniform(0.7, 1.1, (height // 16 + 1, width // 16 + 1)).astype(np.float32)
+    shade = cv2.resize(shade, (width, height), interpolation=cv2.INTER_CUBIC)[..., None]
+    green = np.array((50, 140, 40), dtype=np.float32) * shade
+    rgb[leaf] = np.clip(green[leaf], 0, 255).astype(np.uint8)
+
+    # Drop spots until the target share of the leaf is covered
+    lesion = np.zeros_like(leaf)
+    leaf_pixels = leaf.sum()
+    ys, xs = np.nonzero(leaf)
+    color_names = list(LESION_COLORS)
+    style = color_names[rng.integers(len(color_names))]
+    while lesion.sum() < target_fraction * leaf_pixels:
+        i = rng.integers(len(xs))
+        spot = np.zeros((height, width), dtype=np.uint8)
+        radius = int(min(width, height) * rng.uniform(0.01, 0.06))
+        cv2.circle(spot, (int(xs[i]), int(ys[i])), radius, 1, -1)
+        spot = spot.astype(bool) & leaf & ~lesion
+        color = LESION_COLORS[style if rng.random() < 0.8 else color_names[rng.integers(len(color_names))]]
+        rgb[spot] = np.clip(np.array(color) + rng.normal(0, 8, (spot.sum(), 3)), 0, 255).astype(np.uint8)
+        lesion |= spot
+
+    buffer = io.BytesIO()
+    Image.fromarray(rgb).save(buffer, format='JPEG', quality=int(rng.integers(75, 95)))
+    return buffer.getvalue(), float(lesion.sum() / leaf_pixels)
+
+
+def load_samples(args):
+    """Returns a list of (name, bytes, level or None, true fraction or None)."""
+    if args.images:
+        samples = []
+        for root, _, files in os.walk(args.images):
+            label = os.path.basename(root).lower().replace('severity_', '')
+            level = int(label) if label in ('1', '2', '3', '4', '5') else None
+            for name in sorted(files):
+                if name.lower().endswith(('.jpg', '.jpeg', '.png')):
+                    with open(os.path.join(root, name), 'rb') as f:
+                        samples.append((os.path.join(root, name), f.read(), level, None))
+        return samples[:args.count] if args.count else samples
+
+    rng = np.random.default_rng(args.seed)
+    # Spread the targets over every level, including the boundaries
+    edges = (0.0,) + SEVERITY_THRESHOLDS + (0.8,)
+    samples = []
+    for i in range(args.count or 200):
+        level = i % 5
+        target = rng.uniform(edges[level], edges[level + 1])
+        data, fraction = synthetic_leaf(rng, args.width, args.height, target)
+        samples.append((f"synthetic_{i:03d}", data, int(severity_levels([fraction])[0]), fraction))
+    return samples
+
+
+def save_samples(samples, directory):
+    for name, data, level, _ in samples:
+        level_dir = os.path.join(directory, str(level))
+        os.makedirs(level_dir, exist_ok=True)
+        with open(os.path.join(level_dir, f"{os.path.basename(name)}.jpg"), 'wb') as f:
+            f.write(data)
+    print(f"Reference set written to {directory}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the lesion-area severity estimator")
+    parser.add_argument('--images', help='Directory of real photos (level sub-directories are labels)')
+    parser.add_argument('--count', type=int, default=0, help='Number of images (0 = all / 200 synthetic)')
+    parser.add_argument('--width', type=int, default=1024)
+    parser.add_argument('--height', type=int, default=768)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--save', help='Write the synthetic reference set to this directory')
+    parser.add_argument('--json', help='Write the report to this file')
+    args = parser.parse_args()
+
+    samples = load_samples(args)
+    if args.save and not args.images:
+        save_samples(samples, args.save)
+
+    # The classifier already computes the 224x224 view, so it is prepared
+    # outside the timed region
+    images = [DecodedImage.from_bytes(data) for _, data, _, _ in samples]
+    for image in images:
+        image.resized
+    estimate_severity(images[0])  # warm-up (OpenCV kernels)
+
+    start = time.perf_counter()
+    single = [estimate_severity(image) for image in images]
+    single_ms = (time.perf_counter() - start) * 1000 / len(images)
+
+    start = time.perf_counter()
+    batched = []
+    for i in range(0, len(images), args.batch_size):
+        batched.extend(estimate_severity_batch(images[i:i + args.batch_size]))
+    batch_ms = (time.perf_counter() - start) * 1000 / len(images)
+    assert batched == single, "batch mode must match single-image results"
+
+    report = {
+        'images': len(samples),
+        'single_ms_per_image': round(single_ms, 3),
+        'batch_ms_per_image': round(batch_ms, 3),
+        'batch_size': args.batch_size,
+    }
+
+    labelled = [(level, predicted) for (_, _, level, _), predicted in zip(samples, single) if level is not None]
+    if labelled:
+        truth, predicted = np.array(labelled).T
+        report['level_accuracy'] = round(float(np.mean(truth == predicted)), 4)
+        report['within_one_level'] = round(float(np.mean(np.abs(truth - predicted) <= 1)), 4)
+        report['confusion'] = {
+            int(level): np.bincount(predicted[truth == level], minlength=6)[1:].tolist()
+            for level in range(1, 6) if np.any(truth == level)
+        }
+    true_fractions = [fraction for _, _, _, fraction in samples if fraction is not None]
+    if true_fractions:
+        estimated = lesion_fractions(images)
+        report['fraction_mae'] = round(float(np.mean(np.abs(estimated - np.array(true_fractions)))), 4)
+
+    for key, value in report.items():
+        print(f"{key:22s} {value}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.json}")
+
+
+if __name__ == '__main__':
+    main()
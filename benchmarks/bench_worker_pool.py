@@ -0,0 +1,195 @@
+"""
+In-process batcher vs out-of-process inference workers.
+
+Drives predict_disease from --clients concurrent threads, each decoding a
+JPEG and running the blur check first like a real /api/predict request,
+and reports throughput, latency p50 / p95 / p99 and memory:
+  - inprocess: InferenceBatcher in the web process (INFERENCE_WORKERS=0)
+  - workers:   InferenceWorkerPool with --workers processes
+  - workers-spawn: the same pool with INFERENCE_WORKER_START=spawn and
+                   PREDICT_MMAP_WEIGHTS=false, so every worker imports
+                   torch and holds the weights on its own
+
+Each mode runs in a fresh interpreter so torch loaded by one mode does not
+count against the other. Memory is RSS and PSS (proportional set size,
+which splits shared pages between processes) summed over the web process
+and its inference workers, and the total PSS of each mode is reported
+against the single-process (inprocess) baseline.
+
+USAGE:
+    python benchmarks/bench_worker_pool.py --random-weights
+    python benchmarks/bench_worker_pool.py --workers 4 --clients 32 --requests 2000 --json pool.json
+    python benchmarks/bench_worker_pool.py --random-weights --modes inprocess,workers,workers-spawn
+"""
+
+import argparse
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+
+def make_photos(count, width=1280, height=960, seed=0):
+    rng = np.random.default_rng(seed)
+    photos = []
+    for _ in range(count):
+        small = rng.integers(0, 256, (height // 16, width // 16, 3), dtype=np.uint8)
+        buf = io.BytesIO()
+        Image.fromarray(small).resize((width, height), Image.BILINEAR).save(buf, 'JPEG', quality=90)
+        photos.append(buf.getvalue())
+    return photos
+
+
+def memory_mb(pids):
+    """(RSS, PSS) in MB summed over `pids`, from /proc."""
+    rss = pss = 0
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/smaps_rollup') as f:
+                for line in f:
+                    if line.startswith('Rss:'):
+                        rss += int(line.split()[1])
+                    elif line.startswith('Pss:'):
+                        pss += int(line.split()[1])
+        except OSError:
+            pass
+    return round(rss / 1024, 1), round(pss / 1024, 1)
+
+
+def run_mode(args):
+    """Child process: one mode, prints a JSON report on the last line."""
+    from app.services.enhancer import check_image_quality
+    from app.services.imaging import DecodedImage
+    from app.services.prediction import InferenceBatcher, load_mobilenet_model, predict_disease
+    from app.services.worker_pool import InferenceWorkerPool
+
+    if args.mode.startswith('workers'):
+        model = batcher = InferenceWorkerPool(args.workers, weights_path=args.weights)
+        pids = [os.getpid()] + model.pids
+    else:
+        if args.threads:
+            import torch
+            torch.set_num_threads(args.threads)
+        model = load_mobilenet_model(args.weights)
+        batcher = InferenceBatcher(model)
+        pids = [os.getpid()]
+
+    photos = make_photos(args.photos)
+
+    def one_request(i):
+        start = time.perf_counter()
+        image = DecodedImage.from_bytes(photos[i % len(photos)])
+        check_image_quality(image)
+        predict_disease(model, image, batcher=batcher)
+        return (time.perf_counter() - start) * 1000
+
+    for i in range(args.clients):
+        one_request(i)  # warm-up
+
+    latencies, lock, counter = [], threading.Lock(), iter(range(args.requests))
+
+    def client():
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            elapsed = one_request(i)
+            with lock:
+                latencies.append(elapsed)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(args.clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - start
+    rss, pss = memory_mb(pids)
+    batcher.close()
+
+    print(json.dumps({
+        'mode': args.mode,
+        'processes': len(pids),
+        'requests': len(latencies),
+        'throughput_rps': round(len(latencies) / wall, 1),
+        'latency_p50_ms': round(float(np.percentile(latencies, 50)), 1),
+        'latency_p95_ms': round(float(np.percentile(latencies, 95)), 1),
+        'latency_p99_ms': round(float(np.percentile(latencies, 99)), 1),
+        'rss_mb': rss,
+        'pss_mb': pss,
+        'web_process_torch_loaded': 'torch' in sys.modules,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare in-process and out-of-process inference")
+    parser.add_argument('--weights', default='mobilenetv3_best.pth')
+    parser.add_argument('--random-weights', action='store_true', help='Use an untrained model')
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 1) // 2))
+    parser.add_argument('--threads', type=int, default=0, help='torch threads for the in-process mode')
+    parser.add_argument('--clients', type=int, default=16, help='Concurrent request threads')
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--photos', type=int, default=16, help='Distinct synthetic 1280x960 JPEGs')
+    parser.add_argument('--modes', default='inprocess,workers')
+    parser.add_argument('--mode', help=argparse.SUPPRESS)
+    parser.add_argument('--json', help='Write the report to this file')
+    args = parser.parse_args()
+
+    if args.mode:
+        run_mode(args)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        weights = os.path.abspath(args.weights)
+        if args.random_weights:
+            import torch
+            from app.services.prediction import _build_mobilenet
+            weights = os.path.join(tmp, 'random.pth')
+            torch.save(_build_mobilenet().state_dict(), weights)
+
+        report = {'workers': args.workers, 'clients': args.clients, 'modes': {}}
+        for mode in args.modes.split(','):
+            cmd = [sys.executable, os.path.abspath(__file__), '--mode', mode, '--weights', weights,
+                   '--workers', str(args.workers), '--threads', str(args.threads),
+                   '--clients', str(args.clients), '--requests', str(args.requests),
+                   '--photos', str(args.photos)]
+            env = dict(os.environ, PYTHONPATH=ROOT, PYTHONWARNINGS='ignore')
+            if mode == 'workers-spawn':
+                env.update(INFERENCE_WORKER_START='spawn', PREDICT_MMAP_WEIGHTS='false')
+            proc = subprocess.run(cmd, env=env, capture_output=True, text=True, check=False)
+            if proc.returncode != 0:
+                raise SystemExit(f"{mode} failed:\n{proc.stderr[-2000:]}")
+            entry = json.loads(proc.stdout.strip().splitlines()[-1])
+            report['modes'][mode] = entry
+            print(f"{mode:13s} " + "  ".join(f"{k}={v}" for k, v in entry.items() if k != 'mode'))
+
+    baseline = report['modes'].get('inprocess')
+    if baseline:
+        print(f"\nTotal PSS against the single-process baseline ({baseline['pss_mb']} MB):")
+        for mode, entry in report['modes'].items():
+            if mode == 'inprocess':
+                continue
+            entry['pss_vs_inprocess'] = round(entry['pss_mb'] / baseline['pss_mb'], 2)
+            entry['pss_extra_mb'] = round(entry['pss_mb'] - baseline['pss_mb'], 1)
+            print(f"  {mode:13s} {entry['pss_mb']} MB ({entry['pss_vs_inprocess']}x, "
+                  f"{entry['pss_extra_mb']:+} MB, {entry['pss_extra_mb'] / args.workers:+.1f} MB per worker)")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.json}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+"""
+Local stub of the OpenAI chat completions API.
+
+Lets the recommendation service (and the load tests) run without a Groq or
+OpenAI account. Point the app at it with:
+
+    LLM_BASE_URL=http://127.0.0.1:8089/v1 GROQ_API_KEY=stub python run.py
+
+USAGE:
+    python benchmarks/llm_stub.py --port 8089 --latency 0.8 --fail-rate 0.05
+
+Or from Python:
+    server, base_url = start_stub_server(latency=0.2)
+    ...
+    server.shutdown()
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STUB_RECOMMENDATION = (
+    "**Sanitation / Cultural Practices**\n"
+    "- Remove and destroy infected leaves.\n"
+    "- Keep good spacing for air circulation.\n\n"
+    "**Treatment / Pesticide Recommendation**\n"
+    "- Apply the fungicide listed in the context at the labelled dose.\n\n"
+    "**Safety Note**\n"
+    "- Wear gloves and a mask while spraying."
+)
+
+
+class StubConfig:
+    def __init__(self, latency=0.0, jitter=0.0, fail_rate=0.0, fail_status=500,
+                 token_delay=0.01, reply=STUB_RECOMMENDATION):
+        self.latency = latency
+        self.jitter = jitter
+        self.fail_rate = fail_rate
+        self.fail_status = fail_status
+        self.token_delay = token_delay
+        self.reply = reply
+        self.requests = 0
+        self.failures = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+
+def _make_handler(config: StubConfig):
+    class ChatCompletionsHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.rstrip("/").endswith("/stats"):
+                with config.lock:
+                    body = {"requests": config.requests, "failures": config.failures,
+                            "max_in_flight": config.max_in_flight}
+                self._send_json(200, body)
+            else:
+                self._send_json(404, {"error": {"message": "not found"}})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._send_json(404, {"error": {"message": "not found"}})
+                return
+
+            with config.lock:
+                config.requests += 1
+                config.in_flight += 1
+                config.max_in_flight = max(config.max_in_flight, config.in_flight)
+            try:
+                time.sleep(max(0.0, config.latency + random.uniform(-config.jitter, config.jitter)))
+                if random.random() < config.fail_rate:
+                    with config.lock:
+                        config.failures += 1
+                    self._send_json(config.fail_status, {"error": {"message": "stub failure",
+                                                                   "type": "server_error"}})
+                    return
+                if payload.get("stream"):
+                    self._stream(payload)
+                else:
+                    self._send_json(200, self._completion(payload))
+            finally:
+                with config.lock:
+                    config.in_flight -= 1
+
+        def _completion(self, payload):
+            return {
+                "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": payload.get("model", "stub"),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": config.reply},
+                    "finish_reason": "stop",
+                }],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            }
+
+        def _stream(self, payload):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+            tokens = config.reply.split(" ")
+            for i, token in enumerate(tokens):
+                chunk = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": payload.get("model", "stub"),
+                    "choices": [{"index": 0, "delta": {"content": token + (" " if i < len(tokens) - 1 else "")},
+                                 "finish_reason": None}],
+                }
+                self._write_chunk(f"data: {json.dumps(chunk)}\n\n")
+                time.sleep(config.token_delay)
+            self._write_chunk("data: [DONE]\n\n")
+            self._write_chunk("")
+
+        def _write_chunk(self, text):
+            data = text.encode("utf-8")
+            self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+        def _send_json(self, status, body):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    return ChatCompletionsHandler
+
+
+class _StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients dropping idle keep-alive connections is normal here
+        pass
+
+
+def start_stub_server(host="127.0.0.1", port=0, **config_kwargs):
+    """Start the stub in a daemon thread. Returns (server, base_url); server.config holds counters."""
+    config = StubConfig(**config_kwargs)
+    server = _StubServer((host, port), _make_handler(config))
+    server.config = config
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub OpenAI-compatible chat completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.5, help="Seconds before responding")
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--fail-status", type=int, default=500)
+    parser.add_argument("--token-delay", type=float, default=0.02, help="Seconds between streamed tokens")
+    args = parser.parse_args()
+
+    server, base_url = start_stub_server(
+        args.host, args.port, latency=args.latency, jitter=args.jitter,
+        fail_rate=args.fail_rate, fail_status=args.fail_status, token_delay=args.token_delay,
+    )
+    print(f"Stub LLM listening at {base_url} (Ctrl+C to stop)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
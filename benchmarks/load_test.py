@@ -0,0 +1,402 @@
+"""
+End-to-end load test of the running app.
+
+Starts the app (run.py, debug off, normal startup warm-up) against a local
+stub of the OpenAI-compatible LLM API (benchmarks/llm_stub.py), then
+drives the three API endpoints from concurrent keep-alive clients:
+  - predict:                POST /api/predict
+  - recommend:              POST /api/recommend
+  - predict-and-recommend:  POST /api/predict-and-recommend (--stream for NDJSON)
+
+Uploads are synthetic leaf photos, a mix of sharp and blurry ones
+(--blurry-fraction), so both the plain and the enhancement path are hit.
+Every upload gets a few random trailing bytes (ignored by JPEG decoders)
+so the prediction cache never answers; the recommendation memo is disabled
+the same way. Pass --warm-caches to measure cached behaviour instead.
+
+When the trained weights are not there (or with --random-weights) the app
+serves a randomly initialised MobileNetV3: same cost, meaningless labels.
+
+Reports throughput, latency p50 / p95 / p99, error count and the mean of
+each Server-Timing stage per endpoint and concurrency level, plus the
+server's peak RSS / PSS (web process and any inference workers). The JSON
+report can be compared against an earlier one with --baseline.
+
+USAGE:
+    python benchmarks/load_test.py
+    python benchmarks/load_test.py --concurrency 1,8,32 --requests 200 --json run.json
+    python benchmarks/load_test.py --baseline run.json --fail-on-regression 0.15
+    INFERENCE_WORKERS=2 python benchmarks/load_test.py --endpoints predict
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import requests
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+from bench_blur import synthetic_leaf
+from bench_worker_pool import memory_mb
+from llm_stub import start_stub_server
+
+from app.services.prediction import DISEASE_CLASSES, MODEL_WEIGHTS_PATH
+
+ENDPOINTS = ('predict', 'recommend', 'predict-and-recommend')
+BLURRY_SIGMA = 6.0
+
+
+# ==========================================================
+# SERVER
+# ==========================================================
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def server_pids(pid: int) -> list:
+    """The server process and its descendants (fork server, inference workers)."""
+    pids = [pid]
+    try:
+        for task in os.listdir(f'/proc/{pid}/task'):
+            with open(f'/proc/{pid}/task/{task}/children') as f:
+                for child in f.read().split():
+                    pids.extend(server_pids(int(child)))
+    except OSError:
+        pass
+    return pids
+
+
+def start_app(args, tmp, llm_base_url):
+    """Start run.py on a free port; returns (process, port, weights description)."""
+    weights = os.path.join(ROOT, MODEL_WEIGHTS_PATH) if not os.path.isabs(MODEL_WEIGHTS_PATH) else MODEL_WEIGHTS_PATH
+    weights_kind = 'trained'
+    if args.random_weights or not os.path.exists(weights):
+        import warnings
+
+        import torch
+        from app.services.prediction import _build_mobilenet
+
+        weights = os.path.join(tmp, 'random_mobilenetv3.pth')
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            torch.save(_build_mobilenet().state_dict(), weights)
+        weights_kind = 'random'
+
+    port = free_port()
+    env = dict(
+        os.environ,
+        HOST='127.0.0.1', PORT=str(port), DEBUG='false', WARMUP_ON_STARTUP='true',
+        PREDICT_WEIGHTS_PATH=weights, PYTHONWARNINGS='ignore',
+        LLM_PROVIDER_NAME='Groq', GROQ_API_KEY='stub', LLM_BASE_URL=llm_base_url,
+    )
+    if not args.warm_caches:
+        env.update(RECOMMENDATION_STORE_PATH=os.path.join(tmp, 'no-store.json.gz'), RECOMMENDATION_CACHE_TTL='0')
+    log = open(os.path.join(tmp, 'server.log'), 'w')
+    process = subprocess.Popen([sys.executable, os.path.join(ROOT, 'run.py')], cwd=ROOT, env=env,
+                               stdout=log, stderr=subprocess.STDOUT)
+
+    deadline = time.monotonic() + args.startup_timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"❌ App exited during startup; see {log.name}")
+        try:
+            if requests.get(f'http://127.0.0.1:{port}/api/health/ready', timeout=5).status_code == 200:
+                return process, port, weights_kind
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    process.terminate()
+    raise SystemExit(f"❌ App not ready after {args.startup_timeout}s; see {log.name}")
+
+
+class MemorySampler(threading.Thread):
+    """Peak RSS / PSS of the server processes, sampled in the background."""
+
+    def __init__(self, pid, interval=0.25):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.peak_rss = self.peak_pss = 0.0
+        self._stop_event = threading.Event()
+
+    def sample(self):
+        rss, pss = memory_mb(server_pids(self.pid))
+        self.peak_rss, self.peak_pss = max(self.peak_rss, rss), max(self.peak_pss, pss)
+        return rss, pss
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.sample()
+
+    def stop(self):
+        self._stop_event.set()
+
+
+# ==========================================================
+# CLIENT
+# ==========================================================
+def request(session, method, url, stream=False, **kwargs):
+    """
+    One request on a keep-alive session. Returns (status, body bytes,
+    response headers); with `stream`, also the time to the first body line.
+    """
+    with session.request(method, url, stream=stream, timeout=120, **kwargs) as response:
+        if stream:
+            first_line_at = None
+            lines = []
+            # chunk_size=None hands over each chunk as soon as it arrives
+            for line in response.iter_lines(chunk_size=None):
+                if first_line_at is None:
+                    first_line_at = time.perf_counter()
+                lines.append(line)
+            return response.status_code, b'\n'.join(lines), response.headers, first_line_at
+        return response.status_code, response.content, response.headers
+
+
+def parse_server_timing(value: str) -> dict:
+    stages = {}
+    for entry in (value or '').split(','):
+        name, _, params = entry.strip().partition(';')
+        if params.startswith('dur='):
+            stages[name] = float(params[4:])
+    return stages
+
+
+class Workload:
+    """Builds the request for each endpoint."""
+
+    def __init__(self, args):
+        rng = np.random.default_rng(args.seed)
+        self.photos = []
+        for i in range(args.images):
+            blurry = i < round(args.images * args.blurry_fraction)
+            self.photos.append(synthetic_leaf(rng, args.width, args.height, BLURRY_SIGMA if blurry else 0.0))
+        self.warm_caches = args.warm_caches
+        self.stream = args.stream
+        self._counter = iter(range(1 << 62))
+        self._lock = threading.Lock()
+
+    def _photo(self) -> bytes:
+        with self._lock:
+            i = next(self._counter)
+        photo = self.photos[i % len(self.photos)]
+        return photo if self.warm_caches else photo + os.urandom(8)
+
+    def build(self, endpoint):
+        """Returns (method, path, stream, keyword arguments for requests)."""
+        if endpoint == 'recommend':
+            body = {
+                'disease_name': random.choice(DISEASE_CLASSES),
+                'severity_level': random.randint(1, 4),  # level 5 never calls the LLM
+                'language_code': 'en',
+            }
+            return 'POST', '/api/recommend', False, {'json': body}
+        upload = {'data': {'language_code': 'en'}, 'files': {'image': ('leaf.jpg', self._photo(), 'image/jpeg')}}
+        if endpoint == 'predict':
+            return 'POST', '/api/predict', False, upload
+        path = '/api/predict-and-recommend' + ('?stream=1' if self.stream else '')
+        return 'POST', path, self.stream, upload
+
+
+def run_load(port, workload, endpoint, concurrency, total):
+    latencies, first_bytes, errors, stage_totals = [], [], [], {}
+    lock = threading.Lock()
+    counter = iter(range(total))
+
+    def client():
+        session = requests.Session()
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                break
+            method, path, stream, kwargs = workload.build(endpoint)
+            start = time.perf_counter()
+            try:
+                result = request(session, method, f'http://127.0.0.1:{port}{path}', stream, **kwargs)
+            except requests.RequestException as e:
+                with lock:
+                    errors.append(type(e).__name__)
+                continue
+            elapsed = (time.perf_counter() - start) * 1000
+            status, data, response_headers = result[:3]
+            ok = status == 200 and (not stream or b'"type": "error"' not in data)
+            with lock:
+                if not ok:
+                    errors.append(str(status))
+                latencies.append(elapsed)
+                if stream and result[3] is not None:
+                    first_bytes.append((result[3] - start) * 1000)
+                for stage, duration in parse_server_timing(response_headers.get('Server-Timing')).items():
+                    stage_totals.setdefault(stage, []).append(duration)
+        session.close()
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - start
+
+    entry = {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'throughput_rps': round(len(latencies) / wall, 2),
+    }
+    if latencies:
+        for p in (50, 95, 99):
+            entry[f'latency_p{p}_ms'] = round(float(np.percentile(latencies, p)), 1)
+    if first_bytes:
+        entry['first_line_p50_ms'] = round(float(np.percentile(first_bytes, 50)), 1)
+        entry['first_line_p95_ms'] = round(float(np.percentile(first_bytes, 95)), 1)
+    if errors:
+        entry['error_kinds'] = {kind: errors.count(kind) for kind in sorted(set(errors))}
+    entry['stages_mean_ms'] = {stage: round(float(np.mean(values)), 2) for stage, values in stage_totals.items()}
+    return entry
+
+
+# ==========================================================
+# BASELINE COMPARISON
+# ==========================================================
+def compare(report, baseline, max_regression=None):
+    """Print deltas against a baseline report; returns the regressions beyond `max_regression`."""
+    regressions = []
+    print(f"\nCompared with baseline ({baseline.get('created_at', '?')}):")
+    for level, endpoints in report['results'].items():
+        for endpoint, entry in endpoints.items():
+            old = baseline.get('results', {}).get(level, {}).get(endpoint)
+            if not old:
+                continue
+            deltas = []
+            for key, higher_is_better in (('throughput_rps', True), ('latency_p95_ms', False),
+                                          ('latency_p99_ms', False)):
+                if not old.get(key) or key not in entry:
+                    continue
+                change = (entry[key] - old[key]) / old[key]
+                deltas.append(f"{key} {old[key]} -> {entry[key]} ({change:+.1%})")
+                worse = -change if higher_is_better else change
+                if max_regression is not None and worse > max_regression:
+                    regressions.append(f"{level} {endpoint} {key} {change:+.1%}")
+            print(f"  {level:5s} {endpoint:22s} " + ", ".join(deltas))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end load test with a stub LLM")
+    parser.add_argument('--endpoints', default=','.join(ENDPOINTS))
+    parser.add_argument('--concurrency', default='1,8', help='Comma-separated client counts to sweep')
+    parser.add_argument('--requests', type=int, default=100, help='Requests per endpoint per concurrency level')
+    parser.add_argument('--warmup-requests', type=int, default=4)
+    parser.add_argument('--images', type=int, default=32, help='Distinct synthetic photos')
+    parser.add_argument('--blurry-fraction', type=float, default=0.25)
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=960)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--stream', action='store_true', help='Use the NDJSON stream for predict-and-recommend')
+    parser.add_argument('--warm-caches', action='store_true',
+                        help='Allow prediction cache / recommendation memo hits')
+    parser.add_argument('--random-weights', action='store_true', help='Serve an untrained model')
+    parser.add_argument('--llm-latency', type=float, default=0.3, help='Stub LLM seconds before answering')
+    parser.add_argument('--llm-token-delay', type=float, default=0.005)
+    parser.add_argument('--llm-fail-rate', type=float, default=0.0)
+    parser.add_argument('--startup-timeout', type=float, default=300)
+    parser.add_argument('--json', help='Write the report to this file')
+    parser.add_argument('--baseline', help='Earlier --json report to compare against')
+    parser.add_argument('--fail-on-regression', type=float,
+                        help='Exit 1 if throughput, p95 or p99 is worse than the baseline by this fraction')
+    args = parser.parse_args()
+
+    endpoints = [name for name in args.endpoints.split(',') if name]
+    unknown = set(endpoints) - set(ENDPOINTS)
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(sorted(unknown))}")
+    levels = [int(level) for level in args.concurrency.split(',') if level]
+
+    stub, llm_base_url = start_stub_server(latency=args.llm_latency, token_delay=args.llm_token_delay,
+                                           fail_rate=args.llm_fail_rate)
+    workload = Workload(args)
+    with tempfile.TemporaryDirectory() as tmp:
+        startup = time.perf_counter()
+        process, port, weights_kind = start_app(args, tmp, llm_base_url)
+        print(f"App ready on port {port} in {time.perf_counter() - startup:.1f}s ({weights_kind} weights)")
+        sampler = MemorySampler(process.pid)
+        idle_rss, idle_pss = sampler.sample()
+        sampler.start()
+        try:
+            results = {}
+            for level in levels:
+                results[f'c{level}'] = {}
+                for endpoint in endpoints:
+                    run_load(port, workload, endpoint, 1, args.warmup_requests)
+                    entry = run_load(port, workload, endpoint, level, args.requests)
+                    results[f'c{level}'][endpoint] = entry
+                    summary = "  ".join(f"{k}={v}" for k, v in entry.items()
+                                        if k not in ('stages_mean_ms', 'error_kinds'))
+                    print(f"c={level:<3d} {endpoint:22s} {summary}")
+                    if entry['stages_mean_ms']:
+                        print(" " * 28 + "stages: " + ", ".join(
+                            f"{stage}={ms}" for stage, ms in entry['stages_mean_ms'].items()))
+            end_rss, end_pss = sampler.sample()
+        finally:
+            sampler.stop()
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+            stub.shutdown()
+
+    report = {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'config': {key: value for key, value in vars(args).items() if key not in ('json', 'baseline')},
+        'environment': {
+            'python': platform.python_version(),
+            'cpu_count': os.cpu_count(),
+            'weights': weights_kind,
+            'predict_backend': os.getenv('PREDICT_BACKEND', 'default'),
+            'inference_workers': os.getenv('INFERENCE_WORKERS', '0'),
+        },
+        'server_memory_mb': {
+            'idle_rss': idle_rss, 'idle_pss': idle_pss,
+            'peak_rss': sampler.peak_rss, 'peak_pss': sampler.peak_pss,
+            'end_rss': end_rss, 'end_pss': end_pss,
+        },
+        'llm_stub': {'requests': stub.config.requests, 'failures': stub.config.failures,
+                     'max_in_flight': stub.config.max_in_flight},
+        'results': results,
+    }
+    print(f"\nServer memory (MB): " + ", ".join(f"{k}={v}" for k, v in report['server_memory_mb'].items()))
+    print(f"Stub LLM: {report['llm_stub']}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.json}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.fail_on_regression)
+        if regressions:
+            print("\n❌ Regressions beyond the allowed margin:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
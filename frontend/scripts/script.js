@@ -89,14 +89,14 @@ function clearImage() {
 /**
  * Validate image file
  */
-function validateImageFile(file) {
-  const maxSize = 10 * 1024 * 1024; // 10MB
+function validateImageFile(file, config = DEFAULT_UPLOAD_CONFIG) {
+  const maxSize = config.max_file_size;
 
   if (!file) {
     return { valid: false, error: "Please select an image file" };
   }
 
-  const allowedTypes = ["image/jpeg", "image/png"];
+  const allowedTypes = config.allowed_mime_types;
   if (!allowedTypes.includes(file.type)) {
     return { valid: false, error: "Only JPG and PNG files are supported" };
   }
@@ -108,6 +108,115 @@ function validateImageFile(file) {
   return { valid: true, error: null };
 }
 
+/* ============== CLIENT-SIDE RESIZING ============== */
+
+// Used when /api/config cannot be reached: upload the original file
+const DEFAULT_UPLOAD_CONFIG = {
+  max_file_size: 10 * 1024 * 1024, // 10MB
+  allowed_mime_types: ["image/jpeg", "image/png"],
+  resize: { enabled: false, max_side: 1024, jpeg_quality: 0.9 },
+};
+let uploadConfigPromise = null;
+
+/**
+ * Upload settings advertised by the server (fetched once per page)
+ */
+function getUploadConfig() {
+  if (!uploadConfigPromise) {
+    uploadConfigPromise = fetch("/api/config")
+      .then((response) => (response.ok ? response.json() : null))
+      .then((data) => (data && data.upload) || DEFAULT_UPLOAD_CONFIG)
+      .catch(() => DEFAULT_UPLOAD_CONFIG);
+  }
+  return uploadConfigPromise;
+}
+
+/**
+ * Downscale a photo so its longest side is at most resize.max_side and
+ * re-encode it as JPEG. The classifier only needs 224x224, so this cuts
+ * upload time on slow connections by an order of magnitude.
+ * Resolves to { blob, originalWidth, originalHeight }, or null when the
+ * original should be sent as-is (already small, resizing unavailable, or
+ * the re-encoded file would not be smaller).
+ */
+async function downscaleImage(file, resize) {
+  if (!resize || !resize.enabled || typeof createImageBitmap !== "function") {
+    return null;
+  }
+
+  // The server reads pixels as stored and ignores the EXIF orientation
+  // tag, so the downscaled copy must not be rotated either. Browsers that
+  // reject the option send the original instead.
+  let bitmap;
+  try {
+    bitmap = await createImageBitmap(file, { imageOrientation: "none" });
+  } catch (error) {
+    return null;
+  }
+
+  const originalWidth = bitmap.width;
+  const originalHeight = bitmap.height;
+  const scale = resize.max_side / Math.max(originalWidth, originalHeight);
+  if (scale >= 1) {
+    bitmap.close();
+    return null;
+  }
+
+  const canvas = document.createElement("canvas");
+  canvas.width = Math.round(originalWidth * scale);
+  canvas.height = Math.round(originalHeight * scale);
+  const context = canvas.getContext("2d");
+  context.imageSmoothingQuality = "high";
+  context.drawImage(bitmap, 0, 0, canvas.width, canvas.height);
+  bitmap.close();
+
+  const blob = await new Promise((resolve) =>
+    canvas.toBlob(resolve, "image/jpeg", resize.jpeg_quality)
+  );
+  if (!blob || blob.size >= file.size) {
+    return null;
+  }
+  return { blob, originalWidth, originalHeight };
+}
+
+// Upload behind the diagnosis on screen, re-sent if the heatmap is requested
+let lastUpload = null;
+
+/**
+ * Form data for the photo (downscaled when `resized` is given, with the
+ * original dimensions as form fields)
+ */
+function buildUploadForm(file, resized, languageCode) {
+  const formData = new FormData();
+  if (resized) {
+    const name = file.name.replace(/\.[^.]+$/, "") + ".jpg";
+    formData.append("image", resized.blob, name);
+    formData.append("original_width", resized.originalWidth);
+    formData.append("original_height", resized.originalHeight);
+    formData.append("original_size", file.size);
+  } else {
+    formData.append("image", file);
+  }
+  formData.append("language_code", languageCode);
+  return formData;
+}
+
+/**
+ * POST the photo to the streaming diagnosis endpoint
+ */
+function postForDiagnosis(file, resized, languageCode) {
+  lastUpload = { file, resized, languageCode };
+  const formData = buildUploadForm(file, resized, languageCode);
+
+  // Stream the result: the diagnosis arrives first, then the
+  // recommendation text as it is generated
+  return fetch("/api/predict-and-recommend?stream=1", {
+    method: "POST",
+    body: formData,
+    headers: { Accept: "application/x-ndjson" },
+  });
+}
+
 /* ============== FILE UPLOAD FORM HANDLING ============== */
 
 /**
@@ -116,9 +225,10 @@ function validateImageFile(file) {
 async function handleFileUpload() {
   const imageInput = document.getElementById("imageInput");
   const file = imageInput.files[0];
+  const config = await getUploadConfig();
 
   // Validate file
-  const validation = validateImageFile(file);
+  const validation = validateImageFile(file, config);
   if (!validation.valid) {
     showError(validation.error);
     return;
@@ -132,28 +242,30 @@ async function handleFileUpload() {
   showLoading();
 
   try {
-    // Create FormData
-    const formData = new FormData();
-    formData.append("image", file);
-    formData.append("language_code", languageCode);
+    const resized = await downscaleImage(file, config.resize);
+    let response = await postForDiagnosis(file, resized, languageCode);
+    if (response.status === 409 && resized) {
+      // Borderline blur score: the server needs the original to decide
+      response = await postForDiagnosis(file, null, languageCode);
+    }
 
-    // Make API call to predict-and-recommend endpoint
-    const response = await fetch("/api/predict-and-recommend", {
-      method: "POST",
-      body: formData,
-    });
+    const contentType = response.headers.get("Content-Type") || "";
+    if (!contentType.includes("application/x-ndjson")) {
+      // Validation errors (and servers without streaming) answer with plain JSON
+      const data = await response.json();
 
-    const data = await response.json();
+      if (!response.ok || !data.success) {
+        showError(data.error || "Upload failed. Please try again");
+        hideLoading();
+        return;
+      }
 
-    if (!response.ok || !data.success) {
-      showError(data.error || "Upload failed. Please try again");
+      displayResults(data);
       hideLoading();
       return;
     }
 
-    // Display results
-    displayResults(data);
-    hideLoading();
+    await readResultStream(response);
   } catch (error) {
     console.error("Upload error:", error);
     showError("Something went wrong. Please refresh and try again");
@@ -161,27 +273,128 @@ async function handleFileUpload() {
   }
 }
 
+/**
+ * Read the NDJSON stream from /api/predict-and-recommend?stream=1
+ */
+async function readResultStream(response) {
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffered = "";
+  let prediction = null;
+  let recommendationSoFar = "";
+
+  const handleEvent = (event) => {
+    if (event.type === "prediction") {
+      prediction = event.prediction;
+      displayPrediction(prediction);
+      hideLoading();
+    } else if (event.type === "gradcam") {
+      displayGradcam(event.gradcam_image);
+    } else if (event.type === "recommendation_token") {
+      recommendationSoFar += event.token;
+      renderRecommendationText(recommendationSoFar);
+    } else if (event.type === "recommendation") {
+      displayRecommendation(prediction, event.recommendation);
+    } else if (event.type === "error") {
+      if (prediction) {
+        renderRecommendationText(recommendationSoFar + "\n\n" + event.error);
+      } else {
+        showError(event.error || "Upload failed. Please try again");
+        hideLoading();
+      }
+    }
+  };
+
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffered += decoder.decode(value, { stream: true });
+
+    const lines = buffered.split("\n");
+    buffered = lines.pop();
+    lines.filter((line) => line.trim()).forEach((line) => handleEvent(JSON.parse(line)));
+  }
+  if (buffered.trim()) handleEvent(JSON.parse(buffered));
+}
+
 /* ============== RESULTS DISPLAY ============== */
 
 /**
  * Display prediction and recommendation results
  */
 function displayResults(data) {
+  displayPrediction(data.prediction);
+  displayRecommendation(data.prediction, data.recommendation);
+}
+
+/**
+ * Fetch the Grad-CAM heatmap for the diagnosis on screen. It costs the
+ * server a backward pass, so it is only requested from the "Show heatmap"
+ * button; the same upload is re-sent and its prediction comes from the cache.
+ */
+async function showHeatmap() {
+  const gradcamBtn = document.getElementById("gradcamBtn");
+  if (!lastUpload) return;
+  if (gradcamBtn) gradcamBtn.disabled = true;
+
+  try {
+    const { file, resized, languageCode } = lastUpload;
+    const response = await fetch("/api/predict?gradcam=1", {
+      method: "POST",
+      body: buildUploadForm(file, resized, languageCode),
+    });
+    const data = await response.json();
+    if (response.ok && data.success && data.gradcam_image) {
+      displayGradcam(data.gradcam_image);
+      return;
+    }
+  } catch (error) {
+    console.error("Heatmap error:", error);
+  }
+  if (gradcamBtn) {
+    gradcamBtn.disabled = false;
+    gradcamBtn.textContent = "Heatmap unavailable, try again";
+  }
+}
+
+/**
+ * Show the Grad-CAM overlay (a base64 JPEG), or hide it when there is none;
+ * the "Show heatmap" button is offered while it is hidden
+ */
+function displayGradcam(gradcamBase64) {
+  const gradcamImage = document.getElementById("gradcamImage");
+  const gradcamBtn = document.getElementById("gradcamBtn");
+  if (!gradcamImage) return;
+  if (gradcamBase64) {
+    gradcamImage.src = `data:image/jpeg;base64,${gradcamBase64}`;
+    gradcamImage.style.display = "block";
+  } else {
+    gradcamImage.removeAttribute("src");
+    gradcamImage.style.display = "none";
+  }
+  if (gradcamBtn) {
+    gradcamBtn.style.display = gradcamBase64 ? "none" : "inline-block";
+    gradcamBtn.disabled = false;
+    gradcamBtn.textContent = "Show heatmap";
+  }
+}
+
+/**
+ * Display the diagnosis and reveal the results container
+ */
+function displayPrediction(prediction) {
   const resultsContainer = document.getElementById("resultsContainer");
   const diseaseName = document.getElementById("diseaseName");
   const confidenceValue = document.getElementById("confidenceValue");
   const severityValue = document.getElementById("severityValue");
   const severityBar = document.getElementById("severityBar");
   const qualityValue = document.getElementById("qualityValue");
-  const gradcamImage = document.getElementById("gradcamImage");
-  const recommendationText = document.getElementById("recommendationText");
 
   // Hide form and show results
   const form = document.querySelector(".upload-form");
   if (form) form.style.display = "none";
 
   // Set disease information
-  const prediction = data.prediction;
   diseaseName.textContent = prediction.disease_name;
   confidenceValue.textContent = prediction.confidence.toFixed(2) + "%";
   severityValue.textContent = prediction.severity_level + "/5";
@@ -192,25 +405,45 @@ function displayResults(data) {
   // Display severity bar
   displaySeverityBar(prediction.severity_level, severityBar);
 
-  // Display Grad-CAM image
-  if (prediction.gradcam_image) {
-    gradcamImage.src = `data:image/png;base64,${prediction.gradcam_image}`;
-    gradcamImage.style.display = "block";
-  }
+  // Grad-CAM image, if the response carries one; otherwise offer the button
+  displayGradcam(prediction.gradcam_image);
 
-  // Format and display recommendation
-  const recommendation = data.recommendation.recommendation;
-  recommendationText.innerHTML = formatRecommendation(recommendation);
+  // Clear any previous recommendation while the new one streams in
+  renderRecommendationText("");
+
+  // Show results container
+  resultsContainer.style.display = "block";
+  resultsContainer.scrollIntoView({ behavior: "smooth" });
+}
+
+/**
+ * Display the final recommendation and keep the result for download
+ */
+function displayRecommendation(prediction, recommendation) {
+  renderRecommendationText(recommendation.recommendation);
 
   // Store result data for download
   window.lastResultData = {
     prediction: prediction,
-    recommendation: data.recommendation,
+    recommendation: recommendation,
   };
+}
 
-  // Show results container
-  resultsContainer.style.display = "block";
-  resultsContainer.scrollIntoView({ behavior: "smooth" });
+/**
+ * Render (possibly partial) recommendation text, at most once per frame
+ */
+let pendingRecommendationText = null;
+function renderRecommendationText(text) {
+  const recommendationText = document.getElementById("recommendationText");
+  if (!recommendationText) return;
+
+  if (pendingRecommendationText === null) {
+    requestAnimationFrame(() => {
+      recommendationText.innerHTML = formatRecommendation(pendingRecommendationText);
+      pendingRecommendationText = null;
+    });
+  }
+  pendingRecommendationText = text;
 }
 
 /**
@@ -462,3 +695,15 @@ function formatDate(date) {
     day: "numeric",
   });
 }
+
+/* ============== SERVICE WORKER ============== */
+
+// Precaches the fingerprinted stylesheets, scripts and small images so
+// repeat visits load them without touching the network
+if ("serviceWorker" in navigator) {
+  window.addEventListener("load", () => {
+    navigator.serviceWorker
+      .register("/static/sw.js", { scope: "/" })
+      .catch((error) => console.warn("Service worker registration failed:", error));
+  });
+}
@@ -0,0 +1,75 @@
+/* ============== CROPGUARD AI SERVICE WORKER ============== */
+// Precaches the fingerprinted assets listed in /assets/manifest.json and
+// serves /assets/* cache-first. Built file names change with their content,
+// so a cached copy never needs revalidating; a new manifest version
+// precaches the new files and drops the old cache.
+
+const MANIFEST_URL = "/assets/manifest.json";
+const ASSET_PREFIX = "/assets/";
+const CACHE_PREFIX = "cropguard-assets-";
+
+/**
+ * Fetch the manifest and make sure its precache list is in the cache for
+ * its version. Old versions are deleted once the new one is complete.
+ */
+async function precacheFromManifest() {
+  const response = await fetch(MANIFEST_URL, { cache: "no-cache" });
+  if (!response.ok) return;
+  const manifest = await response.json();
+  const cacheName = CACHE_PREFIX + manifest.version;
+
+  const cache = await caches.open(cacheName);
+  const cached = new Set((await cache.keys()).map((request) => new URL(request.url).pathname));
+  const missing = manifest.precache
+    .map((file) => ASSET_PREFIX + file)
+    .filter((path) => !cached.has(path));
+  await cache.addAll(missing);
+
+  const names = await caches.keys();
+  await Promise.all(
+    names
+      .filter((name) => name.startsWith(CACHE_PREFIX) && name !== cacheName)
+      .map((name) => caches.delete(name))
+  );
+}
+
+self.addEventListener("install", (event) => {
+  event.waitUntil(precacheFromManifest().then(() => self.skipWaiting()));
+});
+
+self.addEventListener("activate", (event) => {
+  event.waitUntil(self.clients.claim());
+});
+
+self.addEventListener("fetch", (event) => {
+  const url = new URL(event.request.url);
+  if (event.request.method !== "GET" || url.origin !== self.location.origin) return;
+
+  // Page loads pick up a new manifest after a deploy, in the background
+  if (event.request.mode === "navigate") {
+    event.waitUntil(precacheFromManifest().catch(() => {}));
+    return;
+  }
+
+  if (!url.pathname.startsWith(ASSET_PREFIX) || url.pathname === MANIFEST_URL) return;
+
+  event.respondWith(
+    caches.match(event.request).then(async (hit) => {
+      if (hit) return hit;
+      const response = await fetch(event.request);
+      // Only final versions: an image served while its resized copy is still
+      // being generated comes back with no-cache and is fetched again later
+      const cacheControl = response.headers.get("Cache-Control") || "";
+      if (response.ok && cacheControl.includes("immutable")) {
+        // Not in the precache list (e.g. a resized photo): keep it once fetched
+        const names = await caches.keys();
+        const current = names.filter((name) => name.startsWith(CACHE_PREFIX)).pop();
+        if (current) {
+          const cache = await caches.open(current);
+          cache.put(event.request, response.clone());
+        }
+      }
+      return response;
+    })
+  );
+});
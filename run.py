@@ -16,6 +16,9 @@ sys.path.insert(0, str(project_root))
 from dotenv import load_dotenv
 load_dotenv()
 
+# The development server is a single process: warm the models up at startup
+os.environ.setdefault('WARMUP_ON_STARTUP', 'true')
+
 # Import Flask app
 try:
     from app.main import app
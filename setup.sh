@@ -121,7 +121,13 @@ PYEOF
     print_status "Placeholder images created"
 fi
 
-# Step 7: Summary
+# Step 7: Build the fingerprinted frontend assets
+echo ""
+echo "Step 7: Building frontend assets..."
+python3 -m app.services.assets build || print_warning "Asset build failed; pages will link the /static files"
+print_status "Frontend assets built"
+
+# Step 8: Summary
 echo ""
 echo "=========================================="
 echo "Setup Complete!"
@@ -44,7 +44,8 @@ def run_standalone_test(input_path: str):
     # 3. Run Enhancement Pipeline
     start_time = time.time()
     # PASS force_run=True HERE to bypass the quality check logic entirely
-    enhanced_bytes = enhance_image(original_bytes, enhancer_model, force_run=True) 
+    enhance_stats = {}
+    enhanced_bytes = enhance_image(original_bytes, enhancer_model, force_run=True, stats=enhance_stats) 
     inference_time = time.time() - start_time
     
     # Determine output file path
@@ -67,6 +68,9 @@ def run_standalone_test(input_path: str):
     print(f"   -> Input Size: {input_size_kb:.2f} KB")
     print(f"   -> Output Size: {output_size_kb:.2f} KB")
     print(f"   -> Inference Time: {inference_time:.2f} seconds")
+    if enhance_stats.get('peak_rss_mb') is not None:
+        print(f"   -> Mode: {enhance_stats['mode']}, Peak RSS: {enhance_stats['peak_rss_mb']} MB "
+              f"(+{enhance_stats['peak_rss_delta_mb']} MB)")
     print("\n[Action] Open the output file and compare it visually with your original input.")
 
 
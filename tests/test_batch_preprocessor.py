@@ -0,0 +1,38 @@
+"""
+Regression tests: a BatchPreprocessor shared between threads must not let
+one caller overwrite the buffer another caller is still running inference
+on.
+"""
+
+import threading
+
+import numpy as np
+
+from app.services import prediction
+from app.services.imaging import BatchPreprocessor
+
+
+def _images(value: int, count: int = 2) -> list:
+    return [np.full((300, 400, 3), value, dtype=np.uint8) for _ in range(count)]
+
+
+def test_batch_keeps_buffer_reserved_until_exit():
+    engine = BatchPreprocessor(capacity=2)
+    other_done = threading.Event()
+
+    with engine.batch(_images(0)) as tensors:
+        expected = np.array(tensors)
+        other = threading.Thread(target=lambda: (engine(_images(255)), other_done.set()))
+        other.start()
+        assert not other_done.wait(0.2)
+        np.testing.assert_array_equal(np.array(tensors), expected)
+
+    other.join(timeout=5)
+    assert other_done.is_set()
+
+
+def test_shared_preprocess_batch_returns_a_copy():
+    first = prediction.preprocess_batch(_images(0))
+    snapshot = np.array(first)
+    prediction.preprocess_batch(_images(255))
+    np.testing.assert_array_equal(np.array(first), snapshot)
@@ -0,0 +1,65 @@
+"""
+Regression tests: an upload whose header parses but whose pixel data is
+damaged must be rejected with a 400, as undecodable uploads always were,
+even though pixels are only decoded when a stage first reads them.
+"""
+
+import io
+
+import numpy as np
+import pytest
+from flask import Flask
+from PIL import Image
+
+from app.api import endpoints
+from app.services.enhancer import check_image_quality
+from app.services.imaging import DecodedImage, InvalidImageError
+
+
+def _truncated_jpeg() -> bytes:
+    rng = np.random.default_rng(0)
+    pixels = rng.integers(0, 256, (480, 640, 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format="JPEG", quality=90)
+    data = buffer.getvalue()
+    return data[:len(data) // 2]
+
+
+@pytest.fixture
+def client(monkeypatch):
+    # The damaged upload is rejected before the model is ever run
+    monkeypatch.setattr(endpoints, "get_prediction_model", lambda: object())
+    app = Flask(__name__)
+    app.register_blueprint(endpoints.api_bp, url_prefix="/api")
+    return app.test_client()
+
+
+def test_truncated_jpeg_passes_header_check_but_not_decode():
+    image = DecodedImage.from_bytes(_truncated_jpeg())
+    assert image.format == "JPEG"
+    with pytest.raises(InvalidImageError):
+        image.rgb
+    with pytest.raises(InvalidImageError):
+        check_image_quality(image)
+
+
+@pytest.mark.parametrize("path", ["/api/predict", "/api/predict-and-recommend"])
+def test_truncated_jpeg_upload_is_rejected(client, path):
+    response = client.post(
+        path,
+        data={"image": (io.BytesIO(_truncated_jpeg()), "leaf.jpg", "image/jpeg")},
+        content_type="multipart/form-data",
+    )
+    assert response.status_code == 400
+    assert response.get_json() == {"success": False, "error": endpoints.INVALID_IMAGE_ERROR}
+
+
+def test_truncated_jpeg_in_batch_is_a_per_image_error(client):
+    response = client.post(
+        "/api/predict/batch",
+        data={"images": [(io.BytesIO(_truncated_jpeg()), "leaf.jpg", "image/jpeg")]},
+        content_type="multipart/form-data",
+    )
+    assert response.status_code == 200
+    result, = response.get_json()["results"]
+    assert result == {"filename": "leaf.jpg", "success": False, "error": endpoints.INVALID_IMAGE_ERROR}
@@ -0,0 +1,52 @@
+"""
+Parity of the ONNX Runtime backend with the eager PyTorch model it was
+exported from, on a randomly initialised MobileNetV3.
+"""
+
+import numpy as np
+import pytest
+
+pytest.importorskip("onnxruntime")
+pytest.importorskip("onnx")
+torch = pytest.importorskip("torch")
+
+from app.services.onnx_predictor import PARITY_ATOL, OnnxPredictor, check_parity, export_onnx
+from app.services.prediction import _build_mobilenet, load_mobilenet_model
+
+
+@pytest.fixture(scope="module")
+def exported(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("onnx")
+    weights_path = str(directory / "random_mobilenetv3.pth")
+    torch.manual_seed(0)
+    torch.save(_build_mobilenet().state_dict(), weights_path)
+    onnx_path = export_onnx(weights_path, str(directory / "random_mobilenetv3.onnx"))
+    return weights_path, onnx_path
+
+
+def test_onnx_logits_match_eager(exported):
+    weights_path, onnx_path = exported
+    model = load_mobilenet_model(weights_path, backend="eager").cpu()
+    predictor = OnnxPredictor(onnx_path)
+
+    # Batch sizes other than the export example exercise the dynamic axis
+    for batch_size in (1, 5):
+        inputs = torch.randn(batch_size, 3, 224, 224, generator=torch.Generator().manual_seed(batch_size))
+        with torch.no_grad():
+            expected = model(inputs).numpy()
+        actual = predictor(inputs.numpy())
+        assert actual.shape == expected.shape
+        np.testing.assert_allclose(actual, expected, atol=PARITY_ATOL, rtol=0)
+
+
+def test_onnx_backend_shares_weights_version(exported):
+    weights_path, onnx_path = exported
+    eager = load_mobilenet_model(weights_path, backend="eager")
+    assert OnnxPredictor(onnx_path).weights_version == f"{eager.weights_version}-onnx"
+
+
+def test_check_parity_reports_agreement(exported):
+    weights_path, onnx_path = exported
+    report = check_parity(weights_path, onnx_path, samples=4)
+    assert report["top1_agreement"] == 1.0
+    assert report["max_abs_logit_diff"] <= PARITY_ATOL